@@ -0,0 +1,71 @@
+"""
+Point d'entrée ASGI (Starlette) : le webhook met les updates en file sur la boucle du serveur,
+sans thread de boucle dédié ni saut entre threads par update
+/health et /metrics sont servis par la même application, comme avec wsgi.py
+
+Usage : uvicorn asgi:application --host 0.0.0.0 --port $PORT
+        gunicorn -c gunicorn_config.py -k uvicorn.workers.UvicornWorker asgi:application
+"""
+import contextlib
+
+try:
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, Response
+    from starlette.routing import Route
+except ImportError:
+    raise ImportError("starlette est requis pour le mode ASGI (pip install starlette uvicorn)")
+
+from main import logger, health_payload, accept_update, initialize_bot_async, shutdown_bot_async
+from metrics import REGISTRY
+
+
+async def health_check(request):
+    """Health check endpoint pour Render"""
+    return JSONResponse(health_payload())
+
+
+async def metrics(request):
+    """Métriques au format Prometheus"""
+    return Response(REGISTRY.render(), media_type='text/plain; version=0.0.4')
+
+
+async def webhook(request):
+    """Endpoint pour recevoir les webhooks de Telegram"""
+    try:
+        json_data = await request.json()
+
+        status, payload, headers = accept_update(json_data)
+        if payload is not None:
+            return JSONResponse(payload, status_code=status)
+        return Response(status_code=status, headers=headers)
+
+    except Exception as e:
+        logger.error(f"Erreur dans le webhook: {e}")
+        return Response(status_code=500)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Initialiser le bot au démarrage de chaque worker, sur sa boucle
+    if not await initialize_bot_async():
+        raise RuntimeError("Impossible d'initialiser le bot")
+    try:
+        yield
+    finally:
+        await shutdown_bot_async()
+
+
+# Point d'entrée pour uvicorn / Gunicorn (UvicornWorker)
+application = Starlette(
+    routes=[
+        Route('/health', health_check, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET']),
+        Route('/webhook', webhook, methods=['POST']),
+    ],
+    lifespan=lifespan
+)
+
+if __name__ == "__main__":
+    import uvicorn
+    from config import PORT
+    uvicorn.run(application, host='0.0.0.0', port=PORT)
@@ -0,0 +1,55 @@
+"""
+Micro-benchmark de la préparation du contexte LLM (get_context_for_llm) sur des résultats
+de recherche synthétiques : tri par pertinence, dédoublonnage, remplissage du budget de tokens
+
+Usage : python -m benchmarks.bench_context [--repeat N] [--baseline ref.json] [--save-baseline ref.json]
+"""
+import argparse
+import random
+import sys
+import timeit
+from typing import Dict, List
+from benchmarks.common import add_baseline_arguments, finish
+from benchmarks.fakes import FakeSupabase, build_knowledge
+
+
+def make_results(knowledge: List[Dict], count: int, seed: int = 3) -> List[Dict]:
+    """Résultats de recherche plausibles : scores décroissants, quelques quasi-doublons"""
+    rng = random.Random(seed)
+    results = []
+    for rank, row in enumerate(rng.sample(knowledge, count)):
+        result = {k: v for k, v in row.items() if k != 'embedding'}
+        result['keyword_score'] = 1.0 - rank / (count + 1)
+        results.append(result)
+    # Chunks qui se chevauchent (même texte à la ponctuation près)
+    for result in results[:count // 5]:
+        results.append(dict(result, id=result['id'] + 100000, text=result['text'] + " !"))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=200)
+    add_baseline_arguments(parser)
+    args = parser.parse_args()
+
+    import database
+    knowledge = build_knowledge()
+    database._client = FakeSupabase(knowledge)
+    from search_engine import SearchEngine
+    engine = SearchEngine()
+
+    print("== Préparation du contexte (get_context_for_llm) ==")
+    results: Dict[str, float] = {}
+    for count in (5, 20, 50):
+        search_results = make_results(knowledge, count)
+        context, tokens = engine.pack_context(search_results)
+        best = min(timeit.repeat(lambda: engine.get_context_for_llm(search_results), number=1, repeat=args.repeat))
+        results[f'get_context_for_llm_{count}_docs_us'] = best * 1e6
+        print(f"{len(search_results):>3} résultats -> {len(context):>6} caractères, {tokens:>5} tokens "
+              f"{best * 1e6:10.1f} µs/appel")
+    return finish(results, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
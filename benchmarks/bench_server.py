@@ -0,0 +1,283 @@
+"""
+Débit du webhook selon le serveur : Gunicorn en workers synchrones (gunicorn_config.py,
+boucle asyncio dans un thread à part) contre le point d'entrée ASGI (asgi.py sous uvicorn)
+
+Chaque serveur tourne dans un sous-processus avec les doublures de load_test (Supabase,
+Gemini, embeddings) ; le faux serveur Telegram tourne ici. Des clients HTTP envoient une
+rafale d'updates sur /webhook : on mesure l'acquittement du webhook puis la fin du
+traitement (sendMessage reçu par le faux Telegram), et le CPU consommé par le serveur
+
+Usage : python -m benchmarks.bench_server [--servers wsgi,asgi] [--updates 400] [--senders 32]
+                                          [--chats 64] [--update-workers N] [--llm-latency 0.05]
+                                          [--baseline ref.json] [--save-baseline ref.json]
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List
+from benchmarks import fake_telegram_server
+from benchmarks.common import percentile, add_baseline_arguments, finish
+from benchmarks.load_test import configure_environment, install_fakes, load_corpus, make_update
+
+SERVERS = ('wsgi', 'asgi')
+
+
+# ===== CÔTÉ SERVEUR (sous-processus) =====
+
+def _install_bot(args):
+    """Environnement et doublures de load_test, puis import de main"""
+    fake_args = argparse.Namespace(
+        streaming=False, cache=False, real_embeddings=False, gemini_server=False,
+        llm_latency=args.llm_latency, llm_jitter=args.llm_latency / 5, llm_ttft=0.0, embedding_latency=0.0
+    )
+    configure_environment(fake_args, args.telegram_port, 0)
+    from benchmarks.fakes import FakeSupabase, build_knowledge
+    supabase = FakeSupabase(build_knowledge(), latency=args.db_latency, jitter=args.db_latency / 5)
+    return install_fakes(fake_args, supabase)
+
+
+def serve_wsgi(args):
+    """Gunicorn avec les réglages de gunicorn_config.py (bot initialisé dans le worker)"""
+    from gunicorn.app.base import BaseApplication
+    import gunicorn_config
+
+    class BenchGunicorn(BaseApplication):
+        def load_config(self):
+            for key, value in vars(gunicorn_config).items():
+                if key in self.cfg.settings and value is not None:
+                    self.cfg.set(key, value)
+            self.cfg.set('bind', f"127.0.0.1:{args.port}")
+            self.cfg.set('accesslog', None)
+            self.cfg.set('loglevel', 'warning')
+
+        def load(self):
+            main_module = _install_bot(args)
+            if not main_module.initialize_bot():
+                raise RuntimeError("Impossible d'initialiser le bot")
+            return main_module.app
+
+    BenchGunicorn().run()
+
+
+def serve_asgi(args):
+    import uvicorn
+    _install_bot(args)
+    import asgi
+    uvicorn.run(asgi.application, host='127.0.0.1', port=args.port, log_level='warning', access_log=False)
+
+
+# ===== CÔTÉ CLIENT =====
+
+def wait_ready(port: int, process: subprocess.Popen, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Le serveur s'est arrêté (code {process.returncode})")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Serveur non disponible")
+
+
+def process_cpu_seconds(pid: int) -> float:
+    """CPU (utilisateur + système) du processus et de ses enfants directs (worker Gunicorn)"""
+    pids = [pid]
+    try:
+        for task in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{task}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    total = 0
+    for child in pids:
+        try:
+            with open(f'/proc/{child}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            total += int(fields[11]) + int(fields[12])
+        except (OSError, IndexError, ValueError):
+            continue
+    return total / os.sysconf('SC_CLK_TCK')
+
+
+class Burst:
+    """
+    Rafale de `updates` questions réparties sur `chats` chats : chaque chat appartient à un
+    seul client (les updates d'un chat partent dans l'ordre, une connexion HTTP par client)
+    """
+    def __init__(self, port: int, state, corpus: List[str], update_ids, first_chat: int, args):
+        self.port = port
+        self.state = state
+        self.corpus = corpus
+        self.update_ids = update_ids
+        self.chats = [first_chat + index for index in range(max(args.chats, args.senders))]
+        self.args = args
+        self.sent: Dict[int, List[float]] = {chat_id: [] for chat_id in self.chats}
+        self.acks: List[float] = []
+        self.shed = 0
+        self.last_ack = 0.0
+        self._lock = threading.Lock()
+
+    def run(self, updates: int) -> Dict[str, float]:
+        plan = [n % len(self.chats) for n in range(updates)]
+        threads = [
+            threading.Thread(
+                target=self._sender,
+                args=([self.chats[chat] for chat in plan if chat % self.args.senders == index],),
+                daemon=True
+            )
+            for index in range(self.args.senders)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        accepted = sum(len(times) for times in self.sent.values())
+        finished = self._wait_replies(accepted)
+
+        latencies = []
+        with self.state.lock:
+            for chat_id, times in self.sent.items():
+                replies = self.state.sent_at.get(chat_id, [])
+                latencies.extend(reply - sent for sent, reply in zip(times, replies))
+        completed = len(latencies)
+        return {
+            'updates_per_s': completed / (finished - started) if completed else 0.0,
+            'acks_per_s': (accepted + self.shed) / (self.last_ack - started) if self.last_ack else 0.0,
+            'ack_p50_ms': percentile(self.acks, 50) * 1000,
+            'ack_p99_ms': percentile(self.acks, 99) * 1000,
+            'latency_p50_ms': percentile(latencies, 50) * 1000,
+            'latency_p95_ms': percentile(latencies, 95) * 1000,
+            'completed': completed,
+            'shed': self.shed,
+        }
+
+    def _sender(self, chats: List[int]):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=self.args.timeout)
+        for chat_id in chats:
+            update_id = next(self.update_ids)
+            body = json.dumps(make_update(update_id, chat_id, self.corpus[update_id % len(self.corpus)]))
+            started = time.perf_counter()
+            try:
+                connection.request('POST', '/webhook', body, {'Content-Type': 'application/json'})
+                response = connection.getresponse()
+                payload = response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    connection.close()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                with self._lock:
+                    self.shed += 1
+                continue
+            acked = time.perf_counter()
+            with self._lock:
+                self.acks.append(acked - started)
+                self.last_ack = max(self.last_ack, acked)
+                # Délestage : 503 ou réponse "occupé" directement dans le webhook
+                if response.status != 200 or payload:
+                    self.shed += 1
+                else:
+                    self.sent[chat_id].append(started)
+        connection.close()
+
+    def _wait_replies(self, expected: int) -> float:
+        """Attend une réponse par update acceptée ; retourne l'instant de la dernière"""
+        deadline = time.monotonic() + self.args.timeout
+        while time.monotonic() < deadline:
+            with self.state.lock:
+                replies = [self.state.sent_at.get(chat_id, []) for chat_id in self.chats]
+            if sum(len(times) for times in replies) >= expected:
+                break
+            time.sleep(0.02)
+        return max((times[-1] for times in replies if times), default=time.perf_counter())
+
+
+def bench_server(kind: str, args, state, corpus: List[str], update_ids, first_chat: int) -> Dict[str, float]:
+    command = [
+        sys.executable, '-m', 'benchmarks.bench_server', '--serve', kind,
+        '--port', str(args.port), '--telegram-port', str(args.telegram_port),
+        '--llm-latency', str(args.llm_latency), '--db-latency', str(args.db_latency),
+    ]
+    env = dict(os.environ, UPDATE_QUEUE_MAX_DEPTH=str(args.queue_depth or args.updates + args.warmup))
+    if args.update_workers:
+        env['UPDATE_WORKERS'] = str(args.update_workers)
+    output = None if args.server_logs else subprocess.DEVNULL
+    process = subprocess.Popen(command, env=env, stdout=output, stderr=output)
+    try:
+        wait_ready(args.port, process)
+        if args.warmup:
+            Burst(args.port, state, corpus, update_ids, first_chat, args).run(args.warmup)
+        cpu_before = process_cpu_seconds(process.pid)
+        results = Burst(args.port, state, corpus, update_ids, first_chat + 100000, args).run(args.updates)
+        cpu = process_cpu_seconds(process.pid) - cpu_before
+        results['cpu_ms_per_update'] = cpu * 1000 / results['completed'] if results['completed'] else 0.0
+        return results
+    finally:
+        process.terminate()
+        try:
+            process.wait(30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Débit du webhook : Gunicorn synchrone contre ASGI")
+    parser.add_argument('--servers', default=','.join(SERVERS), help="Serveurs comparés (wsgi, asgi)")
+    parser.add_argument('--updates', type=int, default=400, help="Updates par rafale mesurée")
+    parser.add_argument('--warmup', type=int, default=40, help="Updates de chauffe (non mesurées)")
+    parser.add_argument('--senders', type=int, default=32, help="Clients HTTP simultanés")
+    parser.add_argument('--chats', type=int, default=64, help="Chats distincts (au moins un par client)")
+    parser.add_argument('--queue-depth', type=int, default=0, help="UPDATE_QUEUE_MAX_DEPTH (défaut : sans délestage)")
+    parser.add_argument('--update-workers', type=int, default=0, help="UPDATE_WORKERS (défaut : config.py)")
+    parser.add_argument('--timeout', type=float, default=120.0, help="Attente max des réponses (s)")
+    parser.add_argument('--llm-latency', type=float, default=0.05, help="Durée d'une réponse Gemini simulée (s)")
+    parser.add_argument('--db-latency', type=float, default=0.01, help="Aller-retour Supabase simulé (s)")
+    parser.add_argument('--telegram-latency', type=float, default=0.01, help="Aller-retour API Bot simulé (s)")
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--telegram-port', type=int, default=8088)
+    parser.add_argument('--server-logs', action='store_true', help="Affiche les logs des serveurs")
+    parser.add_argument('--serve', choices=SERVERS, help=argparse.SUPPRESS)
+    add_baseline_arguments(parser)
+    args = parser.parse_args()
+
+    if args.serve:
+        (serve_wsgi if args.serve == 'wsgi' else serve_asgi)(args)
+        return 0
+
+    telegram = fake_telegram_server.serve(args.telegram_port, args.telegram_latency, args.telegram_latency / 5)
+    corpus = load_corpus()
+    update_ids = itertools.count(1)
+    kinds = [kind.strip() for kind in args.servers.split(',') if kind.strip()]
+
+    measures = {}
+    for index, kind in enumerate(kinds):
+        print(f"== {kind} : {args.updates} updates, {args.senders} clients ==", flush=True)
+        measures[kind] = bench_server(kind, args, telegram.state, corpus, update_ids, 1000000 * (index + 1))
+
+    print(f"\n{'':<20}" + ''.join(f"{kind:>12}" for kind in kinds))
+    for name in ('updates_per_s', 'acks_per_s', 'ack_p50_ms', 'ack_p99_ms', 'latency_p50_ms',
+                 'latency_p95_ms', 'cpu_ms_per_update', 'completed', 'shed'):
+        print(f"{name:<20}" + ''.join(f"{measures[kind][name]:12.1f}" for kind in kinds))
+
+    results = {
+        f"{kind}_{name}": value
+        for kind, values in measures.items()
+        for name, value in values.items()
+        if name not in ('completed', 'shed')
+    }
+    return finish(results, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""
+Micro-benchmark du démarrage des index locaux : chargement depuis la table knowledge
+(Supabase simulé, une requête par page) contre ouverture de l'instantané mmap
+
+Usage : python -m benchmarks.bench_snapshot [--copies N] [--db-latency 0.05]
+                                            [--baseline ref.json] [--save-baseline ref.json]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import Dict
+from benchmarks.common import add_baseline_arguments, finish
+from benchmarks.fakes import FakeSupabase, build_knowledge
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--copies', type=int, default=10, help="Copies de la base synthétique (taille du corpus)")
+    parser.add_argument('--db-latency', type=float, default=0.05, help="Aller-retour Supabase simulé (s)")
+    parser.add_argument('--dtype', choices=('float16', 'int8'), default='float16')
+    add_baseline_arguments(parser)
+    args = parser.parse_args()
+
+    import database
+    base = build_knowledge()
+    knowledge = [dict(row, id=row['id'] + copy * len(base)) for copy in range(args.copies) for row in base]
+    database._client = FakeSupabase(knowledge, latency=args.db_latency)
+    db = database.Database()
+    from keyword_index import KeywordIndex
+    from knowledge_snapshot import export, open_snapshot
+    from vector_index import VectorIndex
+
+    path = os.path.join(tempfile.mkdtemp(prefix='bench-snapshot-'), 'knowledge.snapshot')
+    export(db, path, args.dtype)
+    size_mb = os.path.getsize(path) / 1024 / 1024
+
+    print(f"== Démarrage des index ({len(knowledge)} documents, instantané {args.dtype} de {size_mb:.1f} Mo) ==")
+    results: Dict[str, float] = {}
+
+    started = time.perf_counter()
+    VectorIndex().load(db)
+    KeywordIndex().load(db)
+    results['load_from_table_ms'] = (time.perf_counter() - started) * 1000
+
+    for label, validate in (('load_from_snapshot_ms', False), ('load_from_snapshot_validated_ms', True)):
+        started = time.perf_counter()
+        snapshot = open_snapshot(path, db if validate else None)
+        VectorIndex().load_snapshot(snapshot)
+        KeywordIndex().load_snapshot(snapshot)
+        results[label] = (time.perf_counter() - started) * 1000
+
+    for name, value in results.items():
+        print(f"{name:<34} {value:10.1f} ms")
+    return finish(results, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
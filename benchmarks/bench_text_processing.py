@@ -0,0 +1,139 @@
+"""
+Micro-benchmarks du traitement de texte : détection des candidats, extraction des mots-clés
+
+Usage : python -m benchmarks.bench_text_processing [--repeat N] [--baseline ref.json] [--save-baseline ref.json]
+"""
+import argparse
+import os
+import sys
+import time
+import timeit
+from typing import Dict, List, Optional
+from benchmarks.common import add_baseline_arguments, finish
+from intent_router import IntentRouter
+from text_processing import (
+    CANDIDATES, extract_candidate_mentions, extract_all_candidate_mentions,
+    extract_keywords, load_nltk_resources
+)
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'questions.txt')
+
+# Ancienne implémentation (boucle de sous-chaînes + table alias -> nom), gardée comme référence
+_LEGACY_NAMES = {
+    "seta": "Seta Caxton Ateki", "caxton": "Seta Caxton Ateki", "ateki": "Seta Caxton Ateki",
+    "bello": "Bello Bouba Maigari", "bouba": "Bello Bouba Maigari", "maigari": "Bello Bouba Maigari",
+    "paul": "Paul Biya", "biya": "Paul Biya",
+    "jacques": "Jacques Bouhga-Hagbe", "bouhga": "Jacques Bouhga-Hagbe", "hagbe": "Jacques Bouhga-Hagbe",
+    "issa": "Issa Tchiroma Bakary", "tchiroma": "Issa Tchiroma Bakary", "bakary": "Issa Tchiroma Bakary",
+    "hiram": "Hiram Samuel Iyodi", "samuel": "Hiram Samuel Iyodi", "iyodi": "Hiram Samuel Iyodi",
+    "pierre": "Pierre Kwemo", "kwemo": "Pierre Kwemo",
+    "cabral": "Cabral Libii", "libii": "Cabral Libii",
+    "serge": "Serge Espoir Matomba", "espoir": "Serge Espoir Matomba", "matomba": "Serge Espoir Matomba",
+    "akere": "Akere Muna", "muna": "Akere Muna",
+    "joshua": "Joshua Osih", "osih": "Joshua Osih",
+    "hermine": "Hermine Patricia Tomaïno Ndam Njoya", "patricia": "Hermine Patricia Tomaïno Ndam Njoya",
+    "tomaino": "Hermine Patricia Tomaïno Ndam Njoya", "ndam": "Hermine Patricia Tomaïno Ndam Njoya",
+    "njoya": "Hermine Patricia Tomaïno Ndam Njoya",
+}
+
+
+def legacy_extract_candidate_mentions(text: str) -> Optional[str]:
+    text_lower = text.lower()
+    for candidate in CANDIDATES:
+        if candidate in text_lower:
+            return _LEGACY_NAMES[candidate]
+    return None
+
+
+def load_corpus() -> List[str]:
+    with open(CORPUS_PATH, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def bench(label: str, func, corpus: List[str], repeat: int) -> float:
+    """Durée moyenne par message, en µs (meilleure des répétitions)"""
+    total = min(timeit.repeat(lambda: [func(q) for q in corpus], number=1, repeat=repeat))
+    per_message = total / len(corpus) * 1e6
+    print(f"{label:<40} {per_message:8.2f} µs/message")
+    return per_message
+
+
+def bench_candidates(corpus: List[str], repeat: int, results: Dict[str, float]):
+    print("== Détection des candidats ==")
+    bench("legacy (sous-chaînes, 1er candidat)", legacy_extract_candidate_mentions, corpus, repeat)
+    results['extract_candidate_mentions_us'] = bench(
+        "extract_candidate_mentions", extract_candidate_mentions, corpus, repeat
+    )
+    results['extract_all_candidate_mentions_us'] = bench(
+        "extract_all_candidate_mentions", extract_all_candidate_mentions, corpus, repeat
+    )
+
+    multi = sum(1 for q in corpus if len(extract_all_candidate_mentions(q)) > 1)
+    differences = [
+        (q, legacy_extract_candidate_mentions(q), extract_all_candidate_mentions(q))
+        for q in corpus
+        if legacy_extract_candidate_mentions(q) != extract_candidate_mentions(q)
+    ]
+    print(f"\nQuestions multi-candidats détectées: {multi}")
+    print(f"Détections divergentes avec l'ancienne implémentation: {len(differences)}")
+    for question, old, new in differences:
+        print(f"  - {question!r}: {old} -> {new}")
+
+
+def bench_keywords(corpus: List[str], repeat: int, results: Dict[str, float]):
+    print("== Extraction des mots-clés ==")
+    results['extract_keywords_fast_us'] = bench(
+        "extract_keywords (fast)", lambda q: extract_keywords(q, tokenizer='fast'), corpus, repeat
+    )
+
+    started = time.perf_counter()
+    try:
+        load_nltk_resources()
+    except (ImportError, LookupError) as e:
+        print(f"extract_keywords (nltk)                  indisponible ({e})")
+        return
+    print(f"Chargement NLTK (import + ressources)    {(time.perf_counter() - started) * 1000:8.1f} ms")
+    results['extract_keywords_nltk_us'] = bench(
+        "extract_keywords (nltk)", lambda q: extract_keywords(q, tokenizer='nltk'), corpus, repeat
+    )
+
+    print("\nExemples:")
+    for question in corpus[:5]:
+        print(f"  {question}")
+        print(f"    nltk: {extract_keywords(question, tokenizer='nltk')}")
+        print(f"    fast: {extract_keywords(question, tokenizer='fast')}")
+
+
+def bench_intents(corpus: List[str], repeat: int, results: Dict[str, float]):
+    print("== Routage des intentions ==")
+    results['intent_route_us'] = bench("IntentRouter.route", IntentRouter().route, corpus, repeat)
+
+    router = IntentRouter()
+    routed = [(question, router.route(question)) for question in corpus]
+    stats = router.stats()
+    print(f"Chemin rapide: {stats['fast_path']}/{stats['routed']} messages ({stats['hit_rate']:.0%})")
+    for question, match in routed:
+        if match:
+            print(f"  {match[0]:<16} {question}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=200)
+    add_baseline_arguments(parser)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    print(f"Corpus: {len(corpus)} messages\n")
+
+    results: Dict[str, float] = {}
+    bench_candidates(corpus, args.repeat, results)
+    print()
+    bench_keywords(corpus, args.repeat, results)
+    print()
+    bench_intents(corpus, args.repeat, results)
+    return finish(results, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
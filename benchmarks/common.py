@@ -0,0 +1,75 @@
+"""
+Outils communs aux benchmarks : percentiles, mémoire, comparaison avec une référence enregistrée
+"""
+import json
+import os
+import resource
+from typing import Dict, List
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Percentile par interpolation linéaire (q entre 0 et 100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def peak_rss_mb() -> float:
+    """Pic de mémoire résidente du processus (Linux : ru_maxrss en Ko)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb() -> float:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def save_baseline(results: Dict[str, float], path: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"Référence enregistrée dans {path}")
+
+
+def check_baseline(results: Dict[str, float], path: str, tolerance: float) -> bool:
+    """
+    Compare aux valeurs de référence (plus petit = meilleur, sauf les clés *_per_s)
+    Retourne False si une mesure régresse de plus de `tolerance` (0.2 = 20 %)
+    """
+    with open(path, encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    ok = True
+    print(f"\n== Comparaison avec {path} (tolérance {tolerance:.0%}) ==")
+    for name, reference in sorted(baseline.items()):
+        if name not in results or not reference:
+            continue
+        value = results[name]
+        higher_is_better = name.endswith('_per_s')
+        change = (reference - value) / reference if higher_is_better else (value - reference) / reference
+        regressed = change > tolerance
+        ok = ok and not regressed
+        status = "RÉGRESSION" if regressed else "ok"
+        print(f"{name:<45} {reference:12.3f} -> {value:12.3f} ({change:+.1%}) {status}")
+    return ok
+
+
+def add_baseline_arguments(parser):
+    parser.add_argument('--baseline', help="Fichier JSON de référence : code de sortie 1 en cas de régression")
+    parser.add_argument('--save-baseline', help="Enregistre les mesures comme nouvelle référence")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Régression tolérée (0.2 = 20 %%)")
+
+
+def finish(results: Dict[str, float], args) -> int:
+    """Enregistre et/ou compare les résultats ; retourne le code de sortie"""
+    if args.save_baseline:
+        save_baseline(results, args.save_baseline)
+    if args.baseline and not check_baseline(results, args.baseline, args.tolerance):
+        return 1
+    return 0
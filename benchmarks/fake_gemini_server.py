@@ -0,0 +1,168 @@
+"""
+Faux serveur Gemini (API REST v1beta) pour tester le client sans quota ni réseau :
+latence configurable, erreurs 429/503 injectées, streaming SSE, comptage de tokens
+
+Usage : python -m benchmarks.fake_gemini_server [--port 8089] [--latency 0.8] [--error-rate 0.1]
+Puis lancer le bot avec GEMINI_API_ENDPOINT=http://localhost:8089
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+_PATH_RE = re.compile(r'^/v1beta/(?:models|tunedModels)/[^/:]+:(generateContent|streamGenerateContent|countTokens)$')
+
+FAKE_ANSWER = (
+    "D'après les documents disponibles, le candidat présente plusieurs mesures sur ce sujet. "
+    "Je te conseille de consulter les sources citées pour le détail complet du programme."
+)
+
+
+def _count_tokens(payload: Dict) -> int:
+    """Approximation : un token pour ~4 caractères de texte"""
+    chars = 0
+    for content in payload.get('contents', []) + [payload.get('systemInstruction') or {}]:
+        for part in content.get('parts', []):
+            chars += len(part.get('text', ''))
+    return max(1, chars // 4)
+
+
+class FakeGeminiState:
+    """Paramètres et compteurs partagés entre les threads du serveur"""
+
+    def __init__(self, latency: float, jitter: float, error_rate: float, slow_rate: float, slow_latency: float):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def next_delay(self) -> float:
+        if random.random() < self.slow_rate:
+            return self.slow_latency
+        return max(0.0, random.gauss(self.latency, self.jitter))
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            failed = random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return failed
+
+
+def make_handler(state: FakeGeminiState):
+    class FakeGeminiHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            path = self.path.split('?', 1)[0]
+            match = _PATH_RE.match(path)
+            length = int(self.headers.get('Content-Length') or 0)
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            if not match:
+                self._send_json(404, {'error': {'code': 404, 'message': f'Unknown path {path}', 'status': 'NOT_FOUND'}})
+                return
+
+            method = match.group(1)
+            prompt_tokens = _count_tokens(payload)
+            if method == 'countTokens':
+                self._send_json(200, {'totalTokens': prompt_tokens})
+                return
+
+            if state.should_fail():
+                code, status = random.choice([(429, 'RESOURCE_EXHAUSTED'), (503, 'UNAVAILABLE')])
+                self._send_json(code, {'error': {'code': code, 'message': 'fake overload', 'status': status}})
+                return
+
+            delay = state.next_delay()
+            if method == 'generateContent':
+                time.sleep(delay)
+                self._send_json(200, self._response(FAKE_ANSWER, prompt_tokens))
+            else:
+                self._stream(delay, prompt_tokens)
+
+        def _response(self, text: str, prompt_tokens: Optional[int]) -> Dict:
+            candidate = {'content': {'role': 'model', 'parts': [{'text': text}]}, 'index': 0}
+            body = {'candidates': [candidate]}
+            # Seul le dernier fragment porte la raison de fin et l'usage
+            if prompt_tokens is not None:
+                candidate['finishReason'] = 'STOP'
+                output_tokens = max(1, len(FAKE_ANSWER) // 4)
+                body['usageMetadata'] = {
+                    'promptTokenCount': prompt_tokens,
+                    'candidatesTokenCount': output_tokens,
+                    'totalTokenCount': prompt_tokens + output_tokens,
+                }
+            return body
+
+        def _stream(self, delay: float, prompt_tokens: int):
+            """Réponse SSE (alt=sse) : le délai est réparti entre les fragments"""
+            words = FAKE_ANSWER.split(' ')
+            chunks = [' '.join(words[i:i + 6]) + ' ' for i in range(0, len(words), 6)]
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            for index, chunk in enumerate(chunks):
+                time.sleep(delay / len(chunks))
+                last = index == len(chunks) - 1
+                event = self._response(chunk, prompt_tokens if last else None)
+                self.wfile.write(f"data: {json.dumps(event)}\r\n\r\n".encode('utf-8'))
+                self.wfile.flush()
+            self.close_connection = True
+
+        def _send_json(self, code: int, body: Dict):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return FakeGeminiHandler
+
+
+def serve(port: int = 8089, latency: float = 0.8, jitter: float = 0.2, error_rate: float = 0.0,
+          slow_rate: float = 0.0, slow_latency: float = 5.0) -> ThreadingHTTPServer:
+    """Démarre le serveur dans un thread et le retourne (server.shutdown() pour l'arrêter)"""
+    state = FakeGeminiState(latency, jitter, error_rate, slow_rate, slow_latency)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, name='fake-gemini', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Faux serveur Gemini pour les tests de charge")
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.8, help="Latence moyenne (s)")
+    parser.add_argument('--jitter', type=float, default=0.2, help="Écart-type de la latence (s)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Part de réponses 429/503")
+    parser.add_argument('--slow-rate', type=float, default=0.0, help="Part de réponses très lentes (queue de latence)")
+    parser.add_argument('--slow-latency', type=float, default=5.0)
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.jitter, args.error_rate, args.slow_rate, args.slow_latency)
+    print(f"Faux serveur Gemini sur http://127.0.0.1:{args.port} (Ctrl+C pour arrêter)")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"requêtes={server.state.requests} erreurs={server.state.errors}")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Faux serveur de l'API Bot Telegram : répond aux méthodes utilisées par le bot
+(getMe, sendMessage, editMessageText, sendChatAction, setWebhook, getWebhookInfo)
+avec une latence configurable, et compte les messages envoyés
+
+Le bot l'utilise via TELEGRAM_API_URL=http://127.0.0.1:<port>
+"""
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs
+
+BOT_USER = {
+    'id': 1000000001, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_election_bot',
+    'can_join_groups': False, 'can_read_all_group_messages': False, 'supports_inline_queries': False,
+}
+
+
+class FakeTelegramState:
+    def __init__(self, latency: float, jitter: float):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls: Dict[str, int] = {}
+        self.replies: Dict[int, str] = {}   # chat_id -> dernier texte envoyé ou édité
+        self.sent_at: Dict[int, List[float]] = {}   # chat_id -> instants (perf_counter) des sendMessage
+        self.webhook_url = ''
+        self.message_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def delay(self):
+        if self.latency:
+            time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+
+def _parse_params(handler: BaseHTTPRequestHandler) -> Dict:
+    length = int(handler.headers.get('Content-Length') or 0)
+    body = handler.rfile.read(length) if length else b''
+    content_type = handler.headers.get('Content-Type', '')
+    if not body:
+        return {}
+    if 'application/json' in content_type:
+        return json.loads(body)
+    # python-telegram-bot envoie les paramètres en formulaire, valeurs complexes encodées en JSON
+    params = {}
+    for key, values in parse_qs(body.decode('utf-8')).items():
+        value = values[-1]
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+def make_handler(state: FakeTelegramState):
+    class FakeTelegramHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            self.do_POST()
+
+        def do_POST(self):
+            method = self.path.split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1]
+            params = _parse_params(self)
+            with state.lock:
+                state.calls[method] = state.calls.get(method, 0) + 1
+            state.delay()
+
+            result = self._dispatch(method, params)
+            if result is None:
+                self._send(404, {'ok': False, 'error_code': 404, 'description': 'Not Found: method not found'})
+            else:
+                self._send(200, {'ok': True, 'result': result})
+
+        def _dispatch(self, method: str, params: Dict):
+            if method == 'getMe':
+                return BOT_USER
+            if method in ('sendChatAction', 'deleteWebhook'):
+                return True
+            if method == 'setWebhook':
+                state.webhook_url = params.get('url', '')
+                return True
+            if method == 'getWebhookInfo':
+                return {'url': state.webhook_url, 'has_custom_certificate': False, 'pending_update_count': 0}
+            if method in ('sendMessage', 'editMessageText'):
+                chat_id = int(params.get('chat_id', 0))
+                text = params.get('text', '')
+                with state.lock:
+                    state.replies[chat_id] = text
+                    if method == 'sendMessage':
+                        state.sent_at.setdefault(chat_id, []).append(time.perf_counter())
+                    message_id = params.get('message_id') or next(state.message_ids)
+                return {
+                    'message_id': int(message_id),
+                    'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'},
+                    'from': BOT_USER,
+                    'text': text,
+                }
+            return None
+
+        def _send(self, code: int, body: Dict):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return FakeTelegramHandler
+
+
+def serve(port: int = 8088, latency: float = 0.05, jitter: float = 0.01) -> ThreadingHTTPServer:
+    """Démarre le serveur dans un thread et le retourne (server.state pour les compteurs)"""
+    state = FakeTelegramState(latency, jitter)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, name='fake-telegram', daemon=True).start()
+    return server
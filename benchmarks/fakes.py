@@ -0,0 +1,328 @@
+"""
+Doublures locales pour les benchmarks : base Supabase en mémoire (knowledge + conversations),
+backend d'embedding déterministe, client Gemini à latence configurable
+
+La fausse base remplace le client Supabase (et non la classe Database) : le cache d'historique,
+l'écriture différée et les index locaux sont exercés comme en production
+"""
+import hashlib
+import itertools
+import math
+import random
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+import numpy as np
+from text_processing import CANDIDATE_ALIASES, fold_accents, generate_document_keywords
+
+EMBEDDING_DIMENSION = 384
+
+_WORD_RE = re.compile(r"[^\W\d_]{3,}")
+
+TOPICS = {
+    "Éducation": [
+        "propose la gratuité de l'école primaire et la construction de nouvelles salles de classe",
+        "veut recruter des enseignants et revaloriser leur salaire dans les zones rurales",
+        "prévoit des bourses pour les étudiants et la création d'universités régionales",
+    ],
+    "Santé": [
+        "promet une couverture santé universelle et la modernisation des hôpitaux de district",
+        "veut former davantage de médecins et d'infirmiers et lutter contre le paludisme",
+        "propose la gratuité des soins pour les enfants de moins de cinq ans",
+    ],
+    "Emploi des jeunes": [
+        "annonce un fonds d'investissement pour l'entrepreneuriat des jeunes",
+        "veut développer la formation professionnelle et l'apprentissage",
+        "propose des incitations fiscales aux entreprises qui embauchent des jeunes diplômés",
+    ],
+    "Corruption": [
+        "prévoit une autorité indépendante de lutte contre la corruption",
+        "veut imposer la déclaration de patrimoine à tous les responsables publics",
+        "propose la transparence des marchés publics et la publication des contrats",
+    ],
+    "Agriculture": [
+        "veut moderniser l'agriculture et faciliter l'accès des paysans au crédit",
+        "propose la construction de routes rurales et d'entrepôts de stockage",
+        "prévoit des subventions aux engrais et aux semences améliorées",
+    ],
+    "Sécurité": [
+        "promet le retour de la paix dans les régions anglophones par le dialogue",
+        "veut renforcer les effectifs de la police et de la gendarmerie",
+        "propose un plan de réinsertion des ex-combattants",
+    ],
+    "Décentralisation": [
+        "veut transférer davantage de compétences et de budget aux communes",
+        "propose l'élection des gouverneurs de région",
+        "prévoit un statut spécial renforcé pour les régions du Nord-Ouest et du Sud-Ouest",
+    ],
+    "Procédures électorales": [
+        "rappelle que le vote a lieu dans le bureau où l'électeur est inscrit, muni de sa carte",
+        "explique que le dépouillement est public et que les résultats sont affichés dans chaque bureau",
+        "souligne que l'inscription sur les listes électorales est obligatoire pour voter",
+    ],
+}
+
+
+class FakeEmbeddingBackend:
+    """
+    Embeddings déterministes sans modèle : sac de mots haché et normalisé
+    Deux textes partageant des mots ont une similarité cosinus positive
+    """
+
+    def __init__(self, dimension: int = EMBEDDING_DIMENSION, latency: float = 0.0):
+        self.dimension = dimension
+        self.latency = latency
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in _WORD_RE.findall(fold_accents(text)):
+            digest = hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], 'little') % self.dimension
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if self.latency:
+            time.sleep(self.latency)
+        return np.stack([self._vector(text) for text in texts])
+
+
+def build_knowledge(documents_per_topic: int = 3, seed: int = 7) -> List[Dict]:
+    """Base de connaissances synthétique : chaque candidat x chaque thème"""
+    rng = random.Random(seed)
+    backend = FakeEmbeddingBackend()
+    rows = []
+    ids = itertools.count(1)
+    for candidate in CANDIDATE_ALIASES:
+        slug = fold_accents(candidate).replace(' ', '-')
+        for section, measures in TOPICS.items():
+            for measure in rng.sample(measures, min(documents_per_topic, len(measures))):
+                text = (
+                    f"{candidate} {measure}. "
+                    f"Dans son programme, le candidat détaille le calendrier et le financement de cette mesure "
+                    f"({section.lower()}), présentée lors de ses meetings de campagne."
+                )
+                rows.append({
+                    'id': next(ids),
+                    'candidate': candidate,
+                    'section': section,
+                    'source_link': f"https://example.org/programmes/{slug}#{fold_accents(section).replace(' ', '-')}",
+                    'text': text,
+                    'keywords': generate_document_keywords(text),
+                    'embedding': backend.encode([text])[0].tolist(),
+                })
+    return rows
+
+
+# ===== FAUX CLIENT SUPABASE =====
+
+class FakeResult:
+    def __init__(self, data, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class FakeQuery:
+    """Sous-ensemble du query builder postgrest utilisé par Database"""
+
+    def __init__(self, store: 'FakeSupabase', table: str):
+        self.store = store
+        self.table = table
+        self.columns: Optional[List[str]] = None
+        self.filters = []
+        self.order_by = None
+        self.limit_count: Optional[int] = None
+        self.count_mode = None
+        self.single_row = False
+        self.action = 'select'
+        self.payload = None
+
+    def select(self, columns: str = '*', count: Optional[str] = None):
+        if columns.strip() != '*':
+            self.columns = [c.strip() for c in columns.split(',')]
+        self.count_mode = count
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self
+
+    def overlaps(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: bool(values & set(row.get(column) or ())))
+        return self
+
+    def order(self, column, desc: bool = False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, count: int):
+        self.limit_count = count
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    def insert(self, data):
+        self.action = 'insert'
+        self.payload = data if isinstance(data, list) else [data]
+        return self
+
+    def delete(self):
+        self.action = 'delete'
+        return self
+
+    def execute(self) -> FakeResult:
+        self.store.network_delay()
+        with self.store.lock:
+            rows = self.store.tables.setdefault(self.table, [])
+            if self.action == 'insert':
+                inserted = []
+                for row in self.payload:
+                    row = dict(row, id=next(self.store.ids))
+                    rows.append(row)
+                    inserted.append(row)
+                return FakeResult(inserted)
+            if self.action == 'delete':
+                kept = [row for row in rows if not all(f(row) for f in self.filters)]
+                deleted = len(rows) - len(kept)
+                self.store.tables[self.table] = kept
+                return FakeResult([], deleted)
+
+            selected = [row for row in rows if all(f(row) for f in self.filters)]
+        count = len(selected) if self.count_mode else None
+        if self.order_by:
+            column, desc = self.order_by
+            selected.sort(key=lambda row: row.get(column) or 0, reverse=desc)
+        if self.limit_count is not None:
+            selected = selected[:self.limit_count]
+        if self.columns:
+            selected = [{c: row.get(c) for c in self.columns} for row in selected]
+        else:
+            selected = [dict(row) for row in selected]
+        if self.single_row:
+            return FakeResult(selected[0] if selected else None, count)
+        return FakeResult(selected, count)
+
+
+class FakeRPC:
+    def __init__(self, store: 'FakeSupabase', name: str, params: Dict):
+        self.store = store
+        self.name = name
+        self.params = params
+
+    def execute(self) -> FakeResult:
+        if self.name != 'match_documents':
+            raise ValueError(f"RPC inconnue: {self.name}")
+        self.store.network_delay()
+        query = np.asarray(self.params['query_embedding'], dtype=np.float32)
+        candidate = self.params.get('candidate_filter')
+        with self.store.lock:
+            rows = [row for row in self.store.tables.get('knowledge', [])
+                    if candidate is None or row['candidate'] == candidate]
+        matches = []
+        for row in rows:
+            similarity = float(np.dot(query, np.asarray(row['embedding'], dtype=np.float32)))
+            if similarity > self.params['match_threshold']:
+                match = {k: v for k, v in row.items() if k != 'embedding'}
+                match['similarity'] = similarity
+                matches.append(match)
+        matches.sort(key=lambda match: match['similarity'], reverse=True)
+        return FakeResult(matches[:self.params['match_count']])
+
+
+class FakeSupabase:
+    """Client Supabase en mémoire ; `latency` simule l'aller-retour réseau de chaque requête"""
+
+    def __init__(self, knowledge: Optional[List[Dict]] = None, latency: float = 0.0, jitter: float = 0.0):
+        self.tables: Dict[str, List[Dict]] = {'knowledge': list(knowledge or []), 'conversations': []}
+        start_id = max((row['id'] for row in self.tables['knowledge']), default=0) + 1
+        self.ids = itertools.count(start_id)
+        self.latency = latency
+        self.jitter = jitter
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def network_delay(self):
+        with self.lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Dict) -> FakeRPC:
+        return FakeRPC(self, name, params)
+
+
+# ===== FAUX CLIENT GEMINI =====
+
+class FakeLimiter:
+    def __init__(self):
+        self.share = 1.0
+
+    def set_share(self, share: float):
+        self.share = min(1.0, share) if share > 0 else 1.0
+
+    def stats(self) -> dict:
+        return {'in_flight': 0, 'max_concurrency': 0, 'quota_share': self.share}
+
+
+class FakeGeminiClient:
+    """Même interface que GeminiClient ; latence totale et délai du premier fragment configurables"""
+
+    ANSWER = (
+        "D'après les documents disponibles, voici les principales mesures proposées sur ce sujet. "
+        "Le programme détaille le calendrier de mise en œuvre et son financement. "
+        "N'hésite pas à consulter les sources pour plus de détails."
+    )
+
+    def __init__(self, latency: float = 1.0, jitter: float = 0.2, time_to_first_token: float = 0.3):
+        self.latency = latency
+        self.jitter = jitter
+        self.time_to_first_token = time_to_first_token
+        self.limiter = FakeLimiter()
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _duration(self) -> float:
+        with self._lock:
+            self.calls += 1
+        return max(0.0, random.gauss(self.latency, self.jitter))
+
+    def generate_response(self, user_question: str, context: str = "",
+                          conversation_history: List[Dict] = None) -> str:
+        time.sleep(self._duration())
+        return self.ANSWER
+
+    def generate_response_stream(self, user_question: str, context: str = "",
+                                 conversation_history: List[Dict] = None) -> Iterator[str]:
+        duration = self._duration()
+        first = min(self.time_to_first_token, duration)
+        words = self.ANSWER.split(' ')
+        chunks = [' '.join(words[i:i + 8]) + ' ' for i in range(0, len(words), 8)]
+        time.sleep(first)
+        for index, chunk in enumerate(chunks):
+            if index:
+                time.sleep((duration - first) / max(1, len(chunks) - 1))
+            yield chunk
+
+    def generate_no_context_response(self, user_question: str) -> str:
+        time.sleep(self._duration() / 2)
+        return "Je n'ai pas trouvé d'information spécifique sur ta question."
+
+    def count_tokens(self, text: str) -> Optional[int]:
+        return math.ceil(len(text) / 4)
@@ -0,0 +1,264 @@
+"""
+Test de charge de bout en bout, sans réseau :
+webhook() -> file d'updates -> process_update_sync -> _process_user_message -> réponse Telegram
+Supabase (en mémoire), Gemini et l'API Bot Telegram sont simulés localement
+
+Chaque client envoie une question, attend que son update soit entièrement traitée
+(réponse envoyée), puis passe à la suivante : la concurrence est le nombre de clients
+
+Usage : python -m benchmarks.load_test [--concurrency 16] [--messages 500] [--llm-latency 1.0]
+                                       [--db-latency 0.03] [--streaming] [--cache]
+                                       [--baseline ref.json] [--save-baseline ref.json]
+"""
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List
+from benchmarks import fake_gemini_server, fake_telegram_server
+from benchmarks.common import (
+    percentile, peak_rss_mb, current_rss_mb, add_baseline_arguments, finish
+)
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'questions.txt')
+
+
+def load_corpus() -> List[str]:
+    with open(CORPUS_PATH, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> Dict:
+    """Update Telegram brute, telle que reçue par le webhook"""
+    user = {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private', 'first_name': 'Bench'},
+            'from': user,
+            'text': text,
+        },
+    }
+
+
+def configure_environment(args, telegram_port: int, gemini_port: int):
+    """Variables lues par config.py : à définir avant d'importer main"""
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': '123456789:BENCHMARK-TOKEN',
+        'TELEGRAM_API_URL': f'http://127.0.0.1:{telegram_port}',
+        'WEBHOOK_URL': 'https://bench.invalid/webhook',
+        'SUPABASE_URL': 'http://127.0.0.1:9',
+        'SUPABASE_KEY': 'bench.bench.bench',
+        'GEMINI_API_KEY': os.environ.get('GEMINI_API_KEY', 'bench'),
+        'STREAMING_ENABLED': 'true' if args.streaming else 'false',
+        'RESPONSE_CACHE_ENABLED': 'true' if args.cache else 'false',
+        'CONTEXT_TOKEN_CALIBRATION': 'false',
+        # Aucun téléchargement pendant la mesure (NLTK, Hugging Face)
+        'TOKENIZER': 'fast',
+        'OFFLINE_RESOURCES': 'true',
+        'WRITE_BEHIND_SPILL_PATH': os.path.join(tempfile.mkdtemp(prefix='bench-'), 'spill.jsonl'),
+    })
+    if not args.real_embeddings:
+        # Le modèle réel ne doit pas être chargé à l'import de main
+        os.environ['LAZY_LOADING'] = 'true'
+    if args.gemini_server:
+        os.environ['GEMINI_API_ENDPOINT'] = f'http://127.0.0.1:{gemini_port}'
+
+
+def install_fakes(args, supabase):
+    """Importe main avec la fausse base, puis remplace embeddings et Gemini"""
+    from benchmarks.fakes import FakeGeminiClient, FakeEmbeddingBackend
+    import database
+    database._client = supabase
+
+    import main
+    from embedding_service import EmbeddingService
+    from config import EMBEDDING_BATCH_WINDOW_MS, EMBEDDING_MAX_BATCH_SIZE, EMBEDDING_CACHE_SIZE
+
+    bot = main.bot_instance
+    if not args.real_embeddings:
+        bot.search_engine.embedding_service = EmbeddingService(
+            lambda: FakeEmbeddingBackend(latency=args.embedding_latency),
+            batch_window_ms=EMBEDDING_BATCH_WINDOW_MS,
+            max_batch_size=EMBEDDING_MAX_BATCH_SIZE,
+            cache_size=EMBEDDING_CACHE_SIZE
+        )
+    if not args.gemini_server:
+        bot.gemini_client = FakeGeminiClient(args.llm_latency, args.llm_jitter, args.llm_ttft)
+    return main
+
+
+class LoadTest:
+    def __init__(self, main_module, corpus: List[str], args):
+        self.main = main_module
+        self.bot = main_module.bot_instance
+        self.corpus = corpus
+        self.args = args
+        self.latencies: List[float] = []
+        self.shed = 0
+        self.timeouts = 0
+        self._pending: Dict[int, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._update_ids = itertools.count(1)
+
+        # Fin de traitement d'une update = retour du handler du dispatcher (réponse envoyée)
+        handler = self.bot.dispatcher.handler
+
+        def tracked_handler(update_data):
+            try:
+                handler(update_data)
+            finally:
+                with self._lock:
+                    event = self._pending.pop(update_data.get('update_id'), None)
+                if event is not None:
+                    event.set()
+
+        self.bot.dispatcher.handler = tracked_handler
+
+    def run(self, messages: int, concurrency: int, record: bool = True) -> float:
+        """Envoie `messages` questions avec `concurrency` clients ; retourne la durée"""
+        counter = itertools.count()
+        threads = [
+            threading.Thread(target=self._client, args=(index, counter, messages, record), daemon=True)
+            for index in range(concurrency)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+    def _client(self, index: int, counter, messages: int, record: bool):
+        http = self.main.app.test_client()
+        chat_id = 100000 + index % self.args.chats
+        while True:
+            n = next(counter)
+            if n >= messages:
+                return
+            update_id = next(self._update_ids)
+            event = threading.Event()
+            with self._lock:
+                self._pending[update_id] = event
+
+            started = time.perf_counter()
+            response = http.post('/webhook', json=make_update(update_id, chat_id, self.corpus[n % len(self.corpus)]))
+            # Délestage : 503 ou réponse "occupé" directement dans le webhook
+            if response.status_code != 200 or response.get_json(silent=True):
+                with self._lock:
+                    self._pending.pop(update_id, None)
+                    self.shed += record
+                continue
+
+            if not event.wait(self.args.timeout):
+                with self._lock:
+                    self.timeouts += record
+                continue
+            if record:
+                with self._lock:
+                    self.latencies.append(time.perf_counter() - started)
+
+
+def stage_breakdown() -> Dict[str, Dict]:
+    """Durée moyenne par étape et répartition des méthodes de recherche (histogrammes de tracing)"""
+    from tracing import STAGE_SECONDS, REQUEST_SECONDS
+
+    stages = defaultdict(lambda: {'count': 0, 'sum': 0.0})
+    for labels, values in STAGE_SECONDS.series():
+        stage = stages[labels.get('stage')]
+        stage['count'] += values['count']
+        stage['sum'] += values['sum']
+    methods = defaultdict(int)
+    for labels, values in REQUEST_SECONDS.series():
+        methods[labels.get('search_method')] += values['count']
+    return {'stages': dict(stages), 'methods': dict(methods)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge du pipeline complet avec des doublures locales")
+    parser.add_argument('--concurrency', type=int, default=16, help="Clients simultanés")
+    parser.add_argument('--messages', type=int, default=500, help="Messages mesurés")
+    parser.add_argument('--warmup', type=int, default=20, help="Messages de chauffe (non mesurés)")
+    parser.add_argument('--chats', type=int, default=0, help="Nombre de chats distincts (défaut : un par client)")
+    parser.add_argument('--timeout', type=float, default=60.0, help="Attente max d'une réponse (s)")
+    parser.add_argument('--db-latency', type=float, default=0.03, help="Aller-retour Supabase simulé (s)")
+    parser.add_argument('--llm-latency', type=float, default=1.0, help="Durée moyenne d'une réponse Gemini (s)")
+    parser.add_argument('--llm-jitter', type=float, default=0.2)
+    parser.add_argument('--llm-ttft', type=float, default=0.3, help="Délai du premier fragment en streaming (s)")
+    parser.add_argument('--telegram-latency', type=float, default=0.05, help="Aller-retour API Bot simulé (s)")
+    parser.add_argument('--embedding-latency', type=float, default=0.0, help="Durée d'un lot d'embeddings simulé (s)")
+    parser.add_argument('--real-embeddings', action='store_true', help="Utilise le backend d'embedding configuré")
+    parser.add_argument('--gemini-server', action='store_true',
+                        help="Vrai GeminiClient (quota, retries) contre le faux serveur Gemini local")
+    parser.add_argument('--streaming', action='store_true', help="Réponses en streaming (éditions Telegram)")
+    parser.add_argument('--cache', action='store_true', help="Active le cache des réponses")
+    parser.add_argument('--telegram-port', type=int, default=8088)
+    parser.add_argument('--gemini-port', type=int, default=8089)
+    add_baseline_arguments(parser)
+    args = parser.parse_args()
+    args.chats = args.chats or args.concurrency
+
+    telegram = fake_telegram_server.serve(args.telegram_port, args.telegram_latency)
+    if args.gemini_server:
+        fake_gemini_server.serve(args.gemini_port, args.llm_latency, args.llm_jitter)
+    configure_environment(args, args.telegram_port, args.gemini_port)
+    # Les doublures importent config.py (via text_processing) : seulement une fois l'environnement défini
+    from benchmarks.fakes import FakeSupabase, build_knowledge
+
+    rss_before = current_rss_mb()
+    knowledge = build_knowledge()
+    supabase = FakeSupabase(knowledge, latency=args.db_latency, jitter=args.db_latency / 5)
+    main_module = install_fakes(args, supabase)
+    if not main_module.initialize_bot():
+        print("❌ Initialisation du bot impossible")
+        return 1
+
+    load_test = LoadTest(main_module, load_corpus(), args)
+    if args.warmup:
+        load_test.run(args.warmup, min(args.concurrency, args.warmup), record=False)
+    supabase_requests = supabase.requests
+    duration = load_test.run(args.messages, args.concurrency)
+    rss_after = current_rss_mb()
+
+    latencies = load_test.latencies
+    completed = len(latencies)
+    results = {
+        'throughput_per_s': completed / duration if duration else 0.0,
+        'latency_p50_ms': percentile(latencies, 50) * 1000,
+        'latency_p95_ms': percentile(latencies, 95) * 1000,
+        'latency_p99_ms': percentile(latencies, 99) * 1000,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+    print(f"\n== Charge : {args.messages} messages, {args.concurrency} clients, {args.chats} chats ==")
+    print(f"Base de connaissances     {len(knowledge)} documents")
+    print(f"Traités                   {completed} (délestés: {load_test.shed}, expirés: {load_test.timeouts})")
+    print(f"Durée                     {duration:.2f} s")
+    print(f"Débit                     {results['throughput_per_s']:.1f} messages/s")
+    print(f"Latence p50/p95/p99       {results['latency_p50_ms']:.0f} / {results['latency_p95_ms']:.0f} / "
+          f"{results['latency_p99_ms']:.0f} ms (max {max(latencies, default=0) * 1000:.0f} ms)")
+    print(f"Mémoire RSS               {rss_before:.0f} -> {rss_after:.0f} Mo (pic {results['peak_rss_mb']:.0f} Mo)")
+    print(f"Requêtes Supabase         {supabase.requests - supabase_requests}")
+    print(f"Appels API Telegram       {dict(sorted(telegram.state.calls.items()))}")
+
+    breakdown = stage_breakdown()
+    print("\nÉtapes (moyenne, chauffe incluse):")
+    for stage, values in sorted(breakdown['stages'].items(), key=lambda item: -item[1]['sum']):
+        print(f"  {stage:<16} {values['sum'] / values['count'] * 1000:8.1f} ms  ({values['count']} spans)")
+    print(f"Méthodes de recherche: {breakdown['methods']}")
+    if main_module.bot_instance.intent_router is not None:
+        print(f"Routeur d'intentions: {main_module.bot_instance.intent_router.stats()}")
+
+    main_module.bot_instance.stop_async_loop()
+    main_module.bot_instance.db.flush()
+    return finish(results, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
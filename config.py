@@ -5,6 +5,8 @@ load_dotenv()
 
 # Configuration Telegram
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# API Bot (ex: faux serveur local des benchmarks)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
 
 # Configuration Supabase
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -12,12 +14,138 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
 # Configuration Gemini
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+# Point d'accès de l'API (ex: http://localhost:8089 pour un faux serveur Gemini local, transport REST)
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+# Quota Gemini (0 = pas de limite locale)
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", 1000))            # Requêtes par minute
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", 1000000))         # Tokens d'entrée par minute
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 8))
+# Nouvelles tentatives (429, 5xx, délais dépassés) avec backoff exponentiel
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", 3))
+GEMINI_RETRY_BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", 0.5))  # En secondes
+GEMINI_RETRY_MAX_DELAY = float(os.getenv("GEMINI_RETRY_MAX_DELAY", 8.0))
+GEMINI_ATTEMPT_TIMEOUT = float(os.getenv("GEMINI_ATTEMPT_TIMEOUT", 20.0))    # Par tentative
+GEMINI_REQUEST_DEADLINE = float(os.getenv("GEMINI_REQUEST_DEADLINE", 45.0))  # Attente + tentatives
+# Requête de couverture si la première n'a pas répondu après ce délai (0 = désactivé)
+GEMINI_HEDGE_AFTER = float(os.getenv("GEMINI_HEDGE_AFTER", 0))
 
 # Configuration de recherche
 KEYWORD_THRESHOLD = 0.3  # Seuil de pertinence pour la recherche par mots-clés
 RAG_THRESHOLD = 0.7      # Seuil de similarité pour le RAG
-MAX_CONTEXT_TOKENS = 3000  # Limite de tokens pour le contexte envoyé à Gemini
+MAX_CONTEXT_TOKENS = int(os.getenv("MAX_CONTEXT_TOKENS", 3000))  # Limite de tokens pour le contexte envoyé à Gemini
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", 3.6))  # Ratio initial de l'estimateur de tokens (français)
+# Calibre l'estimateur au démarrage avec le compteur de tokens de Gemini (un appel count_tokens)
+CONTEXT_TOKEN_CALIBRATION = os.getenv("CONTEXT_TOKEN_CALIBRATION", "true").lower() == "true"
 MAX_SEARCH_RESULTS = 5   # Nombre max de résultats de recherche
+# Texte des documents retenus pour le contexte, gardé en mémoire (la recherche ne transfère pas le texte)
+DOCUMENT_CACHE_SIZE = int(os.getenv("DOCUMENT_CACHE_SIZE", 2000))
+DOCUMENT_CACHE_TTL = int(os.getenv("DOCUMENT_CACHE_TTL", 3600))  # En secondes
+
+# Recherche concurrente : mots-clés et embedding de la question en parallèle
+SEARCH_CONCURRENT = os.getenv("SEARCH_CONCURRENT", "true").lower() == "true"
+# Lance la RPC match_documents sans attendre le verdict des mots-clés (annulée si inutile)
+SPECULATIVE_RAG = os.getenv("SPECULATIVE_RAG", "false").lower() == "true"
+SEARCH_FANOUT_WORKERS = int(os.getenv("SEARCH_FANOUT_WORKERS", 6))
+
+# Reclassement : fusion mots-clés + vectoriel (Reciprocal Rank Fusion) puis cross-encoder CPU
+# Remplace le choix "mots-clés ou RAG" ; moins de documents, mieux choisis, dans le prompt
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")  # Multilingue
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", 150))   # Au-delà : ordre RRF pour le reste
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", 8))
+RERANK_POOL_SIZE = int(os.getenv("RERANK_POOL_SIZE", 12))      # Candidats fusionnés à reclasser
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", 3))               # Documents gardés pour le contexte
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", 4096))  # Scores (question, document) gardés
+RRF_K = int(os.getenv("RRF_K", 60))
+
+# Cache des réponses (exact + sémantique)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 3600))    # En secondes
+# Distance cosinus max entre deux questions pour réutiliser une réponse (0 = désactivé)
+# Désactivé par défaut : ce niveau ignore l'historique de la conversation et les documents trouvés
+RESPONSE_CACHE_SEMANTIC_DISTANCE = float(os.getenv("RESPONSE_CACHE_SEMANTIC_DISTANCE", 0))
+KNOWLEDGE_VERSION_POLL_INTERVAL = int(os.getenv("KNOWLEDGE_VERSION_POLL_INTERVAL", 300))
+
+# Index vectoriel local : "rpc" (match_documents Supabase), "numpy" (exhaustif) ou "hnsw"
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "rpc")
+VECTOR_INDEX_REFRESH_INTERVAL = int(os.getenv("VECTOR_INDEX_REFRESH_INTERVAL", 300))  # 0 = jamais
+
+# Tokenisation des mots-clés : "nltk" (Punkt) ou "fast" (regex, sans accents, racinisation légère)
+# En mode "fast", les mots-clés des documents doivent être générés avec le même pipeline
+# (generate_document_keywords) ; l'index local les renormalise au chargement
+TOKENIZER = os.getenv("TOKENIZER", "nltk")
+
+# Index inversé local pour la recherche par mots-clés (aucun appel réseau)
+KEYWORD_INDEX_ENABLED = os.getenv("KEYWORD_INDEX_ENABLED", "false").lower() == "true"
+KEYWORD_SCORING = os.getenv("KEYWORD_SCORING", "overlap")   # "overlap" ou "bm25"
+
+# Instantané de la base de connaissances (python knowledge_snapshot.py) : les index locaux
+# démarrent depuis ce fichier (mmap) au lieu de relire la table ; vide = désactivé
+KNOWLEDGE_SNAPSHOT_PATH = os.getenv("KNOWLEDGE_SNAPSHOT_PATH", "")
+# Compare l'empreinte de l'instantané à celle de la table (ids + content_hash) avant de l'utiliser
+KNOWLEDGE_SNAPSHOT_VALIDATE = os.getenv("KNOWLEDGE_SNAPSHOT_VALIDATE", "true").lower() == "true"
+
+# Embeddings (CPU uniquement)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")   # "torch", "torch-int8", "onnx", "onnx-int8"
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", 5))
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", 32))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 2048))
+
+# Réponses en streaming : un message Telegram édité au fil de la génération
+STREAMING_ENABLED = os.getenv("STREAMING_ENABLED", "true").lower() == "true"
+# Intervalle minimal entre deux éditions d'un même message (limites de débit Telegram)
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", 1.0))
+
+# Écriture différée des conversations (insertions en masse hors du chemin de réponse)
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", 50))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", 2.0))  # En secondes
+# Fichier local (append-only) si Supabase est indisponible, rejoué ensuite
+WRITE_BEHIND_SPILL_PATH = os.getenv("WRITE_BEHIND_SPILL_PATH", "conversations_spill.jsonl")
+
+# Cache en mémoire de l'historique par chat (aucun aller-retour réseau une fois le chat connu)
+HISTORY_CACHE_ENABLED = os.getenv("HISTORY_CACHE_ENABLED", "true").lower() == "true"
+HISTORY_CACHE_PER_CHAT = int(os.getenv("HISTORY_CACHE_PER_CHAT", 5))       # Échanges gardés par chat
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+
+# Routeur d'intentions : salutations, aide et questions fréquentes servies sans recherche ni LLM
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() == "true"
+INTENT_MAX_WORDS = int(os.getenv("INTENT_MAX_WORDS", 8))   # Au-delà : question ouverte
+ELECTION_DATE = os.getenv("ELECTION_DATE", "12 octobre 2025")
+
+# Journal d'une ligne par message avec la durée de chaque étape (les histogrammes sont toujours exportés)
+TRACE_LOGGING = os.getenv("TRACE_LOGGING", "false").lower() == "true"
+
+# Démarrage
+# Chargement à la première utilisation (modèle d'embedding, NLTK, index locaux)
+LAZY_LOADING = os.getenv("LAZY_LOADING", "true").lower() == "true"
+# Préchauffage en arrière-plan une fois le webhook prêt
+PREWARM = os.getenv("PREWARM", "true").lower() == "true"
+# Aucune ressource téléchargée au démarrage (modèles HF et NLTK déjà présents sur le disque)
+OFFLINE_RESOURCES = os.getenv("OFFLINE_RESOURCES", "false").lower() == "true"
+if OFFLINE_RESOURCES:
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+# Pools de threads pour les appels bloquants (Supabase, embeddings, Gemini)
+# Un pool borné par étape : un appel Gemini lent ne bloque ni la boucle ni la base
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", 4))
+SEARCH_EXECUTOR_WORKERS = int(os.getenv("SEARCH_EXECUTOR_WORKERS", 2))
+LLM_EXECUTOR_WORKERS = int(os.getenv("LLM_EXECUTOR_WORKERS", 8))
+
+# File d'ingestion des webhooks
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 8))           # Workers fixes (un chat = un worker)
+UPDATE_QUEUE_MAX_DEPTH = int(os.getenv("UPDATE_QUEUE_MAX_DEPTH", 200))
+# Au-delà, l'update est signalée lente ; le worker l'attend quand même (ordre par chat préservé)
+UPDATE_SLOW_SECONDS = float(os.getenv("UPDATE_SLOW_SECONDS", 30))
+# Politique de délestage quand la file est pleine :
+#   "reject" -> HTTP 503 + Retry-After (Telegram renverra l'update plus tard)
+#   "busy"   -> réponse polie directement dans la réponse du webhook
+UPDATE_SHED_POLICY = os.getenv("UPDATE_SHED_POLICY", "busy")
+UPDATE_RETRY_AFTER = int(os.getenv("UPDATE_RETRY_AFTER", 5))    # En secondes
 
 # Messages système
 WELCOME_MESSAGE = """
@@ -52,7 +180,21 @@ N'hésite pas à me poser tes questions !
 
 ERROR_MESSAGE = "Désolé, j'ai rencontré un problème. Peux-tu reformuler ta question ?"
 
+BUSY_MESSAGE = "⏳ Beaucoup de questions en ce moment ! Réessaie dans quelques instants."
+
 WEBHOOK_URL = os.environ.get('WEBHOOK_URL')
+# Enregistrement du webhook auprès de Telegram :
+#   "startup"  -> chaque processus au démarrage (un seul worker)
+#   "leader"   -> un seul processus, élu via le stockage partagé (plusieurs workers)
+#   "external" -> jamais au démarrage : étape de déploiement "python webhook_setup.py set"
+WEBHOOK_REGISTRATION = os.getenv("WEBHOOK_REGISTRATION", "startup")
+WEBHOOK_LEADER_TTL = int(os.getenv("WEBHOOK_LEADER_TTL", 600))   # En secondes
+
+# Plusieurs workers (WEB_CONCURRENCY, lu par gunicorn_config.py) : stockage partagé entre eux
+# "" ou "memory://" (un processus), "sqlite:////tmp/election-bot.db" (une machine), "redis://..."
+SHARED_STORE_URL = os.getenv("SHARED_STORE_URL", "")
+# Battement de cœur des workers : le quota Gemini est réparti entre les workers vivants
+WORKER_HEARTBEAT_INTERVAL = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", 10))
 
 PORT = int(os.environ.get('PORT', 5000))
 
@@ -0,0 +1,173 @@
+"""
+Assemblage du contexte documentaire envoyé à Gemini dans un budget de tokens :
+estimation calibrée des tokens, dédoublonnage des chunks qui se recouvrent,
+remplissage dans l'ordre du classement et troncature du dernier document à une fin de phrase
+L'ordre reçu est celui de la recherche (rerank, RRF, entrelacement des candidats) : il est conservé
+"""
+import re
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+from metrics import REGISTRY
+
+CONTEXT_TOKENS = REGISTRY.histogram(
+    'bot_context_tokens', "Tokens du contexte documentaire envoyé au LLM",
+    buckets=(100, 250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000)
+)
+
+_WORD_RE = re.compile(r"\w+")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s+")
+
+# En dessous de ce reliquat, tronquer un document n'apporte plus rien
+MIN_TRUNCATED_TOKENS = 40
+
+
+class TokenEstimator:
+    """
+    Estimation du nombre de tokens par ratio caractères/token
+    Le ratio par défaut correspond à du français ; calibrate() l'ajuste sur le vrai tokenizer
+    """
+
+    def __init__(self, chars_per_token: float = 3.6):
+        self.chars_per_token = chars_per_token
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return max(1, int(len(text) / self.chars_per_token + 0.5))
+
+    def calibrate(self, samples: List[str], count_fn: Callable[[str], int]) -> float:
+        """Ajuste le ratio à partir du compteur exact du modèle (ex. GeminiClient.count_tokens)"""
+        total_chars, total_tokens = 0, 0
+        for sample in samples:
+            tokens = count_fn(sample)
+            if tokens:
+                total_chars += len(sample)
+                total_tokens += tokens
+        if total_tokens:
+            self.chars_per_token = total_chars / total_tokens
+            print(f"Estimateur de tokens calibré: {self.chars_per_token:.2f} caractères/token")
+        return self.chars_per_token
+
+
+def relevance(result: Dict) -> Tuple[Optional[str], float]:
+    """
+    (méthode, score) de pertinence d'un résultat
+    Deux scores ne se comparent que s'ils viennent de la même méthode (logits, cosinus, BM25...)
+    """
+    for key in ('rerank_score', 'similarity', 'bm25_score', 'keyword_score'):
+        if result.get(key) is not None:
+            return key, float(result[key])
+    return None, 0.0
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = _WORD_RE.findall(text.lower())
+    return {' '.join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def truncate_at_sentence(text: str, max_tokens: int, estimator: TokenEstimator) -> str:
+    """Garde les phrases entières qui tiennent dans max_tokens"""
+    kept = []
+    used = 0
+    for sentence in _SENTENCE_END_RE.split(text):
+        cost = estimator.count(sentence + ' ')
+        if used + cost > max_tokens:
+            break
+        kept.append(sentence)
+        used += cost
+    return ' '.join(kept)
+
+
+class ContextPacker:
+    def __init__(self, estimator: Optional[TokenEstimator] = None, overlap_threshold: float = 0.8):
+        self.estimator = estimator or TokenEstimator()
+        self.overlap_threshold = overlap_threshold
+
+    def deduplicate(self, results: List[Dict]) -> List[Dict]:
+        """
+        Supprime les doublons (même ID, ou texte quasi identique pour le même candidat)
+        L'ordre reçu est conservé ; entre deux doublons, le plus pertinent (scores de même
+        méthode) prend la place du mieux classé
+        """
+        kept: List[Dict] = []
+        kept_shingles: List[Tuple[Optional[str], set]] = []
+        for result in results:
+            doc_id = result.get('id')
+            shingles = _shingles(result.get('text', '') or '')
+            candidate = result.get('candidate')
+            duplicate_of = next((
+                position for position, (other_candidate, other) in enumerate(kept_shingles)
+                if (doc_id is not None and kept[position].get('id') == doc_id)
+                or (other_candidate == candidate and
+                    len(shingles & other) / max(1, len(shingles | other)) >= self.overlap_threshold)
+            ), None)
+
+            if duplicate_of is None:
+                kept.append(result)
+                kept_shingles.append((candidate, shingles))
+                continue
+            method, score = relevance(result)
+            other_method, other_score = relevance(kept[duplicate_of])
+            if method is not None and method == other_method and score > other_score:
+                kept[duplicate_of] = result
+                kept_shingles[duplicate_of] = (candidate, shingles)
+        return kept
+
+    def pack(self, results: List[Dict], max_tokens: int) -> Tuple[str, int]:
+        """
+        Retourne (contexte, tokens utilisés)
+        Documents pris dans l'ordre reçu tant qu'ils tiennent dans le budget ;
+        le reliquat est occupé par le premier document restant, tronqué à une fin de phrase
+        """
+        if not results:
+            return "", 0
+
+        # En-têtes regroupés : candidat + source une seule fois par groupe
+        groups: "OrderedDict[Tuple, List[str]]" = OrderedDict()
+        header_cost: Dict[Tuple, int] = {}
+        used = 0
+        skipped: List[Dict] = []
+
+        for result in self.deduplicate(results):
+            key = (result.get('candidate') or 'Information générale', result.get('source_link') or 'N/A')
+            body = self._format_body(result, result.get('text', '') or '')
+            cost = self.estimator.count(body)
+            if key not in groups:
+                header_cost[key] = self.estimator.count(self._format_header(key))
+                cost += header_cost[key]
+
+            if used + cost <= max_tokens:
+                groups.setdefault(key, []).append(body)
+                used += cost
+            else:
+                skipped.append(result)
+
+        # Troncature du mieux classé des documents qui n'ont pas tenu
+        remaining = max_tokens - used
+        for result in skipped:
+            key = (result.get('candidate') or 'Information générale', result.get('source_link') or 'N/A')
+            overhead = self.estimator.count(self._format_body(result, '')) + \
+                (0 if key in groups else self.estimator.count(self._format_header(key)))
+            budget = remaining - overhead
+            if budget < MIN_TRUNCATED_TOKENS:
+                continue
+            text = truncate_at_sentence(result.get('text', '') or '', budget, self.estimator)
+            if not text:
+                continue
+            body = self._format_body(result, text + ' […]')
+            groups.setdefault(key, []).append(body)
+            used += overhead + self.estimator.count(text + ' […]')
+            break
+
+        parts = [self._format_header(key) + ''.join(bodies) for key, bodies in groups.items()]
+        CONTEXT_TOKENS.observe(used)
+        return '\n'.join(parts), used
+
+    @staticmethod
+    def _format_header(key: Tuple) -> str:
+        candidate, source = key
+        return f"=== Candidat: {candidate} | Source: {source} ===\n"
+
+    @staticmethod
+    def _format_body(result: Dict, text: str) -> str:
+        return f"Section: {result.get('section', 'N/A')}\nContenu: {text}\n---\n"
@@ -1,11 +1,78 @@
+import threading
 from supabase import create_client, Client
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 from datetime import datetime
-from config import SUPABASE_URL, SUPABASE_KEY
+from config import (
+    SUPABASE_URL, SUPABASE_KEY, WRITE_BEHIND_ENABLED, WRITE_BEHIND_MAX_BATCH,
+    WRITE_BEHIND_FLUSH_INTERVAL, WRITE_BEHIND_SPILL_PATH,
+    HISTORY_CACHE_ENABLED, HISTORY_CACHE_PER_CHAT, HISTORY_CACHE_MAX_BYTES
+)
+from write_buffer import WriteBehindBuffer
+from history_cache import ConversationHistoryCache
+from shared_store import get_shared_store
+
+# Projections de la table knowledge : jamais de select('*') (l'embedding stocké pèse plusieurs Ko par ligne)
+# Recherche : métadonnées seulement, le texte est chargé ensuite pour les documents retenus
+KNOWLEDGE_SEARCH_COLUMNS = ['id', 'candidate', 'section', 'source_link', 'keywords']
+KNOWLEDGE_DOCUMENT_COLUMNS = ['id', 'text', 'candidate', 'section', 'source_link', 'keywords']
+
+_client: Optional[Client] = None
+_client_lock = threading.Lock()
+
+def get_supabase_client() -> Client:
+    """Client Supabase partagé par toutes les instances de Database du processus"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = create_client(SUPABASE_URL, SUPABASE_KEY)
+        return _client
+
+# Colonne knowledge.content_hash présente ? (détectée une fois par processus, voir knowledge_columns)
+_has_content_hash: Optional[bool] = None
+
+def _is_missing_column(error: Exception) -> bool:
+    """Erreur PostgreSQL 42703 (colonne inexistante) renvoyée par PostgREST"""
+    return getattr(error, 'code', None) == '42703' or '42703' in str(error)
+
+_write_buffer: Optional[WriteBehindBuffer] = None
+
+def get_write_buffer(flush_fn) -> WriteBehindBuffer:
+    """Tampon d'écriture différée partagé par le processus"""
+    global _write_buffer
+    with _client_lock:
+        if _write_buffer is None:
+            _write_buffer = WriteBehindBuffer(
+                flush_fn,
+                max_batch=WRITE_BEHIND_MAX_BATCH,
+                flush_interval=WRITE_BEHIND_FLUSH_INTERVAL,
+                spill_path=WRITE_BEHIND_SPILL_PATH
+            )
+        return _write_buffer
+
+_history_cache: Optional[ConversationHistoryCache] = None
+
+def get_history_cache() -> ConversationHistoryCache:
+    """Cache d'historique partagé par le processus (versions coordonnées entre workers)"""
+    global _history_cache
+    with _client_lock:
+        if _history_cache is None:
+            store = get_shared_store()
+            _history_cache = ConversationHistoryCache(
+                per_chat=HISTORY_CACHE_PER_CHAT,
+                max_bytes=HISTORY_CACHE_MAX_BYTES,
+                store=store if store.shared else None
+            )
+        return _history_cache
+
+def get_write_buffer_if_started() -> Optional[WriteBehindBuffer]:
+    """Tampon existant, sans en créer un (hooks d'arrêt)"""
+    return _write_buffer
 
 class Database:
     def __init__(self):
-        self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+        self.supabase: Client = get_supabase_client()
+        self.write_buffer = get_write_buffer(self._insert_messages) if WRITE_BEHIND_ENABLED else None
+        self.history_cache = get_history_cache() if HISTORY_CACHE_ENABLED else None
     
     # ===== GESTION DES CONVERSATIONS =====
     
@@ -21,34 +88,100 @@ class Database:
                 'timestamp': datetime.now().isoformat()
             }
             
+            if self.history_cache is not None:
+                self.history_cache.append(chat_id, data)
+            
+            # Écriture différée : insérée plus tard, en masse
+            if self.write_buffer is not None:
+                self.write_buffer.add(data)
+                return data
+            
             result = self.supabase.table('conversations').insert(data).execute()
+            if self.history_cache is not None:
+                self.history_cache.publish([chat_id])
             return result.data[0] if result.data else None
         except Exception as e:
             print(f"Erreur sauvegarde message: {e}")
             return None
     
+    def save_messages_bulk(self, rows: List[Dict]) -> bool:
+        """Insère plusieurs échanges en une requête"""
+        try:
+            self.supabase.table('conversations').insert(rows).execute()
+            return True
+        except Exception as e:
+            print(f"Erreur sauvegarde messages (lot de {len(rows)}): {e}")
+            return False
+    
+    def _insert_messages(self, rows: List[Dict]) -> bool:
+        """Envoi du tampon d'écriture différée (lots et rejeu) ; version publiée après l'insertion"""
+        if not self.save_messages_bulk(rows):
+            return False
+        if self.history_cache is not None:
+            self.history_cache.publish(row.get('chat_id') for row in rows)
+        return True
+    
+    def flush(self):
+        """Force l'écriture des messages en attente (arrêt du worker)"""
+        if self.write_buffer is not None:
+            self.write_buffer.flush()
+    
     def get_conversation_history(self, chat_id: int, limit: int = 10) -> List[Dict]:
-        """Récupère l'historique d'une conversation"""
+        """Récupère l'historique d'une conversation (depuis la mémoire quand le chat est connu)"""
+        if self.history_cache is not None:
+            cached = self.history_cache.get(chat_id, limit)
+            if cached is not None:
+                return cached
+        
+        # Premier contact : charger assez d'échanges pour remplir le tampon du chat
+        fetch_limit = max(limit, self.history_cache.per_chat) if self.history_cache is not None else limit
+        # Version lue avant la requête : une insertion publiée entre-temps invalidera le tampon
+        version = self.history_cache.version(chat_id) if self.history_cache is not None else None
         try:
             result = self.supabase.table('conversations')\
                 .select('user_message, bot_response, timestamp')\
                 .eq('chat_id', chat_id)\
                 .order('timestamp', desc=True)\
-                .limit(limit)\
+                .limit(fetch_limit)\
                 .execute()
             
-            return list(reversed(result.data)) if result.data else []
+            history = list(reversed(result.data)) if result.data else []
+            fetched = True
         except Exception as e:
             print(f"Erreur récupération historique: {e}")
-            return []
+            history = []
+            fetched = False
+        
+        # Échanges encore dans le tampon d'écriture différée
+        if self.write_buffer is not None:
+            history += [
+                {k: row[k] for k in ('user_message', 'bot_response', 'timestamp')}
+                for row in self.write_buffer.pending_for(chat_id)
+            ]
+        
+        if fetched and self.history_cache is not None:
+            self.history_cache.warm(chat_id, history, version)
+        return history[-limit:]
     
     def clear_conversation(self, chat_id: int) -> bool:
         """Efface l'historique d'une conversation"""
+        if self.write_buffer is None:
+            return self._delete_conversation(chat_id)
+        # Envoi en cours terminé et suivants suspendus jusqu'au delete : aucune ligne du chat
+        # déjà sortie du tampon ne peut être insérée après l'effacement
+        with self.write_buffer.flush_paused():
+            self.write_buffer.discard(chat_id)
+            return self._delete_conversation(chat_id)
+    
+    def _delete_conversation(self, chat_id: int) -> bool:
         try:
             self.supabase.table('conversations')\
                 .delete()\
                 .eq('chat_id', chat_id)\
                 .execute()
+            # Après un delete échoué l'historique est toujours en base : le cache reste valide
+            if self.history_cache is not None:
+                self.history_cache.clear(chat_id)
             return True
         except Exception as e:
             print(f"Erreur effacement conversation: {e}")
@@ -56,13 +189,23 @@ class Database:
     
     # ===== RECHERCHE DANS LA BASE DE CONNAISSANCES =====
     
-    def search_by_keywords(self, keywords: List[str], candidate: Optional[str] = None) -> List[Dict]:
-        """Recherche par mots-clés dans la base de connaissances"""
+    def search_by_keywords(self, keywords: List[str],
+                           candidate: Optional[Union[str, List[str]]] = None,
+                           columns: List[str] = KNOWLEDGE_SEARCH_COLUMNS) -> List[Dict]:
+        """
+        Recherche par mots-clés dans la base de connaissances (un ou plusieurs candidats)
+        Par défaut sans le texte : voir get_documents_by_ids
+        """
         try:
-            query = self.supabase.table('knowledge').select('*')
+            query = self.supabase.table('knowledge').select(', '.join(columns))
             
-            # Filtrer par candidat si spécifié
-            if candidate:
+            # Filtrer par candidat(s) si spécifié
+            if isinstance(candidate, list):
+                if len(candidate) == 1:
+                    query = query.eq('candidate', candidate[0])
+                elif candidate:
+                    query = query.in_('candidate', candidate)
+            elif candidate:
                 query = query.eq('candidate', candidate)
             
             # Recherche par mots-clés (utilise l'opérateur overlap pour les arrays)
@@ -94,15 +237,160 @@ class Database:
             print(f"Erreur recherche vectorielle: {e}")
             return []
     
+    def fetch_knowledge(self, columns: List[str], after_id: Optional[int] = None,
+                        page_size: int = 1000, strict: bool = False) -> List[Dict]:
+        """
+        Parcourt la table knowledge par pages (ordre des IDs), à partir d'un ID optionnel
+        strict : lève en cas d'erreur au lieu de retourner les lignes déjà lues
+        """
+        rows = []
+        try:
+            for batch in self._knowledge_pages(columns, after_id, page_size):
+                rows.extend(batch)
+        except Exception as e:
+            if strict:
+                raise
+            print(f"Erreur chargement base de connaissances: {e}")
+        return rows
+    
+    def has_content_hash(self) -> bool:
+        """
+        La table knowledge a-t-elle la colonne content_hash (migration décrite dans ingest.py) ?
+        Sans elle, les index locaux ne se réconcilient que sur les ids : ajouts et suppressions
+        sont suivis, pas les documents modifiés sur place
+        Une erreur autre que "colonne inexistante" est propagée (rien n'est mémorisé)
+        """
+        global _has_content_hash
+        if _has_content_hash is None:
+            try:
+                self.supabase.table('knowledge').select('id, content_hash').limit(1).execute()
+                _has_content_hash = True
+            except Exception as e:
+                if not _is_missing_column(e):
+                    raise
+                print("Colonne knowledge.content_hash absente : réconciliation des index sur les ids seulement "
+                      "(voir la migration dans ingest.py)")
+                _has_content_hash = False
+        return _has_content_hash
+    
+    def knowledge_columns(self, columns: List[str]) -> List[str]:
+        """`columns` + content_hash si la colonne existe"""
+        return list(columns) + (['content_hash'] if self.has_content_hash() else [])
+    
+    def _knowledge_pages(self, columns: List[str], after_id: Optional[int], page_size: int):
+        last_id = after_id
+        while True:
+            query = self.supabase.table('knowledge')\
+                .select(', '.join(columns))\
+                .order('id')\
+                .limit(page_size)
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            
+            batch = query.execute().data or []
+            yield batch
+            if len(batch) < page_size:
+                return
+            last_id = batch[-1]['id']
+    
+    def fetch_knowledge_hashes(self, page_size: int = 5000) -> Dict[int, Optional[str]]:
+        """
+        Tous les documents de la table (id -> content_hash), pour réconcilier les index locaux
+        Pas de repli silencieux : une liste partielle ferait retirer des documents encore présents
+        Sans colonne content_hash, les empreintes valent None
+        """
+        hashes = {}
+        for batch in self._knowledge_pages(self.knowledge_columns(['id']), None, page_size):
+            hashes.update((row['id'], row.get('content_hash')) for row in batch)
+        return hashes
+    
+    def fetch_knowledge_by_ids(self, columns: List[str], doc_ids: List[int],
+                               batch_size: int = 200) -> List[Dict]:
+        """Documents à (ré)indexer, par lots d'IDs ; lève en cas d'erreur"""
+        rows = []
+        doc_ids = list(doc_ids)
+        for start in range(0, len(doc_ids), batch_size):
+            result = self.supabase.table('knowledge')\
+                .select(', '.join(columns))\
+                .in_('id', doc_ids[start:start + batch_size])\
+                .execute()
+            rows.extend(result.data or [])
+        return rows
+    
+    def get_knowledge_version(self) -> Optional[str]:
+        """
+        Empreinte de la table knowledge pour invalider les caches de réponses
+        Calculée sur les ids et content_hash (même empreinte que l'instantané) : un texte modifié
+        sur place ou une ligne remplacée par une autre changent la version ; sans colonne
+        content_hash, seuls les ids sont suivis
+        """
+        from knowledge_snapshot import fetch_fingerprint
+        try:
+            return fetch_fingerprint(self)[:16]
+        except Exception as e:
+            print(f"Erreur version base de connaissances: {e}")
+            return None
+    
     def get_document_by_id(self, doc_id: int) -> Optional[Dict]:
         """Récupère un document par son ID"""
         try:
             result = self.supabase.table('knowledge')\
-                .select('*')\
+                .select(', '.join(KNOWLEDGE_DOCUMENT_COLUMNS))\
                 .eq('id', doc_id)\
                 .single()\
                 .execute()
             return result.data
         except Exception as e:
             print(f"Erreur récupération document: {e}")
-            return None
\ No newline at end of file
+            return None
+    
+    def get_documents_by_ids(self, doc_ids: List[int],
+                             columns: List[str] = KNOWLEDGE_DOCUMENT_COLUMNS) -> Dict[int, Dict]:
+        """
+        Récupère plusieurs documents en une requête (id -> document, absents ignorés)
+        Pas de repli silencieux : un échec ne doit pas passer pour des documents supprimés
+        """
+        if not doc_ids:
+            return {}
+        if 'id' not in columns:
+            columns = ['id'] + list(columns)
+        result = self.supabase.table('knowledge')\
+            .select(', '.join(columns))\
+            .in_('id', list(doc_ids))\
+            .execute()
+        return {row['id']: row for row in (result.data or [])}
+    
+    # ===== INGESTION =====
+    
+    def get_knowledge_hashes(self, source_link: str) -> Dict[str, int]:
+        """
+        Empreintes des chunks déjà en base pour une source (content_hash -> id)
+        Pas de repli silencieux : une erreur ici ferait croire que la source est absente
+        """
+        result = self.supabase.table('knowledge')\
+            .select('id, content_hash')\
+            .eq('source_link', source_link)\
+            .execute()
+        return {row['content_hash']: row['id'] for row in (result.data or []) if row.get('content_hash')}
+    
+    def upsert_knowledge(self, rows: List[Dict]) -> bool:
+        """Insère des chunks en une requête ; un chunk déjà présent (même content_hash) est ignoré"""
+        try:
+            self.supabase.table('knowledge')\
+                .upsert(rows, on_conflict='content_hash', ignore_duplicates=True)\
+                .execute()
+            return True
+        except Exception as e:
+            print(f"Erreur insertion connaissances (lot de {len(rows)}): {e}")
+            return False
+    
+    def delete_knowledge(self, doc_ids: List[int]) -> bool:
+        """Supprime des chunks devenus obsolètes"""
+        if not doc_ids:
+            return True
+        try:
+            self.supabase.table('knowledge').delete().in_('id', list(doc_ids)).execute()
+            return True
+        except Exception as e:
+            print(f"Erreur suppression connaissances: {e}")
+            return False
\ No newline at end of file
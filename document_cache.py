@@ -0,0 +1,69 @@
+"""
+Cache en mémoire du texte des documents de la base de connaissances (id -> texte)
+La recherche ne transfère que les métadonnées ; le texte n'est chargé que pour les
+documents retenus pour le contexte, puis gardé ici
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+from metrics import REGISTRY
+
+DOCUMENT_CACHE_HITS = REGISTRY.counter('bot_document_cache_hits_total', "Textes de documents servis depuis la mémoire")
+DOCUMENT_CACHE_MISSES = REGISTRY.counter('bot_document_cache_misses_total', "Textes de documents chargés depuis Supabase")
+
+
+class DocumentTextCache:
+    """LRU borné en nombre d'entrées, avec expiration (le texte d'un document peut être corrigé)"""
+
+    def __init__(self, max_entries: int = 2000, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # id -> (texte, instant d'insertion)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, doc_ids: Iterable[int]) -> Dict[int, str]:
+        """Textes connus et encore valides parmi `doc_ids`"""
+        doc_ids = list(doc_ids)
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for doc_id in doc_ids:
+                entry = self._entries.get(doc_id)
+                if entry is None:
+                    continue
+                text, stored_at = entry
+                if self.ttl and now - stored_at > self.ttl:
+                    del self._entries[doc_id]
+                    continue
+                self._entries.move_to_end(doc_id)
+                found[doc_id] = text
+        DOCUMENT_CACHE_HITS.inc(len(found))
+        DOCUMENT_CACHE_MISSES.inc(len(doc_ids) - len(found))
+        return found
+
+    def put_many(self, texts: Dict[int, str]):
+        now = time.monotonic()
+        with self._lock:
+            for doc_id, text in texts.items():
+                self._entries[doc_id] = (text, now)
+                self._entries.move_to_end(doc_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, doc_ids: Iterable[int]):
+        """Oublie des documents modifiés ou supprimés"""
+        with self._lock:
+            for doc_id in doc_ids:
+                self._entries.pop(doc_id, None)
+
+    def get(self, doc_id: int) -> Optional[str]:
+        return self.get_many([doc_id]).get(doc_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
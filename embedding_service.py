@@ -0,0 +1,192 @@
+"""
+Service d'embeddings : micro-batching des requêtes concurrentes, cache LRU des questions
+normalisées et backends interchangeables (PyTorch, PyTorch int8, ONNX Runtime), CPU uniquement
+"""
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List
+import numpy as np
+from metrics import REGISTRY, startup_timer
+
+EMBEDDING_REQUESTS = REGISTRY.counter('bot_embedding_requests_total', "Demandes d'embedding")
+EMBEDDING_CACHE_HITS = REGISTRY.counter('bot_embedding_cache_hits_total', "Embeddings servis depuis le cache")
+EMBEDDING_CACHE_ENTRIES = REGISTRY.gauge('bot_embedding_cache_entries', "Embeddings gardés en cache")
+EMBEDDING_BATCH_SIZE = REGISTRY.histogram(
+    'bot_embedding_batch_size', "Nombre de textes par appel encode()",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+EMBEDDING_ENCODE_SECONDS = REGISTRY.histogram('bot_embedding_encode_seconds', "Durée d'un appel encode()")
+
+# Fichier ONNX quantifié int8 publié avec sentence-transformers/all-MiniLM-L6-v2
+ONNX_INT8_FILE = "onnx/model_quint8_avx2.onnx"
+
+
+class SentenceTransformerBackend:
+    """Backend PyTorch, optionnellement quantifié dynamiquement en int8"""
+
+    def __init__(self, model_name: str, quantize: bool = False):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device='cpu')
+        if quantize:
+            import torch
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True, show_progress_bar=False)
+
+
+class ONNXBackend(SentenceTransformerBackend):
+    """Backend ONNX Runtime (sentence-transformers >= 3.2 avec le extra [onnx])"""
+
+    def __init__(self, model_name: str, quantize: bool = False):
+        from sentence_transformers import SentenceTransformer
+        model_kwargs = {'file_name': ONNX_INT8_FILE} if quantize else None
+        self.model = SentenceTransformer(model_name, device='cpu', backend='onnx', model_kwargs=model_kwargs)
+
+
+def create_backend(backend: str, model_name: str):
+    """EMBEDDING_BACKEND : "torch", "torch-int8", "onnx" ou "onnx-int8" """
+    if backend == 'torch':
+        return SentenceTransformerBackend(model_name)
+    if backend == 'torch-int8':
+        return SentenceTransformerBackend(model_name, quantize=True)
+    if backend == 'onnx':
+        return ONNXBackend(model_name)
+    if backend == 'onnx-int8':
+        return ONNXBackend(model_name, quantize=True)
+    raise ValueError(f"Backend d'embedding inconnu: {backend}")
+
+
+def normalize_query(text: str) -> str:
+    """Clé de cache (casse et espaces) ; le modèle reçoit toujours le texte d'origine"""
+    return ' '.join(text.lower().split())
+
+
+class EmbeddingService:
+    """
+    Les appels concurrents à encode() arrivant dans la même fenêtre (batch_window_ms)
+    sont regroupés en un seul appel au backend
+    Le backend (et donc le modèle) n'est construit qu'au premier besoin
+    """
+
+    def __init__(self, backend_factory: Callable[[], object], batch_window_ms: float = 5,
+                 max_batch_size: int = 32, cache_size: int = 2048):
+        self._backend_factory = backend_factory
+        self._backend = None
+        self._backend_lock = threading.Lock()
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._requests: queue.Queue = queue.Queue()
+        self._encoded = 0
+        self._batches = 0
+        self._encode_time = 0.0
+        EMBEDDING_CACHE_ENTRIES.set_function(lambda: len(self._cache))
+        self._thread = threading.Thread(target=self._batch_loop, name='embedding-batcher', daemon=True)
+        self._thread.start()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    with startup_timer('embedding_model'):
+                        self._backend = self._backend_factory()
+        return self._backend
+
+    def prewarm(self):
+        """Charge le modèle et exécute un premier encode (initialisation des poids et des noyaux)"""
+        self.backend.encode(["préchauffage"])
+
+    def encode(self, text: str) -> List[float]:
+        """Embedding d'un texte (bloquant, thread-safe)"""
+        return self.encode_many([text])[0]
+
+    def encode_many(self, texts: List[str]) -> List[List[float]]:
+        keys = [normalize_query(t) for t in texts]
+        EMBEDDING_REQUESTS.inc(len(keys))
+
+        results: Dict[str, List[float]] = {}
+        pending: Dict[str, Future] = {}
+        with self._cache_lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    results[key] = self._cache[key]
+                    EMBEDDING_CACHE_HITS.inc()
+
+        for key, text in zip(keys, texts):
+            if key not in results and key not in pending:
+                future = Future()
+                self._requests.put((key, text, future))
+                pending[key] = future
+
+        for key, future in pending.items():
+            results[key] = future.result()
+
+        return [results[key] for key in keys]
+
+    def _batch_loop(self):
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        # Dédoublonnage : une même question ne passe qu'une fois dans le modèle (premier texte reçu)
+        futures_by_key: Dict[str, List[Future]] = OrderedDict()
+        text_by_key: Dict[str, str] = {}
+        for key, text, future in batch:
+            futures_by_key.setdefault(key, []).append(future)
+            text_by_key.setdefault(key, text)
+        keys = list(futures_by_key.keys())
+        texts = [text_by_key[key] for key in keys]
+
+        started = time.perf_counter()
+        try:
+            vectors = self.backend.encode(texts)
+        except Exception as e:
+            for futures in futures_by_key.values():
+                for future in futures:
+                    future.set_exception(e)
+            return
+        elapsed = time.perf_counter() - started
+
+        EMBEDDING_BATCH_SIZE.observe(len(texts))
+        EMBEDDING_ENCODE_SECONDS.observe(elapsed)
+        self._encoded += len(texts)
+        self._batches += 1
+        self._encode_time += elapsed
+
+        with self._cache_lock:
+            for key, vector in zip(keys, vectors):
+                embedding = vector.tolist()
+                self._cache[key] = embedding
+                self._cache.move_to_end(key)
+                for future in futures_by_key[key]:
+                    future.set_result(embedding)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def stats(self) -> Dict:
+        return {
+            'requests': EMBEDDING_REQUESTS.value(),
+            'cache_hits': EMBEDDING_CACHE_HITS.value(),
+            'cache_entries': len(self._cache),
+            'batches': self._batches,
+            'avg_batch_size': self._encoded / self._batches if self._batches else 0.0,
+            'throughput_per_s': self._encoded / self._encode_time if self._encode_time else 0.0,
+        }
@@ -1,11 +1,72 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait, FIRST_COMPLETED
 import google.generativeai as genai
-from typing import List, Dict
-from config import GEMINI_API_KEY
+from typing import List, Dict, Iterator, Optional
+from config import (
+    GEMINI_API_KEY, GEMINI_MODEL, GEMINI_API_ENDPOINT,
+    GEMINI_RPM, GEMINI_TPM, GEMINI_MAX_CONCURRENCY,
+    GEMINI_MAX_RETRIES, GEMINI_RETRY_BASE_DELAY, GEMINI_RETRY_MAX_DELAY,
+    GEMINI_ATTEMPT_TIMEOUT, GEMINI_REQUEST_DEADLINE, GEMINI_HEDGE_AFTER,
+    LLM_EXECUTOR_WORKERS, CHARS_PER_TOKEN
+)
+from metrics import REGISTRY
+from llm_limiter import RateLimiter, RetryPolicy
+from prompt_builder import PromptBuilder, SYSTEM_INSTRUCTION, NO_CONTEXT_INSTRUCTION
+
+LLM_TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    'bot_llm_time_to_first_token_seconds', "Délai avant le premier fragment de réponse Gemini (streaming)"
+)
+LLM_PROMPT_TOKENS = REGISTRY.histogram(
+    'bot_llm_prompt_tokens', "Tokens d'entrée facturés par requête Gemini (hors préfixe en cache)",
+    buckets=(100, 250, 500, 1000, 2000, 4000, 8000)
+)
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    'bot_llm_request_seconds', "Durée d'un appel Gemini, attente du quota et nouvelles tentatives comprises"
+)
+LLM_RETRIES = REGISTRY.counter('bot_llm_retries_total', "Nouvelles tentatives d'appel Gemini (par type d'erreur)")
+LLM_HEDGES = REGISTRY.counter('bot_llm_hedges_total', "Requêtes de couverture Gemini (envoyées, gagnantes)")
+
+# Réponses de repli quand Gemini échoue (à ne jamais mettre en cache)
+FALLBACK_RESPONSE = "Désolé, je n'ai pas pu traiter ta demande. Peux-tu reformuler ta question ?"
+NO_CONTEXT_FALLBACK_RESPONSE = """Je n'ai pas trouvé d'information spécifique sur ta question dans ma base de connaissances.
+
+Peux-tu essayer de:
+• Reformuler ta question
+• Être plus spécifique (mentionner un candidat ou un sujet précis)
+• Poser une question sur les programmes, positions, ou procédures électorales
+
+Je suis là pour t'aider ! 🗳️"""
+
+# Ajouté à une réponse en streaming coupée après le premier fragment (jamais mise en cache)
+INTERRUPTED_NOTICE = "\n\n⚠️ Réponse interrompue : la génération s'est arrêtée avant la fin. Tu peux reposer ta question."
+
+
+class StreamInterrupted(Exception):
+    """Le flux a échoué après avoir produit du texte : la réponse publiée est incomplète"""
+
 
 class GeminiClient:
     def __init__(self):
-        genai.configure(api_key=GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        configure_kwargs = {'api_key': GEMINI_API_KEY}
+        if GEMINI_API_ENDPOINT:
+            # Faux serveur local ou proxy : API REST sur un autre hôte
+            configure_kwargs.update(transport='rest', client_options={'api_endpoint': GEMINI_API_ENDPOINT})
+        genai.configure(**configure_kwargs)
+        # Modèles longue durée : les instructions statiques ne sont plus renvoyées dans chaque prompt
+        self.model = genai.GenerativeModel(GEMINI_MODEL, system_instruction=SYSTEM_INSTRUCTION)
+        self.no_context_model = genai.GenerativeModel(GEMINI_MODEL, system_instruction=NO_CONTEXT_INSTRUCTION)
+        # Modèle nu pour compter les tokens d'un texte seul
+        self.counter_model = genai.GenerativeModel(GEMINI_MODEL)
+        self.prompt_builder = PromptBuilder()
+        
+        self.limiter = RateLimiter(GEMINI_RPM, GEMINI_TPM, GEMINI_MAX_CONCURRENCY)
+        self.retry_policy = RetryPolicy(GEMINI_MAX_RETRIES, GEMINI_RETRY_BASE_DELAY, GEMINI_RETRY_MAX_DELAY)
+        # Pool dédié aux requêtes de couverture (la requête initiale y tourne aussi pour pouvoir l'attendre)
+        self._hedge_executor = None
+        if GEMINI_HEDGE_AFTER > 0:
+            self._hedge_executor = ThreadPoolExecutor(
+                max_workers=2 * LLM_EXECUTOR_WORKERS, thread_name_prefix='gemini-hedge'
+            )
         
     def generate_response(self, user_question: str, context: str = "", 
                          conversation_history: List[Dict] = None) -> str:
@@ -13,116 +74,215 @@ class GeminiClient:
         Génère une réponse en utilisant Gemini 1.5 Flash
         """
         try:
-            # Construire le prompt système
-            system_prompt = self._build_system_prompt()
-            
-            # Construire le contexte de conversation
-            conversation_context = self._build_conversation_context(conversation_history)
-            
-            # Construire le prompt complet
-            full_prompt = f"""
-{system_prompt}
-
-{conversation_context}
-
-CONTEXTE DOCUMENTAIRE:
-{context if context else "Aucun document spécifique trouvé dans la base de connaissances."}
-
-QUESTION DE L'UTILISATEUR: {user_question}
-
-RÉPONSE:"""
+            contents = self.prompt_builder.build_contents(user_question, context, conversation_history)
             
             # Générer la réponse
-            response = self.model.generate_content(
-                full_prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.3,  # Réponses plus factuelles
-                    max_output_tokens=1000,
-                    top_p=0.9,
-                )
+            response = self._generate(
+                self.model, contents, self._response_generation_config(), SYSTEM_INSTRUCTION
             )
             
             return response.text.strip()
             
         except Exception as e:
             print(f"Erreur Gemini: {e}")
-            return "Désolé, je n'ai pas pu traiter ta demande. Peux-tu reformuler ta question ?"
+            return FALLBACK_RESPONSE
     
-    def _build_system_prompt(self) -> str:
-        """Construit le prompt système pour Gemini"""
-        return """Tu es un assistant spécialisé dans les élections présidentielles françaises. 
-
-RÔLE:
-- Tu fournis des informations factuelles et objectives sur les élections
-- Tu présentes les positions des candidats de manière neutre
-- Tu peux comparer les programmes sans prendre parti
-- Tu expliques les procédures électorales
-
-INSTRUCTIONS:
-- Base-toi PRIORITAIREMENT sur le contexte documentaire fourni
-- Si l'information n'est pas dans le contexte, dis-le clairement
-- Reste neutre et objectif, ne prends pas position
-- Cite les sources quand possible
-- Réponse en français, style conversationnel mais informatif
-- Évite les réponses trop longues (max 800 mots)
-
-INTERDICTIONS:
-- Ne pas inventer d'informations
-- Ne pas donner de conseils de vote
-- Ne pas exprimer d'opinions politiques personnelles
-- Ne pas faire de propaganda pour un candidat"""
+    def generate_response_stream(self, user_question: str, context: str = "",
+                                 conversation_history: List[Dict] = None) -> Iterator[str]:
+        """
+        Version streaming de generate_response : produit les fragments de texte
+        au fil de la génération (appel bloquant, à consommer depuis un thread)
+        Les nouvelles tentatives ne sont possibles qu'avant le premier fragment ; un échec
+        après le premier fragment lève StreamInterrupted une fois le texte reçu produit
+        """
+        started = time.perf_counter()
+        deadline = time.monotonic() + GEMINI_REQUEST_DEADLINE
+        received = False
+        try:
+            contents = self.prompt_builder.build_contents(user_question, context, conversation_history)
+            model = self.model
+            estimated = self._estimate_tokens(contents, SYSTEM_INSTRUCTION)
+            attempt = 0
+            
+            while True:
+                self.limiter.acquire(estimated, deadline)
+                actual = None
+                try:
+                    response = model.generate_content(
+                        contents,
+                        generation_config=self._response_generation_config(),
+                        stream=True,
+                        request_options={'timeout': self._attempt_timeout(deadline)}
+                    )
+                    
+                    for chunk in response:
+                        text = chunk.text
+                        if not text:
+                            continue
+                        if not received:
+                            LLM_TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - started)
+                            received = True
+                        yield text
+                    actual = self._observe_usage(response)
+                    LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, call='stream', outcome='ok')
+                    return
+                except Exception as e:
+                    attempt += 1
+                    if received or not self._wait_before_retry(e, attempt, deadline):
+                        raise
+                finally:
+                    self.limiter.release(estimated, actual)
+                
+        except Exception as e:
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, call='stream', outcome='error')
+            print(f"Erreur Gemini (streaming): {e}")
+            if not received:
+                yield FALLBACK_RESPONSE
+            else:
+                raise StreamInterrupted(str(e)) from e
     
-    def _build_conversation_context(self, history: List[Dict]) -> str:
-        """Construit le contexte de conversation"""
-        if not history:
-            return ""
-        
-        context_parts = ["HISTORIQUE DE LA CONVERSATION:"]
+    def _generate(self, model, contents: List[Dict], generation_config, instruction: str, call: str = 'generate'):
+        """Appel non streaming : quota, nouvelles tentatives, échéance et couverture éventuelle"""
+        started = time.perf_counter()
+        deadline = time.monotonic() + GEMINI_REQUEST_DEADLINE
+        estimated = self._estimate_tokens(contents, instruction)
+        try:
+            if self._hedge_executor is None:
+                response = self._call_with_retries(model, contents, generation_config, estimated, deadline)
+            else:
+                response = self._hedged_call(model, contents, generation_config, estimated, deadline)
+        except Exception:
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, call=call, outcome='error')
+            raise
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, call=call, outcome='ok')
+        return response
+    
+    def _call_with_retries(self, model, contents, generation_config, estimated: float, deadline: float):
+        attempt = 0
+        while True:
+            try:
+                return self._attempt(model, contents, generation_config, estimated, deadline)
+            except Exception as e:
+                attempt += 1
+                if not self._wait_before_retry(e, attempt, deadline):
+                    raise
+    
+    def _attempt(self, model, contents, generation_config, estimated: float, deadline: float,
+                 acquired: bool = False):
+        """Une tentative, dans le quota (déjà réservé si `acquired`)"""
+        if not acquired:
+            self.limiter.acquire(estimated, deadline)
+        actual = None
+        try:
+            response = model.generate_content(
+                contents,
+                generation_config=generation_config,
+                request_options={'timeout': self._attempt_timeout(deadline)}
+            )
+            actual = self._observe_usage(response)
+            return response
+        finally:
+            self.limiter.release(estimated, actual)
+    
+    def _hedged_call(self, model, contents, generation_config, estimated: float, deadline: float):
+        """
+        Lance une seconde requête si la première tarde, et garde la première réponse valide
+        La couverture n'est envoyée que s'il reste du quota sans attendre
+        """
+        primary = self._hedge_executor.submit(
+            self._call_with_retries, model, contents, generation_config, estimated, deadline
+        )
+        try:
+            return primary.result(timeout=GEMINI_HEDGE_AFTER)
+        except FutureTimeout:
+            pass
         
-        # Prendre les 3 derniers échanges pour garder le contexte récent
-        for exchange in history[-3:]:
-            context_parts.append(f"User: {exchange['user_message']}")
-            context_parts.append(f"Assistant: {exchange['bot_response']}")
+        if not self.limiter.try_acquire(estimated):
+            return primary.result()
         
-        context_parts.append("")  # Ligne vide
-        return '\n'.join(context_parts)
+        LLM_HEDGES.inc(outcome='sent')
+        hedge = self._hedge_executor.submit(
+            self._attempt, model, contents, generation_config, estimated, deadline, True
+        )
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        LLM_HEDGES.inc(outcome='won')
+                    # La requête perdante se termine en arrière-plan (appel HTTP non annulable)
+                    return future.result()
+                error = future.exception()
+        raise error
+    
+    def _wait_before_retry(self, error: Exception, attempt: int, deadline: float) -> bool:
+        """Attend avant une nouvelle tentative ; False si l'erreur est définitive ou l'échéance trop proche"""
+        if attempt > self.retry_policy.max_retries or not self.retry_policy.is_retryable(error):
+            return False
+        delay = self.retry_policy.backoff(attempt)
+        if time.monotonic() + delay >= deadline:
+            return False
+        LLM_RETRIES.inc(reason=type(error).__name__)
+        print(f"Gemini: nouvelle tentative {attempt}/{self.retry_policy.max_retries} dans {delay:.2f}s ({error})")
+        time.sleep(delay)
+        return True
+    
+    def _attempt_timeout(self, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("échéance de la requête Gemini dépassée")
+        return min(GEMINI_ATTEMPT_TIMEOUT, remaining)
+    
+    def _estimate_tokens(self, contents: List[Dict], instruction: str) -> float:
+        """Estimation des tokens d'entrée pour le seau TPM (corrigée avec usage_metadata)"""
+        chars = len(instruction) + sum(len(part) for turn in contents for part in turn['parts'])
+        return chars / CHARS_PER_TOKEN
+    
+    def _observe_usage(self, response) -> Optional[int]:
+        """Exporte le nombre de tokens d'entrée facturés et le retourne (None si inconnu)"""
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is None:
+            return None
+        prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+        cached_tokens = getattr(usage, 'cached_content_token_count', 0) or 0
+        if not prompt_tokens:
+            return None
+        LLM_PROMPT_TOKENS.observe(prompt_tokens - cached_tokens)
+        return prompt_tokens
+    
+    def _response_generation_config(self):
+        return genai.types.GenerationConfig(
+            temperature=0.3,  # Réponses plus factuelles
+            max_output_tokens=1000,
+            top_p=0.9,
+        )
+    
+    def count_tokens(self, text: str) -> Optional[int]:
+        """Nombre exact de tokens selon le tokenizer de Gemini (appel réseau)"""
+        try:
+            return self.counter_model.count_tokens(text).total_tokens
+        except Exception as e:
+            print(f"Erreur comptage tokens Gemini: {e}")
+            return None
     
     def generate_no_context_response(self, user_question: str) -> str:
         """
         Génère une réponse quand aucun contexte n'est trouvé
         """
-        prompt = f"""
-Tu es un assistant pour les élections présidentielles. L'utilisateur te pose cette question:
-
-"{user_question}"
-
-Malheureusement, tu n'as trouvé aucune information spécifique dans ta base de connaissances pour répondre à cette question.
-
-Réponds poliment en:
-1. Reconnaissant que tu n'as pas l'information spécifique
-2. Suggérant de reformuler la question ou d'être plus spécifique
-3. Proposant des sujets connexes que tu pourrais couvrir
-4. Restant encourageant et utile
-
-Garde un ton amical et professionnel.
-"""
-        
         try:
-            response = self.model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
+            response = self._generate(
+                self.no_context_model,
+                self.prompt_builder.build_no_context_contents(user_question),
+                genai.types.GenerationConfig(
                     temperature=0.5,
                     max_output_tokens=300,
-                )
+                ),
+                NO_CONTEXT_INSTRUCTION,
+                call='no_context'
             )
             return response.text.strip()
         except Exception as e:
             print(f"Erreur Gemini (no context): {e}")
-            return """Je n'ai pas trouvé d'information spécifique sur ta question dans ma base de connaissances.
-
-Peux-tu essayer de:
-• Reformuler ta question
-• Être plus spécifique (mentionner un candidat ou un sujet précis)
-• Poser une question sur les programmes, positions, ou procédures électorales
-
-Je suis là pour t'aider ! 🗳️"""
\ No newline at end of file
+            return NO_CONTEXT_FALLBACK_RESPONSE
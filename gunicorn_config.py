@@ -3,7 +3,9 @@ import os
 
 # Serveur
 bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
-workers = 1  # Important : 1 seul worker pour éviter les conflits avec le bot Telegram
+# Plusieurs workers : définir SHARED_STORE_URL (cache, quota Gemini) et WEBHOOK_REGISTRATION
+# à "leader" ou "external" pour que le webhook ne soit enregistré qu'une fois
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
 threads = 2  # Plusieurs threads par worker pour gérer les requêtes concurrentes
 
 # Timeouts
@@ -17,7 +19,9 @@ errorlog = "-"   # Logs d'erreur sur stderr
 capture_output = True
 
 # Performance
-preload_app = True  # Charger l'app avant de forker les workers
+# Pas de préchargement : la boucle asyncio et les threads du bot ne survivent pas au fork,
+# chaque worker initialise sa propre application
+preload_app = False
 max_requests = 1000  # Redémarrer le worker après N requêtes
 max_requests_jitter = 100
 
@@ -26,8 +30,20 @@ proc_name = "election-bot"
 
 # Worker class
 worker_class = "sync"  # Utiliser les workers synchrones avec threading
+# Mode ASGI : -k uvicorn.workers.UvicornWorker asgi:application (threads ignorés)
 
 # Hooks
+def _flush_pending_writes(log):
+    """Écrit les conversations encore dans le tampon d'écriture différée"""
+    try:
+        from database import get_write_buffer_if_started
+        write_buffer = get_write_buffer_if_started()
+        if write_buffer is not None:
+            write_buffer.close()
+            log.info("💾 Conversations en attente écrites")
+    except Exception as e:
+        log.error(f"Erreur écriture des conversations en attente: {e}")
+
 def on_starting(server):
     """Appelé au démarrage du serveur"""
     server.log.info("🤖 Démarrage du serveur Election Bot...")
@@ -39,7 +55,13 @@ def on_reload(server):
 def worker_int(worker):
     """Appelé quand un worker reçoit SIGINT"""
     worker.log.info("🛑 Arrêt du worker demandé...")
+    _flush_pending_writes(worker.log)
+
+def worker_exit(server, worker):
+    """Appelé à la sortie d'un worker"""
+    _flush_pending_writes(worker.log)
 
 def on_exit(server):
     """Appelé à l'arrêt du serveur"""
+    _flush_pending_writes(server.log)
     server.log.info("👋 Arrêt du serveur Election Bot")
\ No newline at end of file
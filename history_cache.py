@@ -0,0 +1,163 @@
+"""
+Cache en mémoire de l'historique des conversations : un tampon circulaire par chat,
+budget mémoire global et éviction LRU entre les chats
+Avec plusieurs workers, un numéro de version par chat dans le stockage partagé signale
+les échanges écrits par un autre processus (le tampon local est alors rechargé)
+La version n'est incrémentée (publish) qu'une fois l'insertion faite dans Supabase :
+un autre worker qui recharge le chat y trouve donc les échanges annoncés
+"""
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+from metrics import REGISTRY
+
+HISTORY_CACHE_HITS = REGISTRY.counter('bot_history_cache_hits_total', "Historiques servis depuis la mémoire")
+HISTORY_CACHE_MISSES = REGISTRY.counter('bot_history_cache_misses_total', "Historiques chargés depuis Supabase")
+HISTORY_CACHE_BYTES = REGISTRY.gauge('bot_history_cache_bytes', "Taille estimée du cache d'historique")
+
+# Surcoût approximatif d'un échange (dict, deque, horodatage)
+_EXCHANGE_OVERHEAD = 200
+
+# Durée de vie des numéros de version dans le stockage partagé (une version expirée = rechargement)
+VERSION_TTL = 24 * 3600
+
+
+def _exchange_size(exchange: Dict) -> int:
+    return (len(exchange.get('user_message') or '') + len(exchange.get('bot_response') or '')) * 2 \
+        + _EXCHANGE_OVERHEAD
+
+
+class ConversationHistoryCache:
+    def __init__(self, per_chat: int = 5, max_bytes: int = 16 * 1024 * 1024, store=None):
+        self.per_chat = per_chat
+        self.max_bytes = max_bytes
+        # chat_id -> deque des derniers échanges (du plus ancien au plus récent)
+        self._chats: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Stockage partagé entre workers (None : un seul processus, le tampon fait foi)
+        self.store = store
+        # chat_id -> version du tampon local (valeur du compteur partagé)
+        self._versions: Dict[int, Optional[str]] = {}
+        HISTORY_CACHE_BYTES.set_function(lambda: self._bytes)
+
+    def get(self, chat_id: int, limit: int) -> Optional[List[Dict]]:
+        """Derniers échanges du chat, ou None si le chat n'est pas (ou plus) en mémoire"""
+        if limit > self.per_chat:
+            # Le tampon ne conserve pas assez d'échanges pour répondre
+            HISTORY_CACHE_MISSES.inc()
+            return None
+        if self.store is not None and chat_id in self._chats \
+                and self._shared_version(chat_id) != self._versions.get(chat_id):
+            # Un autre worker a écrit dans ce chat
+            with self._lock:
+                self._remove(chat_id)
+        with self._lock:
+            exchanges = self._chats.get(chat_id)
+            if exchanges is None:
+                HISTORY_CACHE_MISSES.inc()
+                return None
+            self._chats.move_to_end(chat_id)
+            HISTORY_CACHE_HITS.inc()
+            return list(exchanges)[-limit:] if limit > 0 else []
+
+    def version(self, chat_id: int) -> Optional[str]:
+        """Version partagée du chat, à lire AVANT de charger l'historique depuis Supabase (voir warm)"""
+        return self._shared_version(chat_id) if self.store is not None else None
+
+    def warm(self, chat_id: int, history: List[Dict], version: Optional[str] = None):
+        """
+        Initialise le tampon d'un chat à partir de l'historique chargé depuis Supabase
+        `version` : valeur de version() lue avant le chargement ; une écriture publiée pendant
+        le chargement rend ce tampon périmé et il sera rechargé au prochain accès
+        """
+        exchanges = deque(
+            ({k: row.get(k) for k in ('user_message', 'bot_response', 'timestamp')} for row in history),
+            maxlen=self.per_chat
+        )
+        with self._lock:
+            self._remove(chat_id)
+            self._chats[chat_id] = exchanges
+            self._versions[chat_id] = version
+            self._bytes += sum(_exchange_size(e) for e in exchanges)
+            self._evict()
+
+    def append(self, chat_id: int, exchange: Dict):
+        """
+        Ajoute un échange à un chat déjà en mémoire (sinon il sera chargé au prochain accès)
+        Les autres workers ne sont prévenus qu'après l'insertion en base : voir publish
+        """
+        entry = {k: exchange.get(k) for k in ('user_message', 'bot_response', 'timestamp')}
+        with self._lock:
+            exchanges = self._chats.get(chat_id)
+            if exchanges is None:
+                return
+            if len(exchanges) == exchanges.maxlen:
+                self._bytes -= _exchange_size(exchanges[0])
+            exchanges.append(entry)
+            self._bytes += _exchange_size(entry)
+            self._chats.move_to_end(chat_id)
+            self._evict()
+
+    def publish(self, chat_ids):
+        """Échanges de ces chats insérés dans Supabase : nouvelle version pour les autres workers"""
+        if self.store is None:
+            return
+        for chat_id in set(chat_ids):
+            self._bump_version(chat_id)
+
+    def clear(self, chat_id: int):
+        """Historique effacé : le chat reste connu, avec un tampon vide"""
+        with self._lock:
+            self._remove(chat_id)
+            self._chats[chat_id] = deque(maxlen=self.per_chat)
+        if self.store is not None:
+            self._bump_version(chat_id, reset=True)
+
+    def _shared_version(self, chat_id: int) -> Optional[str]:
+        try:
+            return self.store.get(f"history:{chat_id}")
+        except Exception as e:
+            print(f"Erreur lecture version historique: {e}")
+            return '?'
+
+    def _bump_version(self, chat_id: int, reset: bool = False) -> bool:
+        """
+        Incrémente la version partagée du chat ; False si le tampon local doit être abandonné
+        (autre écriture entre-temps, ou stockage indisponible)
+        """
+        try:
+            version = self.store.incr(f"history:{chat_id}", ttl=VERSION_TTL)
+        except Exception as e:
+            print(f"Erreur écriture version historique: {e}")
+            with self._lock:
+                self._remove(chat_id)
+            return False
+        with self._lock:
+            previous = self._versions.get(chat_id)
+            if not reset and chat_id in self._chats and previous != str(version - 1) \
+                    and not (previous is None and version == 1):
+                self._remove(chat_id)
+                return False
+            if chat_id in self._chats:
+                self._versions[chat_id] = str(version)
+        return True
+
+    def _remove(self, chat_id: int):
+        self._versions.pop(chat_id, None)
+        exchanges = self._chats.pop(chat_id, None)
+        if exchanges:
+            self._bytes -= sum(_exchange_size(e) for e in exchanges)
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._chats) > 1:
+            _, exchanges = self._chats.popitem(last=False)
+            self._bytes -= sum(_exchange_size(e) for e in exchanges)
+
+    def stats(self) -> Dict:
+        return {
+            'chats': len(self._chats),
+            'bytes': self._bytes,
+            'hits': HISTORY_CACHE_HITS.value(),
+            'misses': HISTORY_CACHE_MISSES.value(),
+        }
@@ -0,0 +1,382 @@
+"""
+Ingestion des programmes des candidats dans la table knowledge
+Documents PDF, HTML ou Markdown découpés par section, mots-clés calculés avec le même
+pipeline que les questions (generate_document_keywords), embeddings encodés par lots sur
+tous les cœurs CPU, puis insérés en masse dans Supabase
+
+Chaque chunk porte une empreinte de son contenu (content_hash) : quand un programme est
+mis à jour, seuls les chunks nouveaux ou modifiés sont encodés et insérés, les chunks
+disparus sont supprimés ensuite
+
+Colonne requise en plus du schéma existant :
+    alter table knowledge add column content_hash text;
+    create unique index knowledge_content_hash on knowledge (content_hash);
+
+Usage : python ingest.py programmes/ [--candidate "Cabral Libii"] [--source-base https://...]
+                         [--workers N] [--dry-run]
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+import time
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from config import EMBEDDING_BACKEND, EMBEDDING_MODEL, TOKENIZER
+from text_processing import extract_candidate_mentions, generate_document_keywords
+
+SUPPORTED_SUFFIXES = {'.pdf', '.html', '.htm', '.md', '.markdown', '.txt'}
+
+# Taille d'un chunk : quelques paragraphes, assez court pour que plusieurs tiennent dans le contexte
+CHUNK_MAX_CHARS = 1500
+# Dernière phrase répétée en tête du chunk suivant (au plus ce nombre de caractères)
+CHUNK_OVERLAP_CHARS = 200
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s+")
+_MARKDOWN_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_MARKDOWN_LINK_RE = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+_NUMBERED_HEADING_RE = re.compile(r"^(\d+(\.\d+)*|[IVX]+)[.)]?\s+\S")
+_MARKDOWN_BULLET_RE = re.compile(r"^\s*([-*+]|\d+[.)])\s+")
+BULLET = '• '
+
+Section = Tuple[str, str]   # (titre, texte)
+
+
+# ===== LECTURE DES DOCUMENTS =====
+
+def read_markdown(path: Path) -> List[Section]:
+    sections = []
+    title, lines = path.stem, []
+    for line in path.read_text(encoding='utf-8').splitlines():
+        heading = _MARKDOWN_HEADING_RE.match(line)
+        if heading:
+            sections.append((title, '\n'.join(lines)))
+            title, lines = heading.group(2).strip(), []
+            continue
+        line = _MARKDOWN_LINK_RE.sub(r"\1", line).replace('**', '').replace('__', '')
+        line = _MARKDOWN_BULLET_RE.sub(BULLET, line.lstrip('> ')).rstrip()
+        lines.append(line)
+    sections.append((title, '\n'.join(lines)))
+    return sections
+
+
+class _HTMLSectionParser(HTMLParser):
+    """Sections délimitées par les titres h1-h4 ; scripts, styles et navigation ignorés"""
+
+    HEADINGS = {'h1', 'h2', 'h3', 'h4'}
+    SKIPPED = {'script', 'style', 'nav', 'header', 'footer', 'noscript'}
+    BLOCKS = {'p', 'div', 'br', 'tr', 'section', 'article', 'blockquote'}
+
+    def __init__(self, default_title: str):
+        super().__init__(convert_charrefs=True)
+        self.sections: List[Section] = []
+        self._title = default_title
+        self._parts: List[str] = []
+        self._heading: Optional[List[str]] = None
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED:
+            self._skip_depth += 1
+        elif tag in self.HEADINGS and not self._skip_depth:
+            self._heading = []
+        elif tag == 'li':
+            self._parts.append('\n' + BULLET)
+        elif tag in self.BLOCKS:
+            self._parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self.HEADINGS and self._heading is not None:
+            title = ' '.join(''.join(self._heading).split())
+            self._heading = None
+            if title:
+                self.close_section()
+                self._title = title
+        elif tag in self.BLOCKS:
+            self._parts.append('\n')
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if self._heading is not None:
+            self._heading.append(data)
+        else:
+            self._parts.append(data)
+
+    def close_section(self):
+        self.sections.append((self._title, ''.join(self._parts)))
+        self._parts = []
+
+
+def read_html(path: Path) -> List[Section]:
+    parser = _HTMLSectionParser(path.stem)
+    parser.feed(path.read_text(encoding='utf-8', errors='replace'))
+    parser.close()
+    parser.close_section()
+    return parser.sections
+
+
+def _looks_like_heading(line: str) -> bool:
+    """Titre de section dans un PDF : ligne courte, sans ponctuation finale, en capitales ou numérotée"""
+    if not line or len(line) > 80 or line[-1] in '.,;:':
+        return False
+    letters = [c for c in line if c.isalpha()]
+    return (len(letters) >= 3 and line.isupper()) or bool(_NUMBERED_HEADING_RE.match(line))
+
+
+def read_pdf(path: Path) -> List[Section]:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise ImportError("pypdf est requis pour ingérer des PDF (pip install pypdf)")
+
+    sections = []
+    title, lines = path.stem, []
+    for page in PdfReader(str(path)).pages:
+        for line in (page.extract_text() or '').splitlines():
+            line = line.strip()
+            if _looks_like_heading(line):
+                sections.append((title, '\n'.join(lines)))
+                title, lines = line, []
+            else:
+                lines.append(line)
+        lines.append('')
+    sections.append((title, '\n'.join(lines)))
+    return sections
+
+
+def read_document(path: Path) -> List[Section]:
+    """Sections non vides d'un document, selon son extension"""
+    suffix = path.suffix.lower()
+    if suffix == '.pdf':
+        sections = read_pdf(path)
+    elif suffix in ('.html', '.htm'):
+        sections = read_html(path)
+    else:
+        sections = read_markdown(path)
+    return [(title, text) for title, text in sections if text.strip()]
+
+
+# ===== DÉCOUPAGE =====
+
+def _paragraphs(text: str) -> List[str]:
+    """Paragraphes séparés par des lignes vides ; lignes jointes, sauf les éléments de liste"""
+    paragraphs = []
+    for block in re.split(r"\n\s*\n", text):
+        lines = []
+        for line in block.splitlines():
+            line = ' '.join(line.split())
+            if not line:
+                continue
+            if lines and not line.startswith(BULLET.strip()):
+                lines[-1] = f"{lines[-1]} {line}"
+            else:
+                lines.append(line)
+        if lines:
+            paragraphs.append('\n'.join(lines))
+    return paragraphs
+
+
+def chunk_section(text: str, max_chars: int = CHUNK_MAX_CHARS,
+                  overlap_chars: int = CHUNK_OVERLAP_CHARS) -> List[str]:
+    """
+    Découpe une section en chunks d'au plus max_chars, aux limites de paragraphes puis de phrases
+    La dernière phrase d'un chunk est reprise au début du suivant si elle est courte
+    """
+    # (texte, séparateur avec l'unité précédente)
+    units = []
+    for paragraph in _paragraphs(text):
+        if len(paragraph) <= max_chars:
+            units.append((paragraph, '\n\n'))
+        else:
+            sentences = [s for s in _SENTENCE_END_RE.split(paragraph) if s]
+            units.extend((s, '\n\n' if i == 0 else ' ') for i, s in enumerate(sentences))
+
+    chunks, current = [], ''
+    for unit, separator in units:
+        # Phrase plus longue qu'un chunk : coupée brutalement
+        while len(unit) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(unit[:max_chars])
+            unit = unit[max_chars:]
+        merged = f"{current}{separator}{unit}" if current else unit
+        if len(merged) <= max_chars:
+            current = merged
+            continue
+        chunks.append(current)
+        last_sentence = _SENTENCE_END_RE.split(current)[-1]
+        overlap = last_sentence if len(last_sentence) <= overlap_chars else ''
+        current = f"{overlap} {unit}" if overlap and len(overlap) + len(unit) < max_chars else unit
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def content_hash(candidate: str, source_link: str, section: str, text: str) -> str:
+    """
+    Empreinte d'un chunk : contenu et source (l'index unique est global à la table),
+    mais aussi modèle d'embedding et tokeniseur, pour qu'un changement de pipeline réencode tout
+    """
+    payload = '\x1f'.join([
+        EMBEDDING_MODEL, EMBEDDING_BACKEND, TOKENIZER,
+        candidate, source_link, section, ' '.join(text.split()),
+    ])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def build_chunks(path: Path, candidate: str, source_link: str,
+                 max_chars: int = CHUNK_MAX_CHARS) -> List[Dict]:
+    """Lignes knowledge d'un document (sans embedding ni mots-clés)"""
+    rows = []
+    seen = set()
+    for section, text in read_document(path):
+        for chunk in chunk_section(text, max_chars):
+            digest = content_hash(candidate, source_link, section, chunk)
+            if digest in seen:
+                continue
+            seen.add(digest)
+            rows.append({
+                'text': chunk,
+                'candidate': candidate,
+                'section': section,
+                'source_link': source_link,
+                'content_hash': digest,
+            })
+    return rows
+
+
+# ===== EMBEDDINGS =====
+
+def encode_texts(texts: List[str], workers: int, batch_size: int = 64) -> List[List[float]]:
+    """
+    Embeddings avec le modèle et le backend utilisés pour les questions
+    Plusieurs processus CPU (pool sentence-transformers) si le volume le justifie
+    """
+    from embedding_service import create_backend
+
+    if not texts:
+        return []
+    model = create_backend(EMBEDDING_BACKEND, EMBEDDING_MODEL).model
+    if workers > 1 and len(texts) > batch_size:
+        pool = model.start_multi_process_pool(target_devices=['cpu'] * workers)
+        try:
+            vectors = model.encode_multi_process(texts, pool, batch_size=batch_size)
+        finally:
+            model.stop_multi_process_pool(pool)
+    else:
+        vectors = model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+    return [vector.tolist() for vector in vectors]
+
+
+# ===== INGESTION =====
+
+def find_documents(paths: List[str]) -> List[Path]:
+    documents = []
+    for raw in paths:
+        path = Path(raw)
+        if path.is_dir():
+            documents.extend(sorted(p for p in path.rglob('*') if p.suffix.lower() in SUPPORTED_SUFFIXES))
+        elif path.suffix.lower() in SUPPORTED_SUFFIXES:
+            documents.append(path)
+        else:
+            print(f"⚠️ Ignoré (format non pris en charge): {path}")
+    return documents
+
+
+def resolve_candidate(path: Path, forced: Optional[str]) -> Optional[str]:
+    """Candidat forcé, sinon détecté dans le nom du fichier"""
+    if forced:
+        return forced
+    return extract_candidate_mentions(re.sub(r"[_\-.]+", ' ', path.stem))
+
+
+def plan_document(db, path: Path, candidate: str, source_link: str,
+                  max_chars: int) -> Tuple[List[Dict], List[int]]:
+    """Chunks à insérer (nouveaux ou modifiés) et IDs des chunks obsolètes d'un document"""
+    rows = build_chunks(path, candidate, source_link, max_chars)
+    existing = db.get_knowledge_hashes(source_link)
+    current = {row['content_hash'] for row in rows}
+    new_rows = [row for row in rows if row['content_hash'] not in existing]
+    stale_ids = [doc_id for digest, doc_id in existing.items() if digest not in current]
+    print(f"📄 {path.name} [{candidate}] : {len(rows)} chunks, {len(new_rows)} à insérer, "
+          f"{len(stale_ids)} obsolètes")
+    return new_rows, stale_ids
+
+
+def ingest(db, documents: List[Path], args) -> bool:
+    started = time.perf_counter()
+    new_rows: List[Dict] = []
+    stale_ids: List[int] = []
+    for path in documents:
+        candidate = resolve_candidate(path, args.candidate)
+        if candidate is None:
+            print(f"⚠️ Ignoré (candidat non reconnu, utiliser --candidate): {path}")
+            continue
+        source_link = args.source_link or (
+            f"{args.source_base.rstrip('/')}/{path.name}" if args.source_base else path.name
+        )
+        rows, stale = plan_document(db, path, candidate, source_link, args.max_chars)
+        new_rows.extend(rows)
+        stale_ids.extend(stale)
+
+    if args.dry_run or not (new_rows or stale_ids):
+        print(f"Rien d'écrit : {len(new_rows)} chunks à insérer, {len(stale_ids)} à supprimer")
+        return True
+
+    # Mots-clés : même normalisation que les questions (TOKENIZER)
+    for row in new_rows:
+        row['keywords'] = generate_document_keywords(f"{row['section']}\n{row['text']}")
+
+    encode_started = time.perf_counter()
+    embeddings = encode_texts([row['text'] for row in new_rows], args.workers, args.encode_batch_size)
+    for row, embedding in zip(new_rows, embeddings):
+        row['embedding'] = embedding
+    print(f"🧮 {len(new_rows)} embeddings en {time.perf_counter() - encode_started:.1f}s "
+          f"({args.workers} processus)")
+
+    for offset in range(0, len(new_rows), args.upsert_batch_size):
+        batch = new_rows[offset:offset + args.upsert_batch_size]
+        if not db.upsert_knowledge(batch):
+            # Les anciens chunks restent en place : la base n'est jamais à moitié vide
+            print("❌ Insertion interrompue, aucun chunk obsolète supprimé")
+            return False
+
+    if not db.delete_knowledge(stale_ids):
+        return False
+    print(f"✅ {len(new_rows)} chunks insérés, {len(stale_ids)} supprimés "
+          f"en {time.perf_counter() - started:.1f}s")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion des programmes des candidats dans la table knowledge")
+    parser.add_argument('paths', nargs='+', help="Fichiers ou dossiers (PDF, HTML, Markdown)")
+    parser.add_argument('--candidate', help="Candidat de tous les documents (défaut : détecté dans le nom du fichier)")
+    parser.add_argument('--source-link', help="Lien affiché dans les sources (un seul document)")
+    parser.add_argument('--source-base', help="Préfixe du lien de chaque document (URL publique du dossier)")
+    parser.add_argument('--max-chars', type=int, default=CHUNK_MAX_CHARS, help="Taille max d'un chunk")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Processus d'encodage")
+    parser.add_argument('--encode-batch-size', type=int, default=64)
+    parser.add_argument('--upsert-batch-size', type=int, default=200, help="Lignes par requête d'insertion")
+    parser.add_argument('--dry-run', action='store_true', help="Affiche le plan sans encoder ni écrire")
+    args = parser.parse_args()
+
+    documents = find_documents(args.paths)
+    if not documents:
+        print("Aucun document à ingérer")
+        return 1
+    if args.source_link and len(documents) > 1:
+        parser.error("--source-link ne s'utilise qu'avec un seul document (voir --source-base)")
+
+    from database import Database
+    return 0 if ingest(Database(), documents, args) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
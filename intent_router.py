@@ -0,0 +1,129 @@
+"""
+Routage des intentions avant la recherche : salutations, remerciements, aide et questions
+fréquentes reçoivent une réponse préparée, servie depuis la mémoire (ni Supabase, ni Gemini)
+Seules les questions ouvertes passent par le pipeline complet
+"""
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from config import ELECTION_DATE, HELP_MESSAGE, INTENT_MAX_WORDS
+from metrics import REGISTRY
+from text_processing import CANDIDATE_ALIASES, extract_all_candidate_mentions, fold_accents, is_greeting
+
+INTENTS_ROUTED = REGISTRY.counter('bot_intents_total', "Messages classés par le routeur d'intentions (open_question = pipeline complet)")
+
+OPEN_QUESTION = 'open_question'
+
+GREETING_ANSWER = "Salut ! 👋 Pose-moi tes questions sur les élections présidentielles !"
+
+THANKS_ANSWER = "Avec plaisir ! 😊 N'hésite pas si tu as d'autres questions sur les élections."
+
+HOW_TO_VOTE_ANSWER = """🗳️ Comment voter ?
+
+1. Être inscrit sur les listes électorales (inscription préalable obligatoire)
+2. Se rendre le jour du scrutin au bureau de vote où l'on est inscrit
+3. Présenter sa carte d'électeur et une pièce d'identité
+4. Prendre les bulletins, passer par l'isoloir, puis glisser l'enveloppe dans l'urne
+5. Signer la liste d'émargement
+
+Tu peux me demander le programme d'un candidat sur un sujet précis !"""
+
+
+def _election_date_answer() -> str:
+    return f"📅 L'élection présidentielle a lieu le {ELECTION_DATE}."
+
+
+def _candidate_list_answer() -> str:
+    names = '\n'.join(f"• {name}" for name in CANDIDATE_ALIASES)
+    return (
+        f"👥 Les {len(CANDIDATE_ALIASES)} candidats à l'élection présidentielle :\n\n{names}\n\n"
+        "Demande-moi le programme ou la position de l'un d'eux sur un sujet !"
+    )
+
+
+class Intent:
+    """
+    Intention reconnue par des règles (regex sur le texte sans accents)
+    `answer` : texte fixe ou fonction appelée à chaque réponse (réponse paramétrée)
+    """
+
+    def __init__(self, name: str, answer: Union[str, Callable[[], str]],
+                 patterns: Optional[List[str]] = None, matcher: Optional[Callable[[str], bool]] = None,
+                 max_words: int = INTENT_MAX_WORDS, allow_candidates: bool = False):
+        self.name = name
+        self.answer = answer
+        self.pattern = re.compile('|'.join(f"(?:{p})" for p in patterns)) if patterns else None
+        self.matcher = matcher
+        self.max_words = max_words
+        # Une question qui cite un candidat est une question ouverte ("comment voter pour X ?")
+        self.allow_candidates = allow_candidates
+
+    def matches(self, text: str, folded: str, word_count: int, has_candidates: bool) -> bool:
+        if word_count > self.max_words or (has_candidates and not self.allow_candidates):
+            return False
+        if self.matcher is not None:
+            return self.matcher(text)
+        return self.pattern.search(folded) is not None
+
+    def render(self) -> str:
+        return self.answer() if callable(self.answer) else self.answer
+
+
+DEFAULT_INTENTS = [
+    Intent('greeting', GREETING_ANSWER, matcher=is_greeting, allow_candidates=True),
+    # Remerciement seul : "Merci. Et Biya sur l'éducation ?" est une question ouverte
+    Intent('thanks', THANKS_ANSWER, patterns=[r"^(merci|thanks)( beaucoup| bien)?[\s!.]*$"]),
+    # Les réponses du pipeline sont envoyées sans parse_mode : pas de gras Markdown
+    Intent('help', HELP_MESSAGE.replace('**', ''), patterns=[r"^(aide|help)\W*$", r"\bque (peux|sais)-?tu faire\b"]),
+    Intent('how_to_vote', HOW_TO_VOTE_ANSWER, patterns=[
+        r"^comment (on )?vote[rz]?\b",
+        r"\bcomment (peut-on|puis-je|faire pour|dois-je) voter\b",
+        r"\bprocedure de vote\b",
+    ]),
+    Intent('election_date', _election_date_answer, patterns=[
+        # Fenêtre courte et mots entiers : "Quand les jeunes vont voter pour qui ?" est une question ouverte
+        r"\bquand\b.{0,30}\b(elections?|presidentielles?|scrutin)\b",
+        r"^quand (vote-t-on|votons-nous)\b",
+        r"\bdate (de l'|du |des )?(elections?|presidentielles?|scrutin|vote)\b",
+    ]),
+    Intent('candidate_list', _candidate_list_answer, patterns=[
+        r"\bliste des candidats\b",
+        r"\b(qui|quels) sont les candidats\b",
+        r"\bcombien (de|y a-t-il de) candidats\b",
+    ]),
+]
+
+
+class IntentRouter:
+    """Premier classifieur qui correspond ; None = question ouverte (recherche + LLM)"""
+
+    def __init__(self, intents: Optional[List[Intent]] = None):
+        self.intents = intents if intents is not None else DEFAULT_INTENTS
+        self._routed = 0
+        self._hits = 0
+        self._lock = threading.Lock()
+
+    def route(self, text: str) -> Optional[Tuple[str, str]]:
+        """Retourne (intention, réponse) pour le chemin rapide, ou None"""
+        folded = fold_accents(text).strip()
+        word_count = len(text.split())
+        has_candidates = bool(extract_all_candidate_mentions(text))
+
+        match = None
+        for intent in self.intents:
+            if intent.matches(text, folded, word_count, has_candidates):
+                match = (intent.name, intent.render())
+                break
+
+        INTENTS_ROUTED.inc(intent=match[0] if match else OPEN_QUESTION)
+        with self._lock:
+            self._routed += 1
+            self._hits += match is not None
+        return match
+
+    def stats(self) -> Dict:
+        return {
+            'routed': self._routed,
+            'fast_path': self._hits,
+            'hit_rate': round(self._hits / self._routed, 3) if self._routed else 0.0,
+        }
@@ -0,0 +1,132 @@
+"""
+Index inversé en mémoire pour la recherche par mots-clés
+mot-clé -> liste d'IDs de documents, partitionné par candidat
+"""
+import heapq
+import math
+from collections import defaultdict
+from typing import Dict, List, Optional
+from knowledge_index import KnowledgeIndex
+from text_processing import normalize_keyword
+
+# Toutes les partitions candidats confondues
+ALL_CANDIDATES = None
+
+
+class KeywordIndex(KnowledgeIndex):
+    """
+    Scoring entièrement local :
+    - "overlap" : proportion des mots-clés de la question présents dans le document (score historique)
+    - "bm25"    : BM25 sur les listes de mots-clés des documents (classement), le ratio reste
+                  disponible dans keyword_score pour le seuil de suffisance
+    """
+
+    name = "Index mots-clés"
+    columns = ['id', 'text', 'candidate', 'section', 'source_link', 'keywords']
+
+    def __init__(self, scoring: str = 'overlap', k1: float = 1.2, b: float = 0.75):
+        super().__init__()
+        self.scoring = scoring
+        self.k1 = k1
+        self.b = b
+        self._docs: Dict = {}
+        # candidat (ou ALL_CANDIDATES) -> mot-clé -> [IDs]
+        self._postings: Dict = defaultdict(lambda: defaultdict(list))
+        self._doc_lengths: Dict = {}
+        self._avg_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, rows: List[Dict]):
+        """Ajoute ou remplace des documents (clé : id)"""
+        with self._lock:
+            docs = dict(self._docs)
+            for row in rows:
+                if row.get('id') is None:
+                    continue
+                docs[row['id']] = {k: row.get(k) for k in self.columns}
+            self._rebuild(docs)
+            self._track_rows(rows)
+
+    def remove(self, doc_ids: List[int]):
+        """Retire des documents supprimés de la table"""
+        removed = set(doc_ids)
+        with self._lock:
+            docs = {doc_id: doc for doc_id, doc in self._docs.items() if doc_id not in removed}
+            if len(docs) != len(self._docs):
+                self._rebuild(docs)
+            self._forget(doc_ids)
+
+    def _load_snapshot(self, snapshot):
+        """Postings de l'instantané : vues mmap sur les IDs, sans renormaliser les mots-clés"""
+        postings = defaultdict(lambda: defaultdict(list))
+        for (candidate, keyword), doc_ids in snapshot.postings():
+            postings[candidate][keyword] = doc_ids
+        doc_lengths = dict(zip(snapshot.ids.tolist(), snapshot.keyword_counts.tolist()))
+
+        with self._lock:
+            self._docs = {row['id']: row for row in snapshot.rows}
+            self._postings = postings
+            self._doc_lengths = doc_lengths
+            self._avg_length = (sum(doc_lengths.values()) / len(doc_lengths)) if doc_lengths else 0.0
+
+    def _rebuild(self, docs: Dict):
+        postings = defaultdict(lambda: defaultdict(list))
+        doc_lengths = {}
+        for doc_id, doc in docs.items():
+            keywords = set(normalize_keyword(k) for k in (doc.get('keywords') or []))
+            doc_lengths[doc_id] = len(keywords)
+            for keyword in keywords:
+                postings[ALL_CANDIDATES][keyword].append(doc_id)
+                # Sans candidat, la partition serait ALL_CANDIDATES : pas de second posting
+                if doc.get('candidate') is not ALL_CANDIDATES:
+                    postings[doc.get('candidate')][keyword].append(doc_id)
+
+        self._docs = docs
+        self._postings = postings
+        self._doc_lengths = doc_lengths
+        self._avg_length = (sum(doc_lengths.values()) / len(doc_lengths)) if doc_lengths else 0.0
+
+    def search(self, keywords: List[str], candidate: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """Retourne les `limit` meilleurs documents, avec keyword_score (et bm25_score en mode BM25)"""
+        query = list(dict.fromkeys(normalize_keyword(k) for k in keywords if k))
+        if not query:
+            return []
+
+        # Lecture d'un état cohérent (les structures sont remplacées, jamais modifiées en place)
+        docs, postings, doc_lengths, avg_length = self._docs, self._postings, self._doc_lengths, self._avg_length
+        partition = postings.get(candidate if candidate else ALL_CANDIDATES)
+        if not partition:
+            return []
+
+        matches: Dict = defaultdict(int)
+        bm25: Dict = defaultdict(float)
+        total_docs = len(docs)
+        for keyword in query:
+            posting = partition.get(keyword)
+            if posting is None or not len(posting):
+                continue
+            if self.scoring == 'bm25':
+                df = len(postings[ALL_CANDIDATES].get(keyword, posting))
+                idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+            for doc_id in posting:
+                matches[doc_id] += 1
+                if self.scoring == 'bm25':
+                    # tf = 1 : les mots-clés d'un document forment un ensemble
+                    length_norm = 1 - self.b + self.b * doc_lengths[doc_id] / (avg_length or 1)
+                    bm25[doc_id] += idf * (self.k1 + 1) / (1 + self.k1 * length_norm)
+
+        if self.scoring == 'bm25':
+            top = heapq.nlargest(limit, bm25.items(), key=lambda item: item[1])
+        else:
+            top = heapq.nlargest(limit, matches.items(), key=lambda item: item[1])
+
+        results = []
+        for doc_id, _ in top:
+            result = dict(docs[doc_id])
+            result['keyword_score'] = matches[doc_id] / len(query)
+            if self.scoring == 'bm25':
+                result['bm25_score'] = bm25[doc_id]
+            results.append(result)
+        return results
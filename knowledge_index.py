@@ -0,0 +1,115 @@
+"""
+Base commune des index en mémoire construits à partir de la table knowledge
+"""
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class KnowledgeIndex:
+    """
+    Chargement complet, réconciliation avec la table (ajouts, modifications, suppressions)
+    et thread de rafraîchissement
+    """
+
+    name = "index"
+    columns: List[str] = []
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.max_id = None
+        self.ready = False
+        self._refresh_thread = None
+        # id -> content_hash de chaque document vu par add() (indexé ou écarté, ex. sans embedding)
+        self._hashes: Dict = {}
+
+    def fetch_columns(self, db) -> List[str]:
+        """Colonnes lues, avec content_hash quand la table l'a (sinon réconciliation sur les ids)"""
+        return db.knowledge_columns(self.columns)
+
+    def add(self, rows: List[Dict]):
+        raise NotImplementedError
+
+    def remove(self, doc_ids: List[int]):
+        raise NotImplementedError
+
+    def _track_rows(self, rows: List[Dict]):
+        """Empreintes et ID maximal des documents passés à add() (verrou tenu par l'appelant)"""
+        ids = []
+        for row in rows:
+            if row.get('id') is None:
+                continue
+            self._hashes[row['id']] = row.get('content_hash')
+            ids.append(row['id'])
+        if ids:
+            self.max_id = max(ids) if self.max_id is None else max(self.max_id, max(ids))
+
+    def _forget(self, doc_ids):
+        """Verrou tenu par l'appelant"""
+        for doc_id in doc_ids:
+            self._hashes.pop(doc_id, None)
+
+    def load(self, db, page_size: int = 1000):
+        """
+        Chargement complet depuis la table knowledge
+        Une erreur est propagée et l'index reste non prêt (la recherche passe par Supabase
+        et le préchauffage sera relancé) : jamais d'index vide ou partiel marqué prêt
+        """
+        started = time.perf_counter()
+        self.add(db.fetch_knowledge(self.fetch_columns(db), page_size=page_size, strict=True))
+        self.ready = True
+        print(f"{self.name} chargé: {len(self)} documents en {time.perf_counter() - started:.2f}s")
+
+    def load_snapshot(self, snapshot):
+        """Chargement depuis un instantané (knowledge_snapshot), sans lire la table"""
+        started = time.perf_counter()
+        self._load_snapshot(snapshot)
+        with self._lock:
+            self._hashes = {row['id']: row.get('content_hash') for row in snapshot.rows}
+        self.max_id = snapshot.max_id
+        self.ready = True
+        print(f"{self.name} chargé depuis l'instantané: {len(self)} documents "
+              f"en {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    def _load_snapshot(self, snapshot):
+        raise NotImplementedError
+
+    def refresh(self, db) -> Tuple[List[int], List[int]]:
+        """
+        Réconciliation avec la table : seuls les ids et content_hash sont relus en entier,
+        puis les documents nouveaux ou modifiés sont chargés par id et les disparus retirés
+        Retourne (ids ajoutés ou modifiés, ids retirés)
+        """
+        current = db.fetch_knowledge_hashes()
+        with self._lock:
+            indexed = dict(self._hashes)
+        removed = [doc_id for doc_id in indexed if doc_id not in current]
+        changed = [doc_id for doc_id, content_hash in current.items()
+                   if doc_id not in indexed or indexed[doc_id] != content_hash]
+
+        if removed:
+            self.remove(removed)
+        if changed:
+            self.add(db.fetch_knowledge_by_ids(self.fetch_columns(db), changed))
+        if changed or removed:
+            print(f"{self.name} rafraîchi: +{len(changed)} / -{len(removed)} documents")
+        return changed, removed
+
+    def start_auto_refresh(self, db, interval: float = 300,
+                           on_change: Optional[Callable[[List[int], List[int]], None]] = None):
+        """Rafraîchit l'index périodiquement dans un thread ; `on_change(modifiés, retirés)` après chaque écart"""
+        if self._refresh_thread is not None or interval <= 0:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    changed, removed = self.refresh(db)
+                    if on_change is not None and (changed or removed):
+                        on_change(changed, removed)
+                except Exception as e:
+                    print(f"Erreur rafraîchissement {self.name}: {e}")
+
+        self._refresh_thread = threading.Thread(target=run, name=f'{self.name}-refresh', daemon=True)
+        self._refresh_thread.start()
@@ -0,0 +1,316 @@
+"""
+Instantané de la base de connaissances sur disque, chargé par mmap
+Métadonnées des documents, postings de l'index mots-clés et matrice d'embeddings
+(float16 ou int8) : les index locaux démarrent sans relire la table knowledge, et les
+pages du fichier sont partagées entre les processus (cache de pages du système)
+
+Format (version 4), petit-boutiste :
+    MAGIC (8 octets) | longueur de l'en-tête (uint64) | en-tête JSON | sections alignées sur 64 octets
+Sections : ids, embeddings, has_embedding, scales (int8 seulement), rows (JSON), text_offsets, text,
+posting_offsets, postings, keyword_counts ; l'en-tête donne offset, dtype et forme de chacune
+Toutes les lignes de la table sont exportées ; celles sans embedding ont une ligne nulle dans
+la matrice (has_embedding = 0) et ne sont chargées que par l'index mots-clés
+
+L'instantané porte l'empreinte de la table au moment de l'export (ids + content_hash),
+comparée au démarrage à celle de la table pour écarter un instantané périmé
+
+Usage : python knowledge_snapshot.py [--output knowledge.snapshot] [--dtype float16|int8]
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from config import EMBEDDING_MODEL, TOKENIZER, KEYWORD_SCORING
+from database import KNOWLEDGE_DOCUMENT_COLUMNS
+from keyword_index import KeywordIndex
+from vector_index import parse_embedding, _normalize_rows
+
+MAGIC = b'KBSNAP\x00\x01'
+FORMAT_VERSION = 4
+ALIGNMENT = 64
+# Place réservée à l'en-tête JSON : les offsets des sections sont connus avant de l'écrire
+HEADER_RESERVED = 8192
+EMBEDDING_DTYPES = ('float16', 'int8')
+
+# Métadonnées gardées dans les index (le texte est dans sa propre section, lu à la demande)
+# content_hash : réconciliation des index avec la table après le démarrage
+ROW_COLUMNS = ['id', 'candidate', 'section', 'source_link', 'keywords', 'content_hash']
+
+
+def knowledge_fingerprint(rows: List[Dict]) -> str:
+    """
+    Empreinte de la table : ids et content_hash, dans l'ordre des ids
+    Les documents ingérés sans content_hash ne sont suivis que par leur id
+    """
+    digest = hashlib.sha256()
+    for row in sorted(rows, key=lambda r: r['id']):
+        digest.update(f"{row['id']}:{row.get('content_hash') or ''}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def fetch_fingerprint(db) -> str:
+    """Empreinte actuelle de la table (ids + content_hash seulement, sans texte ni embedding) ; lève en cas d'erreur"""
+    return knowledge_fingerprint([
+        {'id': doc_id, 'content_hash': content_hash} for doc_id, content_hash in db.fetch_knowledge_hashes().items()
+    ])
+
+
+# ===== LECTURE =====
+
+class KnowledgeSnapshot:
+    """Vues NumPy en lecture seule sur le fichier projeté en mémoire (aucune copie)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} n'est pas un instantané de la base de connaissances")
+        (header_length,) = struct.unpack_from('<Q', self._mmap, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        self.header = json.loads(bytes(self._mmap[header_start:header_start + header_length]))
+        if self.header.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Version d'instantané non prise en charge: {self.header.get('format_version')}")
+
+        self.content_hash: str = self.header['content_hash']
+        self.ids = self._section('ids')
+        self.embeddings = self._section('embeddings')
+        self.has_embedding = self._section('has_embedding').astype(bool)
+        self.scales = self._section('scales') if 'scales' in self.header['sections'] else None
+        self.keyword_counts = self._section('keyword_counts')
+        self._text_offsets = self._section('text_offsets')
+        self._text = self._section('text')
+        self._posting_offsets = self._section('posting_offsets')
+        self._postings = self._section('postings')
+
+        # Seule partie désérialisée : métadonnées et clés des postings (quelques Ko par millier de documents)
+        rows_blob = json.loads(bytes(self._section('rows')))
+        self.rows: List[Dict] = [dict(zip(ROW_COLUMNS, values)) for values in rows_blob['rows']]
+        self.posting_keys: List[Tuple[Optional[str], str]] = [tuple(key) for key in rows_blob['posting_keys']]
+        self._positions = {doc_id: i for i, doc_id in enumerate(self.ids.tolist())}
+
+    def _section(self, name: str) -> np.ndarray:
+        spec = self.header['sections'][name]
+        count = int(np.prod(spec['shape'])) if spec['shape'] else 0
+        array = np.frombuffer(self._mmap, dtype=np.dtype(spec['dtype']), count=count, offset=spec['offset'])
+        return array.reshape(spec['shape'])
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def max_id(self) -> Optional[int]:
+        return int(self.ids.max()) if len(self.ids) else None
+
+    def is_compatible(self) -> bool:
+        """Même modèle d'embedding et même tokeniseur que ce processus"""
+        return (self.header.get('embedding_model') == EMBEDDING_MODEL
+                and self.header.get('tokenizer') == TOKENIZER)
+
+    def postings(self) -> Iterator[Tuple[Tuple[Optional[str], str], np.ndarray]]:
+        """((candidat ou ALL_CANDIDATES, mot-clé), vue sur les IDs des documents)"""
+        offsets = self._posting_offsets
+        for i, key in enumerate(self.posting_keys):
+            yield key, self._postings[offsets[i]:offsets[i + 1]]
+
+    def embedded(self) -> Tuple[List[Dict], np.ndarray, Optional[np.ndarray]]:
+        """
+        (lignes, matrice, échelles) des documents qui ont un embedding
+        Vues mmap sans copie quand tous en ont un (cas courant)
+        """
+        if self.has_embedding.all():
+            return self.rows, self.embeddings, self.scales
+        positions = np.flatnonzero(self.has_embedding)
+        scales = self.scales[positions] if self.scales is not None else None
+        return [self.rows[i] for i in positions], self.embeddings[positions], scales
+
+    def dense_embeddings(self) -> np.ndarray:
+        """Matrice float32 des documents avec embedding (copie), pour les index qui ne lisent pas float16/int8"""
+        _, embeddings, scales = self.embedded()
+        if scales is not None:
+            return embeddings.astype(np.float32) * scales[:, None]
+        return embeddings.astype(np.float32)
+
+    def texts(self, doc_ids) -> Dict[int, str]:
+        """Texte des documents présents dans l'instantané (décodé à la demande)"""
+        texts = {}
+        for doc_id in doc_ids:
+            position = self._positions.get(doc_id)
+            if position is None:
+                continue
+            start, end = self._text_offsets[position], self._text_offsets[position + 1]
+            texts[doc_id] = bytes(self._text[start:end]).decode('utf-8')
+        return texts
+
+    def close(self):
+        self._mmap.close()
+
+
+def open_snapshot(path: str, db=None) -> Optional[KnowledgeSnapshot]:
+    """
+    Ouvre l'instantané s'il est utilisable, sinon None (les index chargent alors la table)
+    Avec `db`, l'empreinte de l'instantané est comparée à celle de la table
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        snapshot = KnowledgeSnapshot(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Instantané {path} illisible: {e}")
+        return None
+
+    if not snapshot.is_compatible():
+        print(f"Instantané {path} ignoré : modèle d'embedding ou tokeniseur différent")
+        return None
+    if db is not None:
+        try:
+            current = fetch_fingerprint(db)
+        except Exception as e:
+            print(f"Instantané {path} ignoré : empreinte de la table illisible ({e})")
+            return None
+        if current != snapshot.content_hash:
+            print(f"Instantané {path} périmé (empreinte {snapshot.content_hash[:12]} != {current[:12]})")
+            return None
+    print(f"Instantané {path}: {len(snapshot)} documents (exporté le {snapshot.header.get('created_at')})")
+    return snapshot
+
+
+# ===== EXPORT =====
+
+def quantize(matrix: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """float16, ou int8 symétrique par ligne (valeur = int8 * scale)"""
+    if dtype == 'float16':
+        return matrix.astype(np.float16), None
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.clip(np.round(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def write_snapshot(path: str, rows: List[Dict], content_hash: str, dtype: str = 'float16') -> Dict:
+    """Écrit l'instantané (fichier temporaire puis renommage atomique) et retourne l'en-tête"""
+    if dtype not in EMBEDDING_DTYPES:
+        raise ValueError(f"Type d'embedding inconnu: {dtype} ({', '.join(EMBEDDING_DTYPES)})")
+
+    # Toutes les lignes : l'empreinte couvre la table entière, l'instantané aussi
+    rows = sorted(rows, key=lambda r: r['id'])
+    vectors = [parse_embedding(r.get('embedding')) for r in rows]
+    has_embedding = np.array([vector is not None for vector in vectors], dtype=np.uint8)
+    if not has_embedding.any():
+        raise ValueError("Aucun document avec embedding à exporter")
+
+    dim = next(vector for vector in vectors if vector is not None).shape[0]
+    zeros = np.zeros(dim, dtype=np.float32)
+    matrix = _normalize_rows(np.vstack([zeros if v is None else v for v in vectors]).astype(np.float32))
+    embeddings, scales = quantize(matrix, dtype)
+
+    # Postings calculés par l'index lui-même : même normalisation qu'au chargement depuis la table
+    keyword_index = KeywordIndex(scoring=KEYWORD_SCORING)
+    keyword_index.add(rows)
+    posting_keys, posting_offsets, postings = [], [0], []
+    for candidate, partition in keyword_index._postings.items():
+        for keyword, doc_ids in partition.items():
+            posting_keys.append([candidate, keyword])
+            postings.extend(doc_ids)
+            posting_offsets.append(len(postings))
+
+    texts = [(r.get('text') or '').encode('utf-8') for r in rows]
+    text_offsets = np.cumsum([0] + [len(t) for t in texts], dtype=np.int64)
+
+    rows_blob = json.dumps({
+        'rows': [[r.get(column) for column in ROW_COLUMNS] for r in rows],
+        'posting_keys': posting_keys,
+    }, ensure_ascii=False).encode('utf-8')
+
+    sections = {
+        'ids': np.array([r['id'] for r in rows], dtype=np.int64),
+        'embeddings': embeddings,
+        'has_embedding': has_embedding,
+        'keyword_counts': np.array([keyword_index._doc_lengths[r['id']] for r in rows], dtype=np.int32),
+        'rows': np.frombuffer(rows_blob, dtype=np.uint8),
+        'text_offsets': text_offsets,
+        'text': np.frombuffer(b''.join(texts), dtype=np.uint8),
+        'posting_offsets': np.array(posting_offsets, dtype=np.int64),
+        'postings': np.array(postings, dtype=np.int64),
+    }
+    if scales is not None:
+        sections['scales'] = scales
+
+    header = {
+        'format_version': FORMAT_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'content_hash': content_hash,
+        'embedding_model': EMBEDDING_MODEL,
+        'tokenizer': TOKENIZER,
+        'count': len(rows),
+        'embedded': int(has_embedding.sum()),
+        'dim': int(matrix.shape[1]),
+        'embedding_dtype': dtype,
+        'sections': {},
+    }
+    layout_start = _align(len(MAGIC) + 8 + HEADER_RESERVED)
+    offset = layout_start
+    for name, array in sections.items():
+        array = np.ascontiguousarray(array)
+        sections[name] = array
+        header['sections'][name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        offset = _align(offset + array.nbytes)
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    if len(MAGIC) + 8 + len(header_bytes) > layout_start:
+        raise ValueError("En-tête d'instantané trop volumineux")
+    # Complété par des espaces jusqu'à la première section (JSON valide)
+    header_bytes = header_bytes.ljust(layout_start - len(MAGIC) - 8)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in sections.items():
+            f.seek(header['sections'][name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(offset)
+    os.replace(tmp_path, path)
+    return header
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def export(db, path: str, dtype: str = 'float16') -> Dict:
+    """Lit la table knowledge (une fois) et écrit l'instantané"""
+    rows = db.fetch_knowledge(db.knowledge_columns(KNOWLEDGE_DOCUMENT_COLUMNS + ['embedding']), strict=True)
+    if not rows:
+        # Une table vide ne doit pas écraser l'instantané
+        raise ValueError("Table knowledge vide, instantané non écrit")
+    return write_snapshot(path, rows, knowledge_fingerprint(rows), dtype)
+
+
+def main():
+    from config import KNOWLEDGE_SNAPSHOT_PATH
+
+    parser = argparse.ArgumentParser(description="Export de la table knowledge en instantané mmap")
+    parser.add_argument('--output', default=KNOWLEDGE_SNAPSHOT_PATH or 'knowledge.snapshot')
+    parser.add_argument('--dtype', choices=EMBEDDING_DTYPES, default='float16', help="Type des embeddings stockés")
+    args = parser.parse_args()
+
+    from database import Database
+    started = time.perf_counter()
+    header = export(Database(), args.output, args.dtype)
+    size_mb = os.path.getsize(args.output) / 1024 / 1024
+    print(f"✅ {args.output}: {header['count']} documents ({header['embedded']} avec embedding), {header['dim']} dimensions ({header['embedding_dtype']}), "
+          f"{size_mb:.1f} Mo en {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+Contrôle du débit vers Gemini : seaux à jetons RPM/TPM, limite de concurrence
+et politique de nouvelles tentatives
+"""
+import random
+import threading
+import time
+from typing import Optional
+from metrics import REGISTRY
+
+LLM_QUEUE_WAIT = REGISTRY.histogram('bot_llm_queue_seconds', "Attente avant l'envoi d'une requête Gemini (quota et concurrence)")
+LLM_IN_FLIGHT = REGISTRY.gauge('bot_llm_in_flight', "Requêtes Gemini en cours")
+LLM_RATE_LIMITED = REGISTRY.counter('bot_llm_rate_limited_total', "Requêtes Gemini abandonnées faute de quota avant l'échéance")
+
+
+class RateLimitTimeout(Exception):
+    """Le quota local ne permet pas d'envoyer la requête avant son échéance"""
+
+
+class TokenBucket:
+    """Seau à jetons : capacité maximale et remplissage continu"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.refill_per_second)
+            self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Délai avant que `amount` jetons soient disponibles (0 si immédiat)"""
+        self._refill(now)
+        # Une requête plus grosse que la capacité passe dès que le seau est plein
+        amount = min(amount, self.capacity)
+        if self._tokens >= amount:
+            return 0.0
+        return (amount - self._tokens) / self.refill_per_second
+
+    def take(self, amount: float):
+        self._tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        """Corrige après coup une estimation (delta > 0 : consommé en plus, < 0 : rendu)"""
+        self._tokens = min(self.capacity, self._tokens - delta)
+
+
+class RateLimiter:
+    """
+    Limiteur calé sur le quota Gemini : requêtes/minute, tokens/minute
+    et nombre maximal de requêtes simultanées (0 = pas de limite)
+    """
+
+    def __init__(self, rpm: int = 0, tpm: int = 0, max_concurrency: int = 0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.share = 1.0
+        self.requests = TokenBucket(rpm, rpm / 60.0) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm, tpm / 60.0) if tpm > 0 else None
+        self.max_concurrency = max_concurrency
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        LLM_IN_FLIGHT.set_function(lambda: self._in_flight)
+
+    def _wait_time(self, estimated_tokens: float, now: float) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(estimated_tokens, now))
+        return wait
+
+    def _take(self, estimated_tokens: float):
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(estimated_tokens)
+        self._in_flight += 1
+
+    def acquire(self, estimated_tokens: float, deadline: Optional[float] = None) -> float:
+        """
+        Bloque jusqu'à ce que quota et concurrence le permettent
+        Retourne le temps d'attente ; lève RateLimitTimeout si l'échéance (monotonic) serait dépassée
+        """
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self.max_concurrency and self._in_flight >= self.max_concurrency:
+                    wait = None
+                else:
+                    wait = self._wait_time(estimated_tokens, now)
+                    if wait <= 0:
+                        self._take(estimated_tokens)
+                        break
+
+                if deadline is not None:
+                    remaining = deadline - now
+                    # Inutile d'attendre un quota qui ne sera disponible qu'après l'échéance
+                    if remaining <= 0 or (wait is not None and wait > remaining):
+                        LLM_RATE_LIMITED.inc()
+                        raise RateLimitTimeout("quota Gemini local épuisé avant l'échéance")
+                    wait = remaining if wait is None else wait
+                self._cond.wait(wait)
+
+        waited = time.monotonic() - started
+        LLM_QUEUE_WAIT.observe(waited)
+        return waited
+
+    def try_acquire(self, estimated_tokens: float) -> bool:
+        """Version non bloquante (requêtes de couverture : seulement s'il reste de la marge)"""
+        with self._cond:
+            if self.max_concurrency and self._in_flight >= self.max_concurrency:
+                return False
+            if self._wait_time(estimated_tokens, time.monotonic()) > 0:
+                return False
+            self._take(estimated_tokens)
+        LLM_QUEUE_WAIT.observe(0.0)
+        return True
+
+    def release(self, estimated_tokens: float = 0, actual_tokens: Optional[float] = None):
+        """Libère la place et corrige le seau TPM avec le nombre réel de tokens"""
+        with self._cond:
+            self._in_flight -= 1
+            if self.tokens is not None and actual_tokens is not None:
+                self.tokens.adjust(actual_tokens - estimated_tokens)
+            self._cond.notify_all()
+
+    def set_share(self, share: float):
+        """
+        Part du quota réservée à ce processus (plusieurs workers partagent la clé API) :
+        capacité et remplissage des seaux ramenés à `share` du quota global
+        """
+        share = min(1.0, share) if share > 0 else 1.0
+        with self._cond:
+            self.share = share
+            for bucket, limit in ((self.requests, self.rpm), (self.tokens, self.tpm)):
+                if bucket is None:
+                    continue
+                bucket.capacity = limit * share
+                bucket.refill_per_second = limit * share / 60.0
+                bucket._tokens = min(bucket._tokens, bucket.capacity)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        return {'in_flight': self._in_flight, 'max_concurrency': self.max_concurrency, 'quota_share': self.share}
+
+
+# Codes HTTP/gRPC temporaires : quota (429), erreurs serveur, surcharge, délai dépassé
+RETRYABLE_HTTP_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def _retryable_exception_types() -> tuple:
+    types = [TimeoutError, ConnectionError]
+    try:
+        from google.api_core import exceptions as api_exceptions
+        types += [
+            api_exceptions.ResourceExhausted,
+            api_exceptions.TooManyRequests,
+            api_exceptions.ServiceUnavailable,
+            api_exceptions.InternalServerError,
+            api_exceptions.DeadlineExceeded,
+            api_exceptions.GatewayTimeout,
+        ]
+    except ImportError:
+        pass
+    return tuple(types)
+
+
+class RetryPolicy:
+    """Backoff exponentiel avec jitter complet, limité en nombre de tentatives et en délai"""
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._retryable_types = _retryable_exception_types()
+
+    def is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, self._retryable_types):
+            return True
+        # google.api_core expose le statut HTTP dans `code` (transport REST comme gRPC)
+        code = getattr(error, 'code', None)
+        return isinstance(code, int) and code in RETRYABLE_HTTP_CODES
+
+    def backoff(self, attempt: int) -> float:
+        """Délai avant la tentative `attempt` (1 = première nouvelle tentative)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
@@ -1,16 +1,41 @@
 import logging
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from flask import Flask, request, Response
+from flask import Flask, request, Response, jsonify
 import asyncio
+import contextvars
+import functools
+import os
 import threading
-import queue
 import time
-from config import TELEGRAM_BOT_TOKEN, WELCOME_MESSAGE, HELP_MESSAGE, ERROR_MESSAGE, PORT, WEBHOOK_URL
-from database import Database
+from typing import Tuple
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    TELEGRAM_BOT_TOKEN, TELEGRAM_API_URL, WELCOME_MESSAGE, HELP_MESSAGE, ERROR_MESSAGE, BUSY_MESSAGE,
+    PORT, WEBHOOK_URL, WEBHOOK_REGISTRATION, WORKER_HEARTBEAT_INTERVAL,
+    DB_EXECUTOR_WORKERS, SEARCH_EXECUTOR_WORKERS, LLM_EXECUTOR_WORKERS,
+    UPDATE_WORKERS, UPDATE_QUEUE_MAX_DEPTH, UPDATE_SLOW_SECONDS, UPDATE_SHED_POLICY, UPDATE_RETRY_AFTER,
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_SEMANTIC_DISTANCE, KNOWLEDGE_VERSION_POLL_INTERVAL,
+    LAZY_LOADING, PREWARM, STREAMING_ENABLED, STREAM_EDIT_INTERVAL,
+    CONTEXT_TOKEN_CALIBRATION, INTENT_ROUTER_ENABLED
+)
+from database import Database, get_write_buffer_if_started
 from search_engine import SearchEngine
-from gemini_client import GeminiClient
-from text_processing import is_greeting
+from gemini_client import (
+    GeminiClient, StreamInterrupted, FALLBACK_RESPONSE, NO_CONTEXT_FALLBACK_RESPONSE, INTERRUPTED_NOTICE
+)
+from text_processing import extract_all_candidate_mentions, load_nltk_resources
+from intent_router import IntentRouter
+from response_cache import ResponseCache
+from metrics import REGISTRY, startup_timer, startup_timings
+from update_dispatcher import UpdateDispatcher, AsyncUpdateDispatcher, UPDATES_SLOW, extract_chat_id
+from streaming_reply import StreamingReply
+from prompt_builder import SYSTEM_INSTRUCTION
+from tracing import start_trace, stage_span, traced, set_trace_label
+from shared_store import get_shared_store, WorkerRegistry
+from webhook_setup import register_webhook, claim_webhook_leadership, release_webhook_leadership
 
 # Configuration du logging
 logging.basicConfig(
@@ -21,13 +46,77 @@ logger = logging.getLogger(__name__)
 
 class ElectionBot:
     def __init__(self):
-        self.db = Database()
-        self.search_engine = SearchEngine()
-        self.gemini_client = GeminiClient()
+        # Un seul client Supabase partagé entre la base et le moteur de recherche
+        with startup_timer('database'):
+            self.db = Database()
+        with startup_timer('search_engine'):
+            self.search_engine = SearchEngine(self.db)
+        with startup_timer('gemini_client'):
+            self.gemini_client = GeminiClient()
+        # Stockage partagé entre workers (en mémoire avec un seul processus)
+        self.store = get_shared_store()
+        self.response_cache = ResponseCache(
+            max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+            ttl=RESPONSE_CACHE_TTL,
+            semantic_distance=RESPONSE_CACHE_SEMANTIC_DISTANCE,
+            store=self.store
+        ) if RESPONSE_CACHE_ENABLED else None
+        # Plusieurs workers : le quota Gemini de la clé API est réparti entre les workers vivants
+        self.worker_registry = None
+        if self.store.shared:
+            self.worker_registry = WorkerRegistry(self.store, interval=WORKER_HEARTBEAT_INTERVAL)
+            self.worker_registry.on_change(lambda live: self.gemini_client.limiter.set_share(1.0 / live))
+        self.intent_router = IntentRouter() if INTENT_ROUTER_ENABLED else None
         self.application = None
-        self.update_queue = queue.Queue()
+        self.dispatcher = UpdateDispatcher(
+            self.process_update_sync,
+            num_workers=UPDATE_WORKERS,
+            max_depth=UPDATE_QUEUE_MAX_DEPTH
+        )
         self.loop = None
         self.loop_thread = None
+        
+        # Un pool borné par étape du pipeline pour les appels bloquants
+        self.executors = {
+            'db': ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix='bot-db'),
+            'search': ThreadPoolExecutor(max_workers=SEARCH_EXECUTOR_WORKERS, thread_name_prefix='bot-search'),
+            'llm': ThreadPoolExecutor(max_workers=LLM_EXECUTOR_WORKERS, thread_name_prefix='bot-llm'),
+        }
+    
+    def prewarm(self):
+        """Charge les ressources lourdes (NLTK, modèle d'embedding, index locaux)"""
+        with startup_timer('nltk'):
+            load_nltk_resources()
+        with startup_timer('prewarm'):
+            self.search_engine.prewarm()
+        if CONTEXT_TOKEN_CALIBRATION:
+            with startup_timer('token_calibration'):
+                self.search_engine.context_packer.estimator.calibrate(
+                    [SYSTEM_INSTRUCTION, WELCOME_MESSAGE, HELP_MESSAGE],
+                    self.gemini_client.count_tokens
+                )
+    
+    def start_prewarm(self):
+        """Préchauffage en arrière-plan : les premiers webhooks ne l'attendent pas"""
+        threading.Thread(target=self.prewarm, name='bot-prewarm', daemon=True).start()
+    
+    async def _run_blocking(self, stage: str, func, *args, **kwargs):
+        """
+        Exécute un appel bloquant dans le pool de l'étape donnée
+        La boucle d'événements reste libre pour les autres conversations
+        Le contexte (trace de la requête) est propagé au thread du pool
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executors[stage],
+            functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+        )
+    
+    async def _cache_call(self, func, *args):
+        """Cache des réponses : hors de la boucle quand il interroge le stockage partagé"""
+        if self.response_cache.store is not None:
+            return await self._run_blocking('db', func, *args)
+        return func(*args)
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Commande /start"""
@@ -42,7 +131,9 @@ class ElectionBot:
         )
         
         # Sauvegarder le démarrage de conversation
-        self.db.save_message(
+        await self._run_blocking(
+            'db',
+            self.db.save_message,
             chat_id=chat_id,
             user_message="/start",
             bot_response=WELCOME_MESSAGE
@@ -59,7 +150,7 @@ class ElectionBot:
         """Commande /clear - Efface l'historique"""
         chat_id = update.effective_chat.id
         
-        success = self.db.clear_conversation(chat_id)
+        success = await self._run_blocking('db', self.db.clear_conversation, chat_id)
         
         if success:
             message = "✅ Historique de conversation effacé !"
@@ -70,6 +161,7 @@ class ElectionBot:
     
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Traite les messages des utilisateurs"""
+        trace = start_trace(update.effective_chat.id)
         try:
             chat_id = update.effective_chat.id
             user_message = update.message.text
@@ -80,61 +172,137 @@ class ElectionBot:
             # Envoyer un indicateur "en train d'écrire"
             await context.bot.send_chat_action(chat_id=chat_id, action="typing")
             
+            if STREAMING_ENABLED:
+                # Réponse affichée au fil de la génération, puis complétée des sources
+                reply = StreamingReply(update.message, min_interval=STREAM_EDIT_INTERVAL)
+                bot_response = await self._process_user_message(chat_id, user_message, on_partial=reply.update)
+                with stage_span('reply'):
+                    await reply.finish(bot_response)
+                return
+            
             # Traiter le message
             bot_response = await self._process_user_message(chat_id, user_message)
             
             # Envoyer la réponse
-            await update.message.reply_text(bot_response)
+            with stage_span('reply'):
+                await update.message.reply_text(bot_response)
             
         except Exception as e:
             logger.error(f"Erreur lors du traitement du message: {e}")
             await update.message.reply_text(ERROR_MESSAGE)
+        finally:
+            trace.finish()
     
-    async def _process_user_message(self, chat_id: int, user_message: str) -> str:
+    async def _process_user_message(self, chat_id: int, user_message: str, on_partial=None) -> str:
         """
         Traite un message utilisateur et retourne la réponse
+        on_partial : coroutine optionnelle appelée avec le texte partiel pendant la génération
         """
         try:
-            # Cas spéciaux : salutations simples
-            if is_greeting(user_message):
-                response = "Salut ! 👋 Pose-moi tes questions sur les élections présidentielles !"
-                self.db.save_message(chat_id, user_message, response)
-                return response
+            # Chemin rapide : salutations, aide et questions fréquentes (réponses en mémoire,
+            # sans historique, recherche, LLM ni écriture en base)
+            if self.intent_router is not None:
+                routed = self.intent_router.route(user_message)
+                if routed is not None:
+                    intent, response = routed
+                    set_trace_label(search_method=f'intent_{intent}')
+                    logger.info(f"Réponse directe (intention: {intent})")
+                    return response
             
-            # 1. Récupérer l'historique de conversation
-            conversation_history = self.db.get_conversation_history(chat_id, limit=5)
+            candidate = ', '.join(extract_all_candidate_mentions(user_message)) or None
             
-            # 2. Recherche dans la base de connaissances
-            search_results, search_method = self.search_engine.search(user_message)
+            # 0-2. Cache sémantique (question très proche d'une question déjà traitée),
+            # historique de conversation et recherche en parallèle (indépendants)
+            (query_embedding, cached_response), conversation_history, (search_results, search_method) = \
+                await asyncio.gather(
+                    self._semantic_cache_lookup(user_message, candidate),
+                    traced('history', self._run_blocking('db', self.db.get_conversation_history, chat_id, limit=5)),
+                    traced('search', self._run_blocking('search', self.search_engine.search, user_message))
+                )
+            if cached_response:
+                set_trace_label(search_method='semantic_cache')
+                logger.info("Réponse servie depuis le cache sémantique")
+                with stage_span('save'):
+                    await self._run_blocking('db', self.db.save_message, chat_id, user_message, cached_response)
+                return cached_response
+            set_trace_label(search_method=search_method)
             
             # 3. Préparer le contexte pour Gemini
-            context = self.search_engine.get_context_for_llm(search_results)
+            with stage_span('context_build'):
+                context, context_tokens = self.search_engine.pack_context(search_results)
+            
+            # Cache exact : même question, même candidat, mêmes documents
+            cache_key = None
+            if self.response_cache:
+                cache_key = ResponseCache.make_key(
+                    user_message, candidate, [r.get('id') for r in search_results]
+                )
+                cached_response = await self._cache_call(self.response_cache.get, cache_key)
+                if cached_response:
+                    logger.info(f"Réponse servie depuis le cache ({search_method})")
+                    with stage_span('save'):
+                        await self._run_blocking(
+                            'db',
+                            self.db.save_message,
+                            chat_id=chat_id,
+                            user_message=user_message,
+                            bot_response=cached_response,
+                            search_results=search_results[:3] if search_results else None
+                        )
+                    return cached_response
             
             # 4. Générer la réponse avec Gemini
+            interrupted = False
             if context:
-                bot_response = self.gemini_client.generate_response(
-                    user_message, 
-                    context, 
-                    conversation_history
-                )
+                with stage_span('llm'):
+                    if on_partial is not None:
+                        # Streaming : le texte est publié au fil de la génération
+                        bot_response, interrupted = await self._stream_llm_response(
+                            user_message, context, conversation_history, on_partial
+                        )
+                    else:
+                        bot_response = await self._run_blocking(
+                            'llm',
+                            self.gemini_client.generate_response,
+                            user_message, 
+                            context, 
+                            conversation_history
+                        )
+                
+                if interrupted:
+                    bot_response += INTERRUPTED_NOTICE
                 
                 # Ajouter les sources
                 sources = self.search_engine.format_sources(search_results)
                 if sources:
                     bot_response += sources
                     
-                logger.info(f"Réponse générée avec contexte ({search_method}): {len(search_results)} documents")
+                logger.info(
+                    f"Réponse générée avec contexte ({search_method}): "
+                    f"{len(search_results)} documents, {context_tokens} tokens"
+                )
             else:
-                bot_response = self.gemini_client.generate_no_context_response(user_message)
+                with stage_span('llm'):
+                    bot_response = await self._run_blocking(
+                        'llm', self.gemini_client.generate_no_context_response, user_message
+                    )
                 logger.info("Réponse générée sans contexte")
             
+            # Ne pas mettre en cache les réponses de repli ni les réponses interrompues (erreur Gemini)
+            if cache_key and not interrupted \
+                    and not bot_response.startswith((FALLBACK_RESPONSE, NO_CONTEXT_FALLBACK_RESPONSE)):
+                await self._cache_call(self.response_cache.put, cache_key, bot_response, query_embedding, candidate)
+            
             # 5. Sauvegarder l'échange
-            self.db.save_message(
-                chat_id=chat_id,
-                user_message=user_message,
-                bot_response=bot_response,
-                search_results=search_results[:3] if search_results else None
-            )
+            with stage_span('save'):
+                await self._run_blocking(
+                    'db',
+                    self.db.save_message,
+                    chat_id=chat_id,
+                    user_message=user_message,
+                    bot_response=bot_response,
+                    search_results=search_results[:3] if search_results else None
+                )
             
             return bot_response
             
@@ -142,6 +310,57 @@ class ElectionBot:
             logger.error(f"Erreur lors du traitement: {e}")
             return ERROR_MESSAGE
     
+    async def _semantic_cache_lookup(self, user_message: str, candidate):
+        """
+        Cache sémantique : (embedding de la question, réponse en cache ou None)
+        L'encodage et la recherche dans le cache se font hors de la boucle d'événements
+        """
+        if not self.response_cache or RESPONSE_CACHE_SEMANTIC_DISTANCE <= 0:
+            return None, None
+        with stage_span('semantic_cache'):
+            query_embedding = await self._run_blocking('search', self.search_engine.encode_query, user_message)
+            cached_response = await self._cache_call(self.response_cache.get_semantic, query_embedding, candidate)
+        return query_embedding, cached_response
+    
+    async def _stream_llm_response(self, user_message: str, context: str,
+                                   conversation_history, on_partial) -> Tuple[str, bool]:
+        """
+        Consomme le flux Gemini dans le pool 'llm' et transmet le texte cumulé à on_partial
+        depuis la boucle d'événements
+        Retourne (texte, interrompu) : interrompu si le flux a échoué après le premier fragment
+        """
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        end_of_stream = object()
+        interrupted = False
+        
+        def produce():
+            nonlocal interrupted
+            try:
+                for chunk in self.gemini_client.generate_response_stream(
+                    user_message, context, conversation_history
+                ):
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+            except StreamInterrupted:
+                interrupted = True
+            finally:
+                loop.call_soon_threadsafe(chunks.put_nowait, end_of_stream)
+        
+        started = time.perf_counter()
+        producer = loop.run_in_executor(self.executors['llm'], produce)
+        text = ""
+        while True:
+            chunk = await chunks.get()
+            if chunk is end_of_stream:
+                break
+            if not text:
+                logger.info(f"Premier fragment Gemini (TTFT): {time.perf_counter() - started:.2f}s")
+            text += chunk
+            await on_partial(text)
+        await producer
+        
+        return text.strip(), interrupted
+    
     async def error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE):
         """Gestionnaire d'erreurs global"""
         logger.error(f"Exception lors de la mise à jour {update}: {context.error}")
@@ -160,17 +379,45 @@ class ElectionBot:
         while self.loop is None:
             time.sleep(0.1)
     
+    def attach_loop(self):
+        """
+        Mode ASGI : la boucle du serveur remplace le thread de boucle
+        Les updates sont traitées par des tâches asyncio, sans saut entre threads
+        """
+        self.loop = asyncio.get_running_loop()
+        self.dispatcher = AsyncUpdateDispatcher(
+            self.process_update,
+            num_workers=UPDATE_WORKERS,
+            max_depth=UPDATE_QUEUE_MAX_DEPTH,
+            slow_after=UPDATE_SLOW_SECONDS
+        )
+    
     def stop_async_loop(self):
-        """Arrête la boucle d'événements"""
+        """Arrête la boucle d'événements (mode WSGI, boucle dans un thread à part)"""
+        if isinstance(self.dispatcher, AsyncUpdateDispatcher):
+            # Mode ASGI : la boucle appartient au serveur et stop() est une coroutine,
+            # l'arrêt passe par shutdown_bot_async (lifespan)
+            logger.warning("Mode ASGI : arrêt délégué à shutdown_bot_async")
+            return
+        self.dispatcher.stop()
+        if self.worker_registry is not None:
+            self.worker_registry.stop()
+        
         if self.loop:
             self.loop.call_soon_threadsafe(self.loop.stop)
+        
+        for executor in self.executors.values():
+            executor.shutdown(wait=False)
     
     async def setup_application(self):
         """Configure l'application Telegram"""
         print("🤖 Configuration du bot d'élections...")
         
         # Créer l'application Telegram
-        self.application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        self.application = Application.builder()\
+            .token(TELEGRAM_BOT_TOKEN)\
+            .base_url(f"{TELEGRAM_API_URL}/bot")\
+            .build()
         
         # Ajouter les gestionnaires
         self.application.add_handler(CommandHandler("start", self.start_command))
@@ -187,28 +434,22 @@ class ElectionBot:
         
         print("✅ Bot configuré avec succès !")
     
-    async def set_webhook(self, webhook_url: str):
+    async def set_webhook(self, webhook_url: str) -> bool:
         """Configure le webhook sur Telegram"""
+        success = await register_webhook(self.application.bot, webhook_url)
+        if not success:
+            logger.error(f"Échec de la configuration du webhook: {webhook_url}")
+        return success
+    
+    async def process_update(self, update_data):
+        """Traite une mise à jour sur la boucle d'événements"""
         try:
-            success = await self.application.bot.set_webhook(
-                url=webhook_url,
-                allowed_updates=['message', 'edited_message', 'callback_query']
-            )
+            # Créer l'objet Update
+            update = Update.de_json(update_data, self.application.bot)
+            await self.application.process_update(update)
             
-            if success:
-                print(f"✅ Webhook configuré: {webhook_url}")
-                
-                # Vérifier le webhook
-                webhook_info = await self.application.bot.get_webhook_info()
-                print(f"📡 Info webhook: {webhook_info.url}")
-                if webhook_info.last_error_date:
-                    print(f"⚠️  Dernière erreur: {webhook_info.last_error_message}")
-            else:
-                print("❌ Échec de la configuration du webhook")
-                
         except Exception as e:
-            print(f"❌ Erreur lors de la configuration du webhook: {e}")
-            logger.error(f"Erreur webhook: {e}")
+            logger.error(f"Erreur lors du traitement de l'update: {e}")
     
     def process_update_sync(self, update_data):
         """Traite une mise à jour de manière synchrone"""
@@ -217,17 +458,22 @@ class ElectionBot:
             return
         
         try:
-            # Créer l'objet Update
-            update = Update.de_json(update_data, self.application.bot)
-            
             # Planifier le traitement dans la boucle d'événements
             future = asyncio.run_coroutine_threadsafe(
-                self.application.process_update(update), 
+                self.process_update(update_data), 
                 self.loop
             )
             
-            # Attendre le résultat (avec timeout)
-            future.result(timeout=30)
+            # Attendre la fin du traitement : le worker ne doit pas passer au message suivant
+            # du chat (ordre) ni libérer sa place dans la file (max_depth) avant
+            try:
+                future.result(timeout=UPDATE_SLOW_SECONDS)
+            except concurrent.futures.TimeoutError:
+                UPDATES_SLOW.inc()
+                logger.warning(
+                    f"Update lente (> {UPDATE_SLOW_SECONDS:g}s) pour le chat {extract_chat_id(update_data)}"
+                )
+                future.result()
             
         except Exception as e:
             logger.error(f"Erreur lors du traitement de l'update: {e}")
@@ -238,10 +484,56 @@ bot_instance = ElectionBot()
 # Configuration Flask
 app = Flask(__name__)
 
+def health_payload():
+    """État du service (commun aux points d'entrée WSGI et ASGI)"""
+    return {
+        "status": "healthy",
+        "service": "election-bot",
+        "queue": bot_instance.dispatcher.stats(),
+        "llm": bot_instance.gemini_client.limiter.stats(),
+        "intents": bot_instance.intent_router.stats() if bot_instance.intent_router else None,
+        "embedding": bot_instance.search_engine.embedding_service.stats(),
+        "worker": {
+            "pid": os.getpid(),
+            "live_workers": bot_instance.worker_registry.live_workers if bot_instance.worker_registry else 1,
+            "store": type(bot_instance.store).__name__
+        },
+        "startup": startup_timings()
+    }
+
+def accept_update(json_data):
+    """
+    Met une update reçue par le webhook en file, ou applique la politique de délestage
+    Retourne (statut HTTP, corps JSON ou None, en-têtes)
+    """
+    if not json_data:
+        logger.warning("Webhook reçu sans données JSON")
+        return 200, None, {}
+    
+    logger.info(f"Webhook reçu")
+    
+    # Mettre l'update en file pour le pool de workers
+    if bot_instance.dispatcher.submit(json_data):
+        return 200, None, {}
+    
+    # File pleine : délestage
+    logger.warning(f"File d'updates pleine ({bot_instance.dispatcher.depth()}), délestage")
+    chat_id = extract_chat_id(json_data)
+    if UPDATE_SHED_POLICY == "busy" and chat_id is not None:
+        # Réponse directe dans le webhook : aucun appel sortant vers Telegram
+        return 200, {"method": "sendMessage", "chat_id": chat_id, "text": BUSY_MESSAGE}, {}
+    
+    return 503, None, {"Retry-After": str(UPDATE_RETRY_AFTER)}
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint pour Render"""
-    return {"status": "healthy", "service": "election-bot"}, 200
+    return health_payload(), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métriques au format Prometheus"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/webhook', methods=['POST'])
 def webhook():
@@ -250,30 +542,34 @@ def webhook():
         # Récupérer les données JSON
         json_data = request.get_json(force=True)
         
-        if not json_data:
-            logger.warning("Webhook reçu sans données JSON")
-            return Response(status=200)
-        
-        logger.info(f"Webhook reçu")
-        
-        # Traiter l'update dans un thread séparé
-        threading.Thread(
-            target=bot_instance.process_update_sync,
-            args=(json_data,),
-            daemon=True
-        ).start()
-        
-        return Response(status=200)
+        status, payload, headers = accept_update(json_data)
+        if payload is not None:
+            return jsonify(payload), status
+        return Response(status=status, headers=headers)
         
     except Exception as e:
         logger.error(f"Erreur dans le webhook: {e}")
         return Response(status=500)
 
-def initialize_bot():
-    """Initialise le bot"""
-    webhook_url = WEBHOOK_URL
+async def register_webhook_on_startup(webhook_url: str):
+    """Enregistre le webhook selon WEBHOOK_REGISTRATION (startup, leader ou external)"""
+    if WEBHOOK_REGISTRATION == 'external':
+        print("📡 Webhook géré hors du processus (WEBHOOK_REGISTRATION=external)")
+        return
+    if WEBHOOK_REGISTRATION == 'leader' and not claim_webhook_leadership(bot_instance.store, webhook_url):
+        print("📡 Webhook déjà enregistré par un autre worker")
+        return
+    
+    success = await bot_instance.set_webhook(webhook_url)
     
-    if not webhook_url:
+    # Échec : rendre la main pour qu'un autre worker retente
+    if not success and WEBHOOK_REGISTRATION == 'leader':
+        release_webhook_leadership(bot_instance.store, webhook_url)
+
+def check_webhook_url() -> bool:
+    """Vérifie que WEBHOOK_URL est définie quand ce processus doit enregistrer le webhook"""
+    # "external" : le webhook est enregistré par l'étape de déploiement (webhook_setup.py)
+    if not WEBHOOK_URL and WEBHOOK_REGISTRATION != 'external':
         print("⚠️  Variable WEBHOOK_URL non définie")
         print("💡 Pour tester en local avec ngrok:")
         print("   1. Installez ngrok: https://ngrok.com/")
@@ -281,23 +577,84 @@ def initialize_bot():
         print("   3. Définissez WEBHOOK_URL=https://your-id.ngrok.io/webhook")
         print("   4. Relancez le bot")
         return False
+    return True
+
+def start_background_services():
+    """Threads de fond communs aux modes WSGI et ASGI"""
+    # Plusieurs workers : s'annoncer et recevoir sa part du quota Gemini
+    if bot_instance.worker_registry:
+        bot_instance.worker_registry.beat()
+        bot_instance.worker_registry.start()
+    
+    # Invalider le cache des réponses quand la base de connaissances change
+    if bot_instance.response_cache:
+        bot_instance.response_cache.start_invalidation_watch(
+            bot_instance.db.get_knowledge_version,
+            interval=KNOWLEDGE_VERSION_POLL_INTERVAL
+        )
+
+def initialize_bot():
+    """Initialise le bot"""
+    if not check_webhook_url():
+        return False
     
     try:
         # Démarrer la boucle d'événements
-        bot_instance.start_async_loop()
+        with startup_timer('event_loop'):
+            bot_instance.start_async_loop()
+        
+        # Démarrer les workers de la file d'updates
+        bot_instance.dispatcher.start()
+        start_background_services()
         
         # Configurer le bot et le webhook
         setup_future = asyncio.run_coroutine_threadsafe(
             bot_instance.setup_application(), 
             bot_instance.loop
         )
-        setup_future.result(timeout=30)
+        with startup_timer('telegram_application'):
+            setup_future.result(timeout=30)
         
         webhook_future = asyncio.run_coroutine_threadsafe(
-            bot_instance.set_webhook(webhook_url), 
+            register_webhook_on_startup(WEBHOOK_URL), 
             bot_instance.loop
         )
-        webhook_future.result(timeout=30)
+        with startup_timer('webhook'):
+            webhook_future.result(timeout=30)
+        
+        # Ressources lourdes : tout de suite en mode eager, en arrière-plan sinon
+        if not LAZY_LOADING:
+            bot_instance.prewarm()
+        elif PREWARM:
+            bot_instance.start_prewarm()
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Erreur lors de l'initialisation: {e}")
+        logger.error(f"Erreur initialisation: {e}")
+        return False
+
+async def initialize_bot_async():
+    """Initialise le bot sur la boucle du serveur ASGI (lifespan)"""
+    if not check_webhook_url():
+        return False
+    
+    try:
+        bot_instance.attach_loop()
+        bot_instance.dispatcher.start()
+        start_background_services()
+        
+        with startup_timer('telegram_application'):
+            await asyncio.wait_for(bot_instance.setup_application(), timeout=30)
+        with startup_timer('webhook'):
+            await asyncio.wait_for(register_webhook_on_startup(WEBHOOK_URL), timeout=30)
+        
+        # Le serveur n'accepte les requêtes qu'à la fin du lifespan : préchauffage hors de la boucle
+        if not LAZY_LOADING:
+            await asyncio.get_running_loop().run_in_executor(None, bot_instance.prewarm)
+        elif PREWARM:
+            bot_instance.start_prewarm()
         
         return True
         
@@ -306,6 +663,23 @@ def initialize_bot():
         logger.error(f"Erreur initialisation: {e}")
         return False
 
+async def shutdown_bot_async():
+    """Arrêt du mode ASGI : vide la file, arrête l'application et écrit les conversations en attente"""
+    await bot_instance.dispatcher.stop()
+    if bot_instance.worker_registry is not None:
+        bot_instance.worker_registry.stop()
+    
+    if bot_instance.application:
+        await bot_instance.application.stop()
+        await bot_instance.application.shutdown()
+    
+    for executor in bot_instance.executors.values():
+        executor.shutdown(wait=False)
+    
+    write_buffer = get_write_buffer_if_started()
+    if write_buffer is not None:
+        await asyncio.get_running_loop().run_in_executor(None, write_buffer.close)
+
 def main():
     """Fonction principale pour le développement"""
     try:
@@ -0,0 +1,86 @@
+from typing import List, Dict, Optional
+
+# Instructions statiques : envoyées une seule fois comme system_instruction du modèle
+# (ou mises en cache côté Gemini), jamais recopiées dans chaque requête
+SYSTEM_INSTRUCTION = """Tu es un assistant spécialisé dans les élections présidentielles françaises.
+
+RÔLE:
+- Tu fournis des informations factuelles et objectives sur les élections
+- Tu présentes les positions des candidats de manière neutre
+- Tu peux comparer les programmes sans prendre parti
+- Tu expliques les procédures électorales
+
+INSTRUCTIONS:
+- Base-toi PRIORITAIREMENT sur le contexte documentaire fourni
+- Si l'information n'est pas dans le contexte, dis-le clairement
+- Reste neutre et objectif, ne prends pas position
+- Cite les sources quand possible
+- Réponse en français, style conversationnel mais informatif
+- Évite les réponses trop longues (max 800 mots)
+
+INTERDICTIONS:
+- Ne pas inventer d'informations
+- Ne pas donner de conseils de vote
+- Ne pas exprimer d'opinions politiques personnelles
+- Ne pas faire de propaganda pour un candidat"""
+
+NO_CONTEXT_INSTRUCTION = """Tu es un assistant pour les élections présidentielles.
+
+Tu n'as trouvé aucune information spécifique dans ta base de connaissances pour répondre à la question de l'utilisateur.
+
+Réponds poliment en:
+1. Reconnaissant que tu n'as pas l'information spécifique
+2. Suggérant de reformuler la question ou d'être plus spécifique
+3. Proposant des sujets connexes que tu pourrais couvrir
+4. Restant encourageant et utile
+
+Garde un ton amical et professionnel."""
+
+NO_DOCUMENTS_PLACEHOLDER = "Aucun document spécifique trouvé dans la base de connaissances."
+
+# Nombre d'échanges récents transmis au modèle
+HISTORY_EXCHANGES = 3
+
+
+class PromptBuilder:
+    """
+    Assemble les requêtes Gemini sous forme de contenus structurés :
+    l'historique en tours user/model, puis un dernier tour user avec
+    les documents et la question en parts séparées
+    """
+
+    def __init__(self, history_exchanges: int = HISTORY_EXCHANGES):
+        self.history_exchanges = history_exchanges
+
+    def build_contents(self, user_question: str, context: str = "",
+                       conversation_history: Optional[List[Dict]] = None) -> List[Dict]:
+        """Contenus de la requête (sans les instructions système)"""
+        contents = self.history_turns(conversation_history)
+        contents.append({
+            'role': 'user',
+            'parts': [
+                f"CONTEXTE DOCUMENTAIRE:\n{context if context else NO_DOCUMENTS_PLACEHOLDER}",
+                f"QUESTION DE L'UTILISATEUR: {user_question}",
+            ]
+        })
+        return contents
+
+    def build_no_context_contents(self, user_question: str) -> List[Dict]:
+        """Contenus de la requête de repli (aucun document trouvé)"""
+        return [{'role': 'user', 'parts': [user_question]}]
+
+    def history_turns(self, history: Optional[List[Dict]]) -> List[Dict]:
+        """Convertit les derniers échanges en tours de conversation"""
+        turns = []
+        if not history:
+            return turns
+
+        for exchange in history[-self.history_exchanges:]:
+            user_message = exchange.get('user_message')
+            bot_response = exchange.get('bot_response')
+            # Les tours doivent alterner user/model : un échange incomplet est ignoré
+            if not user_message or not bot_response:
+                continue
+            turns.append({'role': 'user', 'parts': [user_message]})
+            turns.append({'role': 'model', 'parts': [bot_response]})
+        return turns
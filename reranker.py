@@ -0,0 +1,170 @@
+"""
+Reclassement des résultats hybrides : fusion des listes mots-clés et vectorielle par
+Reciprocal Rank Fusion, puis cross-encoder CPU dans un budget de temps, avec cache des scores
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+from embedding_service import normalize_query
+from metrics import REGISTRY, startup_timer
+
+RERANK_SECONDS = REGISTRY.histogram('bot_rerank_seconds', "Durée du reclassement par cross-encoder")
+RERANK_PAIRS = REGISTRY.counter('bot_rerank_pairs_total', "Paires (question, document) par origine du score (cache, model, skipped)")
+
+
+def reciprocal_rank_fusion(ranked_lists: List[List[Dict]], k: int = 60) -> List[Dict]:
+    """
+    Fusionne des listes classées : score(d) = somme des 1 / (k + rang)
+    Un document présent dans plusieurs listes garde ses champs fusionnés (scores de chaque méthode)
+    """
+    fused: Dict = OrderedDict()
+    scores: Dict = {}
+    for ranked in ranked_lists:
+        for rank, result in enumerate(ranked, start=1):
+            key = result.get('id', id(result))
+            if key in fused:
+                fused[key] = {**result, **fused[key]}
+            else:
+                fused[key] = dict(result)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+
+    for key, result in fused.items():
+        result['rrf_score'] = scores[key]
+    return sorted(fused.values(), key=lambda result: result['rrf_score'], reverse=True)
+
+
+class CrossEncoderReranker:
+    """
+    Cross-encoder chargé au premier besoin (CPU)
+    Les paires sont scorées par lots, dans l'ordre RRF, tant que le budget le permet :
+    les documents non scorés gardent leur rang RRF, après les documents scorés
+    Chaque lot est dimensionné au budget restant (au moins une paire, qui remet à jour la mesure)
+    """
+
+    def __init__(self, model_factory: Callable[[], object], budget_ms: float = 150,
+                 batch_size: int = 8, cache_size: int = 4096):
+        self._model_factory = model_factory
+        self._model = None
+        self._model_lock = threading.Lock()
+        # Un seul appel au modèle à la fois : les threads CPU ne se disputent pas les cœurs
+        self._predict_lock = threading.Lock()
+        self.budget = budget_ms / 1000
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Durée moyenne (lissée) du scoring d'une paire, pour prévoir le coût d'un lot
+        self._seconds_per_pair: Optional[float] = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    with startup_timer('rerank_model'):
+                        self._model = self._model_factory()
+        return self._model
+
+    def prewarm(self):
+        """Charge le modèle, exécute un lot à blanc (non mesuré) puis mesure le coût d'un lot"""
+        pairs = [("préchauffage", "document de préchauffage")] * self.batch_size
+        self._predict(pairs, measure=False)
+        self._predict(pairs)
+
+    def rerank(self, query: str, results: List[Dict]) -> List[Dict]:
+        """Retourne les résultats triés par rerank_score (copies, champ rerank_score ajouté)"""
+        if not results:
+            return results
+
+        started = time.perf_counter()
+        deadline = started + self.budget
+        key_query = normalize_query(query)
+
+        scores = self._cached_scores(key_query, results)
+        RERANK_PAIRS.inc(len(scores), source='cache')
+        pending = [r for r in results if r.get('id') not in scores and r.get('text')]
+
+        offset = 0
+        while offset < len(pending):
+            size = self._batch_size_for(deadline)
+            if not size:
+                RERANK_PAIRS.inc(len(pending) - offset, source='skipped')
+                break
+            batch = pending[offset:offset + size]
+            batch_scores = self._predict([(query, r['text']) for r in batch], deadline)
+            if batch_scores is None:
+                RERANK_PAIRS.inc(len(pending) - offset, source='skipped')
+                break
+            RERANK_PAIRS.inc(len(batch), source='model')
+            fresh = {r['id']: score for r, score in zip(batch, batch_scores)}
+            scores.update(fresh)
+            self._store_scores(key_query, fresh)
+            offset += len(batch)
+
+        scored = []
+        unscored = []
+        for result in results:
+            if result.get('id') in scores:
+                scored.append(dict(result, rerank_score=scores[result['id']]))
+            else:
+                unscored.append(result)
+        scored.sort(key=lambda result: result['rerank_score'], reverse=True)
+
+        RERANK_SECONDS.observe(time.perf_counter() - started)
+        return scored + unscored
+
+    def _batch_size_for(self, deadline: float) -> int:
+        """
+        Paires du prochain lot selon le budget restant (0 : budget épuisé)
+        Toujours au moins une paire tant qu'il reste du temps : un modèle plus lent que prévu
+        continue d'être mesuré au lieu d'être écarté pour toujours
+        """
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return 0
+        if not self._seconds_per_pair:
+            # Coût encore inconnu (pas de préchauffage) : on tente, la mesure servira ensuite
+            return self.batch_size
+        return min(self.batch_size, max(1, int(remaining / self._seconds_per_pair)))
+
+    def _predict(self, pairs: List[Tuple[str, str]], deadline: Optional[float] = None,
+                 measure: bool = True) -> Optional[List[float]]:
+        # Chargement hors de la mesure : sinon il serait compté comme coût par paire
+        model = self.model
+        timeout = -1 if deadline is None else max(0.0, deadline - time.perf_counter())
+        if not self._predict_lock.acquire(timeout=timeout):
+            return None
+        try:
+            started = time.perf_counter()
+            scores = model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+            per_pair = (time.perf_counter() - started) / len(pairs)
+        finally:
+            self._predict_lock.release()
+        if measure:
+            self._seconds_per_pair = per_pair if self._seconds_per_pair is None \
+                else 0.8 * self._seconds_per_pair + 0.2 * per_pair
+        return [float(score) for score in scores]
+
+    def _cached_scores(self, key_query: str, results: List[Dict]) -> Dict:
+        found = {}
+        with self._cache_lock:
+            for result in results:
+                key = (key_query, result.get('id'))
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    found[result['id']] = self._cache[key]
+        return found
+
+    def _store_scores(self, key_query: str, scores: Dict):
+        with self._cache_lock:
+            for doc_id, score in scores.items():
+                self._cache[(key_query, doc_id)] = score
+                self._cache.move_to_end((key_query, doc_id))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+def create_cross_encoder(model_name: str):
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(model_name, device='cpu')
@@ -0,0 +1,186 @@
+"""
+Cache des réponses générées : niveau exact (question normalisée + candidat + documents)
+et niveau sémantique (embedding de la question proche d'une question déjà traitée)
+Avec un stockage partagé, le niveau exact est aussi partagé entre les workers
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from metrics import REGISTRY
+from text_processing import fold_accents
+
+CACHE_HITS = REGISTRY.counter('bot_response_cache_hits_total', "Réponses servies depuis le cache")
+CACHE_MISSES = REGISTRY.counter('bot_response_cache_misses_total', "Recherches dans le cache sans résultat")
+CACHE_INVALIDATIONS = REGISTRY.counter('bot_response_cache_invalidations_total', "Vidages du cache (connaissances modifiées)")
+
+
+def normalize_question(text: str) -> str:
+    """Minuscules, sans accents ni ponctuation, espaces compactés"""
+    text = re.sub(r"[^\w\s]", " ", fold_accents(text))
+    return ' '.join(text.split())
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600, semantic_distance: float = 0.08,
+                 store=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic_distance = semantic_distance
+        # clé -> (expiration, réponse)
+        self._exact: OrderedDict = OrderedDict()
+        # clé -> (expiration, candidat, vecteur normalisé, réponse)
+        self._semantic: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._knowledge_version = None
+        self._watch_thread = None
+        # Second niveau exact, commun aux workers (None : processus seul)
+        self.store = store if store is not None and store.shared else None
+
+    @staticmethod
+    def make_key(question: str, candidate: Optional[str], doc_ids: List) -> str:
+        """Clé exacte : question normalisée + candidat + IDs des documents retrouvés"""
+        raw = '|'.join([
+            normalize_question(question),
+            candidate or '',
+            ','.join(str(doc_id) for doc_id in sorted(doc_ids, key=str))
+        ])
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Recherche exacte (mémoire du processus, puis stockage partagé)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._exact.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._exact.move_to_end(key)
+                    CACHE_HITS.inc(tier='exact')
+                    return entry[1]
+                del self._exact[key]
+        if self.store is not None:
+            try:
+                response = self.store.get(self._shared_key(key))
+            except Exception as e:
+                print(f"Erreur lecture cache partagé: {e}")
+                response = None
+            if response is not None:
+                with self._lock:
+                    self._exact[key] = (now + self.ttl, response)
+                    self._evict()
+                CACHE_HITS.inc(tier='shared')
+                return response
+        CACHE_MISSES.inc(tier='exact')
+        return None
+
+    def get_semantic(self, embedding: Optional[List[float]], candidate: Optional[str]) -> Optional[str]:
+        """
+        Recherche sémantique : réutilise la réponse d'une question dont l'embedding est
+        à moins de `semantic_distance` (distance cosinus), pour le même candidat
+        """
+        if embedding is None or self.semantic_distance <= 0:
+            return None
+
+        query = self._normalize_vector(embedding)
+        now = time.monotonic()
+        best_key, best_similarity = None, 1.0 - self.semantic_distance
+
+        with self._lock:
+            expired = [k for k, entry in self._semantic.items() if entry[0] <= now]
+            for k in expired:
+                del self._semantic[k]
+
+            for k, (_, entry_candidate, vector, _) in self._semantic.items():
+                if entry_candidate != candidate:
+                    continue
+                similarity = float(np.dot(query, vector))
+                if similarity >= best_similarity:
+                    best_key, best_similarity = k, similarity
+
+            if best_key is not None:
+                self._semantic.move_to_end(best_key)
+                CACHE_HITS.inc(tier='semantic')
+                return self._semantic[best_key][3]
+
+        CACHE_MISSES.inc(tier='semantic')
+        return None
+
+    def put(self, key: str, response: str, embedding: Optional[List[float]] = None,
+            candidate: Optional[str] = None):
+        """Enregistre une réponse dans les deux niveaux"""
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._exact[key] = (expires_at, response)
+            self._exact.move_to_end(key)
+            if embedding is not None:
+                self._semantic[key] = (expires_at, candidate, self._normalize_vector(embedding), response)
+                self._semantic.move_to_end(key)
+            self._evict()
+        if self.store is not None:
+            try:
+                self.store.set(self._shared_key(key), response, ttl=self.ttl)
+            except Exception as e:
+                print(f"Erreur écriture cache partagé: {e}")
+
+    def _evict(self):
+        """Éviction LRU (verrou tenu par l'appelant)"""
+        while len(self._exact) > self.max_entries:
+            self._exact.popitem(last=False)
+        while len(self._semantic) > self.max_entries:
+            self._semantic.popitem(last=False)
+
+    def _shared_key(self, key: str) -> str:
+        # La version de la base fait partie de la clé : une base modifiée rend les anciennes entrées inaccessibles
+        return f"response:{self._knowledge_version or ''}:{key}"
+
+    def invalidate(self):
+        """Vide entièrement le cache"""
+        with self._lock:
+            self._exact.clear()
+            self._semantic.clear()
+        CACHE_INVALIDATIONS.inc()
+
+    def check_knowledge_version(self, version: Optional[str]):
+        """Vide le cache si la version de la table knowledge a changé"""
+        if version is None:
+            return
+        if self._knowledge_version is not None and version != self._knowledge_version:
+            print(f"Base de connaissances modifiée ({self._knowledge_version} -> {version}), vidage du cache")
+            self.invalidate()
+        self._knowledge_version = version
+
+    def start_invalidation_watch(self, fetch_version: Callable[[], Optional[str]], interval: float = 300):
+        """Surveille périodiquement la version de la table knowledge dans un thread"""
+        if self._watch_thread is not None:
+            return
+
+        def watch():
+            while True:
+                try:
+                    self.check_knowledge_version(fetch_version())
+                except Exception as e:
+                    print(f"Erreur surveillance cache: {e}")
+                time.sleep(interval)
+
+        self._watch_thread = threading.Thread(target=watch, name='response-cache-watch', daemon=True)
+        self._watch_thread.start()
+
+    def stats(self) -> Dict:
+        return {
+            'exact_entries': len(self._exact),
+            'semantic_entries': len(self._semantic),
+            'hits_exact': CACHE_HITS.value(tier='exact'),
+            'hits_semantic': CACHE_HITS.value(tier='semantic'),
+            'hits_shared': CACHE_HITS.value(tier='shared'),
+            'misses_exact': CACHE_MISSES.value(tier='exact'),
+            'misses_semantic': CACHE_MISSES.value(tier='semantic'),
+        }
+
+    @staticmethod
+    def _normalize_vector(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
@@ -1,37 +1,152 @@
+import contextvars
+import functools
+import threading
 from typing import List, Dict, Optional, Tuple
-from sentence_transformers import SentenceTransformer
-from text_processing import extract_keywords, extract_candidate_mentions
+from concurrent.futures import Future, ThreadPoolExecutor
+from text_processing import extract_keywords, extract_all_candidate_mentions
 from database import Database
-from config import KEYWORD_THRESHOLD, RAG_THRESHOLD, MAX_SEARCH_RESULTS
+from vector_index import build_vector_index
+from keyword_index import KeywordIndex
+from embedding_service import EmbeddingService, create_backend
+from context_packer import ContextPacker, TokenEstimator
+from document_cache import DocumentTextCache
+from reranker import CrossEncoderReranker, create_cross_encoder, reciprocal_rank_fusion
+from knowledge_snapshot import open_snapshot
+from config import (
+    KEYWORD_THRESHOLD, RAG_THRESHOLD, MAX_SEARCH_RESULTS, MAX_CONTEXT_TOKENS, CHARS_PER_TOKEN,
+    SEARCH_CONCURRENT, SPECULATIVE_RAG, SEARCH_FANOUT_WORKERS,
+    VECTOR_INDEX_BACKEND, VECTOR_INDEX_REFRESH_INTERVAL,
+    KEYWORD_INDEX_ENABLED, KEYWORD_SCORING, KNOWLEDGE_SNAPSHOT_PATH, KNOWLEDGE_SNAPSHOT_VALIDATE,
+    EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_BATCH_WINDOW_MS,
+    EMBEDDING_MAX_BATCH_SIZE, EMBEDDING_CACHE_SIZE, LAZY_LOADING,
+    DOCUMENT_CACHE_SIZE, DOCUMENT_CACHE_TTL,
+    RERANK_ENABLED, RERANK_MODEL, RERANK_BUDGET_MS, RERANK_BATCH_SIZE,
+    RERANK_POOL_SIZE, RERANK_TOP_K, RERANK_CACHE_SIZE, RRF_K
+)
+from metrics import startup_timer
+from tracing import stage_span
 
 class SearchEngine:
-    def __init__(self):
-        self.db = Database()
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+    def __init__(self, db: Optional[Database] = None):
+        self.db = db or Database()
+        self.embedding_service = EmbeddingService(
+            functools.partial(create_backend, EMBEDDING_BACKEND, EMBEDDING_MODEL),
+            batch_window_ms=EMBEDDING_BATCH_WINDOW_MS,
+            max_batch_size=EMBEDDING_MAX_BATCH_SIZE,
+            cache_size=EMBEDDING_CACHE_SIZE
+        )
+        self.executor = ThreadPoolExecutor(max_workers=SEARCH_FANOUT_WORKERS, thread_name_prefix='search-fanout')
+        self.context_packer = ContextPacker(TokenEstimator(CHARS_PER_TOKEN))
+        self.document_cache = DocumentTextCache(max_entries=DOCUMENT_CACHE_SIZE, ttl=DOCUMENT_CACHE_TTL)
+        self.reranker = CrossEncoderReranker(
+            functools.partial(create_cross_encoder, RERANK_MODEL),
+            budget_ms=RERANK_BUDGET_MS,
+            batch_size=RERANK_BATCH_SIZE,
+            cache_size=RERANK_CACHE_SIZE
+        ) if RERANK_ENABLED else None
+        
+        # Index locaux (None = requêtes Supabase), chargés par prewarm()
+        self.vector_index = build_vector_index(VECTOR_INDEX_BACKEND)
+        self.keyword_index = KeywordIndex(scoring=KEYWORD_SCORING) if KEYWORD_INDEX_ENABLED else None
+        # Instantané mmap ouvert par prewarm() (index + texte des documents), None sinon
+        self.snapshot = None
+        # Documents modifiés depuis l'export : leur texte dans l'instantané est périmé
+        self._stale_snapshot_ids = set()
+        self._prewarm_lock = threading.Lock()
+        self._prewarm_started = False
+        
+        if not LAZY_LOADING:
+            self.prewarm()
+    
+    def prewarm(self):
+        """
+        Charge le modèle d'embedding et les index locaux (une seule fois)
+        Tant qu'un index n'est pas prêt, la recherche passe par Supabase
+        En cas d'échec, la prochaine recherche relance le préchauffage
+        """
+        with self._prewarm_lock:
+            if self._prewarm_started:
+                return
+            self._prewarm_started = True
         
+        try:
+            self._prewarm()
+        except Exception:
+            with self._prewarm_lock:
+                self._prewarm_started = False
+            raise
+    
+    def _prewarm(self):
+        self.embedding_service.prewarm()
+        if self.reranker is not None:
+            self.reranker.prewarm()
+        # Nouvelle tentative : les index déjà chargés sont gardés
+        indexes = [(name, index) for name, index in
+                   (('vector_index', self.vector_index), ('keyword_index', self.keyword_index))
+                   if index is not None and not index.ready]
+        if indexes and KNOWLEDGE_SNAPSHOT_PATH and self.snapshot is None:
+            with startup_timer('knowledge_snapshot'):
+                self.snapshot = open_snapshot(
+                    KNOWLEDGE_SNAPSHOT_PATH, self.db if KNOWLEDGE_SNAPSHOT_VALIDATE else None
+                )
+        for name, index in indexes:
+            with startup_timer(name):
+                if self.snapshot is not None:
+                    index.load_snapshot(self.snapshot)
+                else:
+                    index.load(self.db)
+            # Réconciliation périodique : documents ajoutés, modifiés ou supprimés depuis le chargement
+            index.start_auto_refresh(self.db, VECTOR_INDEX_REFRESH_INTERVAL, on_change=self._on_knowledge_changed)
+    
+    def _on_knowledge_changed(self, changed: List[int], removed: List[int]):
+        """Textes en cache des documents modifiés ou supprimés"""
+        self.document_cache.discard(changed + removed)
+        if self.snapshot is not None:
+            self._stale_snapshot_ids.update(changed)
+    
+    def start_prewarm(self):
+        """Lance prewarm() en arrière-plan"""
+        if not self._prewarm_started:
+            threading.Thread(target=self.prewarm, name='search-prewarm', daemon=True).start()
+    
     def search(self, query: str) -> Tuple[List[Dict], str]:
         """
         Recherche hybride : mots-clés d'abord, puis RAG si nécessaire
         Retourne (résultats, méthode_utilisée)
         """
+        # Première utilisation sans préchauffage : chargement des index en arrière-plan
+        self.start_prewarm()
+        
+        if self.reranker is not None:
+            results, method = self._search_reranked(query)
+        elif SEARCH_CONCURRENT:
+            results, method = self._search_concurrent(query)
+        else:
+            results, method = self._search_sequential(query)
+        
+        # Texte complet uniquement pour les documents retenus
+        return self.hydrate(results), method
+    
+    def _search_sequential(self, query: str) -> Tuple[List[Dict], str]:
+        """Mots-clés, puis RAG si les résultats sont insuffisants"""
         # 1. Extraire les mots-clés et candidats mentionnés
         keywords = extract_keywords(query)
-        candidate = extract_candidate_mentions(query)
+        candidates = extract_all_candidate_mentions(query)
         
         print(f"Recherche pour: '{query}'")
         print(f"Mots-clés extraits: {keywords}")
-        print(f"Candidat détecté: {candidate}")
+        print(f"Candidats détectés: {candidates}")
         
         # 2. Première étape : recherche par mots-clés
-        keyword_results = self._search_by_keywords(keywords, candidate)
+        keyword_results = self._search_by_keywords(keywords, candidates)
         
         if self._is_sufficient_results(keyword_results):
             print(f"Recherche par mots-clés suffisante: {len(keyword_results)} résultats")
-            return self._rank_results(keyword_results, query), "keywords"
+            return self._rank_results(keyword_results, query, candidates), "keywords"
         
         # 3. Deuxième étape : recherche RAG
         print("Recherche par mots-clés insuffisante, passage au RAG")
-        rag_results = self._search_by_rag(query, candidate)
+        rag_results = self._search_by_rag(query, candidates)
         
         if rag_results:
             print(f"Recherche RAG: {len(rag_results)} résultats")
@@ -39,14 +154,180 @@ class SearchEngine:
         
         # 4. Fallback : retourner les résultats des mots-clés même s'ils sont peu nombreux
         print("Aucun résultat RAG, retour aux mots-clés")
-        return self._rank_results(keyword_results, query), "keywords_fallback"
+        return self._rank_results(keyword_results, query, candidates), "keywords_fallback"
+    
+    def _search_concurrent(self, query: str) -> Tuple[List[Dict], str]:
+        """
+        Recherche hybride en parallèle : la requête mots-clés et l'embedding de la
+        question sont lancés ensemble, la RPC vectorielle éventuellement en spéculatif
+        Même sémantique que la recherche séquentielle
+        """
+        keywords = extract_keywords(query)
+        candidates = extract_all_candidate_mentions(query)
+        
+        print(f"Recherche concurrente pour: '{query}'")
+        print(f"Mots-clés extraits: {keywords}")
+        print(f"Candidats détectés: {candidates}")
+        
+        keyword_future = self._submit(self._search_by_keywords, keywords, candidates)
+        embedding_future = self._submit(self.encode_query, query)
+        rag_future = self._launch_speculative_rag(embedding_future, candidates) if SPECULATIVE_RAG else None
+        
+        keyword_results = keyword_future.result()
+        
+        if self._is_sufficient_results(keyword_results):
+            # Résultats suffisants : la branche RAG est abandonnée
+            embedding_future.cancel()
+            if rag_future is not None:
+                rag_future.cancel()
+            print(f"Recherche par mots-clés suffisante: {len(keyword_results)} résultats")
+            return self._rank_results(keyword_results, query, candidates), "keywords"
+        
+        print("Recherche par mots-clés insuffisante, passage au RAG")
+        try:
+            if rag_future is not None:
+                rag_results = rag_future.result()
+            else:
+                rag_results = self._search_by_embedding(embedding_future.result(), candidates)
+        except Exception as e:
+            print(f"Erreur recherche RAG: {e}")
+            rag_results = []
+        
+        if rag_results:
+            print(f"Recherche RAG: {len(rag_results)} résultats")
+            return rag_results, "rag"
+        
+        print("Aucun résultat RAG, retour aux mots-clés")
+        return self._rank_results(keyword_results, query, candidates), "keywords_fallback"
     
-    def _search_by_keywords(self, keywords: List[str], candidate: Optional[str] = None) -> List[Dict]:
-        """Recherche par mots-clés"""
+    def _search_reranked(self, query: str) -> Tuple[List[Dict], str]:
+        """
+        Mots-clés et RAG toujours lancés ensemble, listes fusionnées par RRF,
+        puis reclassées par le cross-encoder ; seuls les RERANK_TOP_K meilleurs sont gardés
+        """
+        keywords = extract_keywords(query)
+        candidates = extract_all_candidate_mentions(query)
+        
+        print(f"Recherche reclassée pour: '{query}'")
+        print(f"Mots-clés extraits: {keywords}")
+        print(f"Candidats détectés: {candidates}")
+        
+        keyword_future = self._submit(self._search_by_keywords, keywords, candidates)
+        embedding_future = self._submit(self.encode_query, query)
+        
+        keyword_results = self._rank_results(keyword_future.result(), query, candidates, limit=RERANK_POOL_SIZE)
+        try:
+            rag_results = self._search_by_embedding(embedding_future.result(), candidates, limit=RERANK_POOL_SIZE)
+        except Exception as e:
+            print(f"Erreur recherche RAG: {e}")
+            rag_results = []
+        
+        fused = reciprocal_rank_fusion([keyword_results, rag_results], k=RRF_K)[:RERANK_POOL_SIZE]
+        if not fused:
+            return [], "hybrid"
+        
+        # Le cross-encoder a besoin du texte : hydratation du pool avant le reclassement
+        fused = self.hydrate(fused)
+        with stage_span('rerank'):
+            reranked = self.reranker.rerank(query, fused)
+        
+        if candidates and len(candidates) > 1:
+            reranked = self._interleave([
+                [r for r in reranked if r.get('candidate') == c] for c in candidates
+            ])
+        
+        print(f"Recherche reclassée: {len(fused)} candidats fusionnés "
+              f"({len(keyword_results)} mots-clés, {len(rag_results)} RAG)")
+        return reranked[:RERANK_TOP_K], "hybrid"
+    
+    def _launch_speculative_rag(self, embedding_future: Future, candidates: List[str]) -> Future:
+        """
+        Enchaîne la RPC match_documents dès que l'embedding est prêt
+        Le Future retourné peut être annulé tant que la RPC n'a pas démarré
+        """
+        rag_future = Future()
+        
+        def run_rpc(query_embedding: List[float]):
+            # Dernier point d'annulation avant l'appel réseau
+            if not rag_future.set_running_or_notify_cancel():
+                return
+            try:
+                rag_future.set_result(self._search_by_embedding(query_embedding, candidates))
+            except Exception as e:
+                rag_future.set_exception(e)
+        
+        def on_embedding_done(done: Future):
+            if rag_future.cancelled():
+                return
+            if done.cancelled() or done.exception() is not None:
+                if rag_future.set_running_or_notify_cancel():
+                    if done.cancelled():
+                        rag_future.set_result([])
+                    else:
+                        rag_future.set_exception(done.exception())
+                return
+            self._submit(run_rpc, done.result())
+        
+        embedding_future.add_done_callback(on_embedding_done)
+        return rag_future
+    
+    def hydrate(self, results: List[Dict]) -> List[Dict]:
+        """
+        Complète le texte des résultats qui n'en ont pas (projection sans texte),
+        depuis le cache puis en une seule requête pour les manquants
+        Un échec de cette requête est propagé : seuls les documents absents de la base sont écartés
+        """
+        missing = [r['id'] for r in results if r.get('text') is None and r.get('id') is not None]
+        if not missing:
+            return results
+        
+        with stage_span('hydrate'):
+            texts = self.document_cache.get_many(missing)
+            to_fetch = [doc_id for doc_id in missing if doc_id not in texts]
+            if to_fetch and self.snapshot is not None:
+                texts.update(self.snapshot.texts(
+                    doc_id for doc_id in to_fetch if doc_id not in self._stale_snapshot_ids
+                ))
+                to_fetch = [doc_id for doc_id in to_fetch if doc_id not in texts]
+            if to_fetch:
+                fetched = {
+                    doc_id: row.get('text') or ''
+                    for doc_id, row in self.db.get_documents_by_ids(to_fetch, columns=['id', 'text']).items()
+                }
+                self.document_cache.put_many(fetched)
+                texts.update(fetched)
+        
+        hydrated = []
+        for result in results:
+            if result.get('text') is None:
+                if result.get('id') not in texts:
+                    # Document supprimé entre la recherche et le chargement
+                    continue
+                result = dict(result, text=texts[result['id']])
+            hydrated.append(result)
+        return hydrated
+    
+    def _submit(self, func, *args) -> Future:
+        """Soumet au pool de fan-out en propageant le contexte (trace de la requête)"""
+        return self.executor.submit(contextvars.copy_context().run, func, *args)
+    
+    def _search_by_keywords(self, keywords: List[str], candidates: Optional[List[str]] = None) -> List[Dict]:
+        """Recherche par mots-clés (filtrée sur les candidats mentionnés s'il y en a)"""
         if not keywords:
             return []
         
-        results = self.db.search_by_keywords(keywords, candidate)
+        with stage_span('keyword_search'):
+            return self._keyword_search(keywords, candidates)
+    
+    def _keyword_search(self, keywords: List[str], candidates: Optional[List[str]]) -> List[Dict]:
+        # Index local : le score est calculé pendant la sélection top-k
+        if self.keyword_index is not None and self.keyword_index.ready:
+            results = []
+            for candidate in (candidates or [None]):
+                results.extend(self.keyword_index.search(keywords, candidate))
+            return results
+        
+        results = self.db.search_by_keywords(keywords, candidates)
         
         # Calculer un score de pertinence basé sur le nombre de mots-clés matchés
         for result in results:
@@ -55,16 +336,43 @@ class SearchEngine:
         
         return results
     
-    def _search_by_rag(self, query: str, candidate: Optional[str] = None) -> List[Dict]:
+    def _search_by_rag(self, query: str, candidates: Optional[List[str]] = None) -> List[Dict]:
         """Recherche par similarité vectorielle (RAG)"""
         # Générer l'embedding de la question
-        query_embedding = self.embedding_model.encode(query).tolist()
+        query_embedding = self.encode_query(query)
+        
+        return self._search_by_embedding(query_embedding, candidates)
+    
+    def encode_query(self, query: str) -> List[float]:
+        """Calcule l'embedding de la question"""
+        with stage_span('embedding'):
+            return self.embedding_service.encode(query)
+    
+    def _search_by_embedding(self, query_embedding: List[float], candidates: Optional[List[str]] = None,
+                             limit: int = MAX_SEARCH_RESULTS) -> List[Dict]:
+        """Recherche vectorielle à partir d'un embedding déjà calculé"""
+        with stage_span('vector_search'):
+            # Comparaison : une recherche par candidat, résultats alternés pour couvrir chacun
+            if candidates and len(candidates) > 1:
+                per_candidate = [self._vector_search(query_embedding, c, limit) for c in candidates]
+                return self._interleave(per_candidate)[:limit]
+            
+            return self._vector_search(query_embedding, candidates[0] if candidates else None, limit)
+    
+    def _vector_search(self, query_embedding: List[float], candidate: Optional[str],
+                       limit: int = MAX_SEARCH_RESULTS) -> List[Dict]:
+        if self.vector_index is not None and self.vector_index.ready:
+            return self.vector_index.search(
+                query_embedding,
+                candidate,
+                limit=limit,
+                threshold=RAG_THRESHOLD
+            )
         
-        # Recherche vectorielle
         results = self.db.search_by_similarity(
             query_embedding, 
             candidate, 
-            limit=MAX_SEARCH_RESULTS,
+            limit=limit,
             threshold=RAG_THRESHOLD
         )
         
@@ -79,51 +387,50 @@ class SearchEngine:
         good_results = [r for r in results if r.get('keyword_score', 0) >= min_score]
         return len(good_results) >= 1
     
-    def _rank_results(self, results: List[Dict], query: str) -> List[Dict]:
+    def _rank_results(self, results: List[Dict], query: str,
+                      candidates: Optional[List[str]] = None, limit: int = MAX_SEARCH_RESULTS) -> List[Dict]:
         """Classe les résultats par pertinence"""
         if not results:
             return []
         
-        # Trier par score de mots-clés décroissant
+        # Trier par score de mots-clés décroissant (BM25 s'il a été calculé)
         sorted_results = sorted(
             results, 
-            key=lambda x: x.get('keyword_score', 0), 
+            key=lambda x: x.get('bm25_score', x.get('keyword_score', 0)), 
             reverse=True
         )
         
-        return sorted_results[:MAX_SEARCH_RESULTS]
+        # Comparaison : alterner les candidats pour qu'aucun ne soit évincé du contexte
+        if candidates and len(candidates) > 1:
+            sorted_results = self._interleave([
+                [r for r in sorted_results if r.get('candidate') == c] for c in candidates
+            ])
+        
+        return sorted_results[:limit]
+    
+    @staticmethod
+    def _interleave(ranked_lists: List[List[Dict]]) -> List[Dict]:
+        """Fusionne des listes classées en alternant (1er de chaque, puis 2e...)"""
+        merged = []
+        for rank in range(max((len(r) for r in ranked_lists), default=0)):
+            for ranked in ranked_lists:
+                if rank < len(ranked):
+                    merged.append(ranked[rank])
+        return merged
     
-    def get_context_for_llm(self, search_results: List[Dict], max_tokens: int = 3000) -> str:
+    def get_context_for_llm(self, search_results: List[Dict], max_tokens: int = MAX_CONTEXT_TOKENS) -> str:
         """
         Prépare le contexte pour envoyer au LLM
-        Estime grossièrement les tokens (1 token ≈ 4 caractères)
         """
-        if not search_results:
-            return ""
-        
-        context_parts = []
-        current_length = 0
-        max_chars = max_tokens * 4
-        
-        for i, result in enumerate(search_results):
-            # Formater le résultat
-            part = f"""
-Document {i+1}:
-Source: {result.get('source_link', 'N/A')}
-Candidat: {result.get('candidate', 'Information générale')}
-Section: {result.get('section', 'N/A')}
-Contenu: {result.get('text', '')}
----
-"""
-            
-            # Vérifier si on dépasse la limite
-            if current_length + len(part) > max_chars:
-                break
-            
-            context_parts.append(part)
-            current_length += len(part)
-        
-        return '\n'.join(context_parts)
+        context, _ = self.pack_context(search_results, max_tokens)
+        return context
+    
+    def pack_context(self, search_results: List[Dict], max_tokens: int = MAX_CONTEXT_TOKENS) -> Tuple[str, int]:
+        """
+        Prépare le contexte dans le budget de tokens et retourne (contexte, tokens utilisés)
+        Documents dédoublonnés, pris par pertinence, le dernier tronqué à une fin de phrase
+        """
+        return self.context_packer.pack(search_results, max_tokens)
     
     def format_sources(self, search_results: List[Dict]) -> str:
         """Formate les sources pour l'affichage"""
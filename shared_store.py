@@ -0,0 +1,309 @@
+"""
+Stockage clé-valeur partagé entre les workers (plusieurs processus Gunicorn)
+- MemoryStore : dans le processus (un seul worker, développement) ; même interface
+- SQLiteStore : fichier local, partagé par les processus d'une même machine, sans serveur
+- RedisStore  : plusieurs machines (paquet redis requis)
+
+Sert à coordonner ce qui ne doit pas être dupliqué par worker : enregistrement du webhook
+(un seul leader), partage du quota Gemini, cache des réponses, versions des historiques
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from config import SHARED_STORE_URL
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class SharedStore:
+    """Valeurs texte avec expiration optionnelle (ttl en secondes)"""
+
+    shared = True
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        """Écrit seulement si la clé est absente (ou expirée) ; True si écrite"""
+        raise NotImplementedError
+
+    def incr(self, key: str, ttl: Optional[float] = None) -> int:
+        """Incrémente un compteur (créé à 0) et retourne la nouvelle valeur"""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def count(self, prefix: str) -> int:
+        """Nombre de clés vivantes commençant par `prefix`"""
+        raise NotImplementedError
+
+
+class MemoryStore(SharedStore):
+    """Stand-in local : mêmes sémantiques, visibles du seul processus courant"""
+
+    shared = False
+
+    def __init__(self):
+        # clé -> (valeur, expiration monotonic ou None)
+        self._entries: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str, now: float) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self._entries[key]
+            return None
+        return value
+
+    @staticmethod
+    def _expiry(ttl: Optional[float], now: float) -> Optional[float]:
+        return now + ttl if ttl else None
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._live(key, time.monotonic())
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (value, self._expiry(ttl, now))
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if self._live(key, now) is not None:
+                return False
+            self._entries[key] = (value, self._expiry(ttl, now))
+            return True
+
+    def incr(self, key: str, ttl: Optional[float] = None) -> int:
+        now = time.monotonic()
+        with self._lock:
+            current = self._live(key, now)
+            value = int(current or 0) + 1
+            expires_at = self._entries[key][1] if current is not None else self._expiry(ttl, now)
+            self._entries[key] = (str(value), expires_at)
+            return value
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def count(self, prefix: str) -> int:
+        now = time.monotonic()
+        with self._lock:
+            return sum(1 for key in list(self._entries) if key.startswith(prefix) and self._live(key, now) is not None)
+
+
+class SQLiteStore(SharedStore):
+    """
+    Fichier SQLite (mode WAL) partagé par tous les workers de la machine
+    Une connexion par thread ; expirations en temps réel (time.time, commun aux processus)
+    """
+
+    # Purge des clés expirées toutes les N écritures
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as conn:
+            conn.execute(
+                "create table if not exists store ("
+                "key text primary key, value text not null, expires_at real)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=normal")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _expiry(ttl: Optional[float]) -> Optional[float]:
+        return time.time() + ttl if ttl else None
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._connection().execute(
+            "select value from store where key = ? and (expires_at is null or expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        conn = self._connection()
+        conn.execute(
+            "insert or replace into store (key, value, expires_at) values (?, ?, ?)",
+            (key, value, self._expiry(ttl))
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute("delete from store where expires_at <= ?", (time.time(),))
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        conn = self._connection()
+        conn.execute("begin immediate")
+        try:
+            conn.execute("delete from store where key = ? and expires_at <= ?", (key, time.time()))
+            inserted = conn.execute(
+                "insert or ignore into store (key, value, expires_at) values (?, ?, ?)",
+                (key, value, self._expiry(ttl))
+            ).rowcount
+            conn.execute("commit")
+        except Exception:
+            conn.execute("rollback")
+            raise
+        return inserted == 1
+
+    def incr(self, key: str, ttl: Optional[float] = None) -> int:
+        conn = self._connection()
+        conn.execute("begin immediate")
+        try:
+            conn.execute("delete from store where key = ? and expires_at <= ?", (key, time.time()))
+            conn.execute(
+                "insert into store (key, value, expires_at) values (?, '1', ?) "
+                "on conflict(key) do update set value = cast(value as integer) + 1",
+                (key, self._expiry(ttl))
+            )
+            value = conn.execute("select value from store where key = ?", (key,)).fetchone()[0]
+            conn.execute("commit")
+        except Exception:
+            conn.execute("rollback")
+            raise
+        return int(value)
+
+    def delete(self, key: str):
+        self._connection().execute("delete from store where key = ?", (key,))
+
+    def count(self, prefix: str) -> int:
+        # Bornes de plage plutôt que LIKE (les '_' et '%' des clés restent littéraux)
+        return self._connection().execute(
+            "select count(*) from store where key >= ? and key < ? and (expires_at is null or expires_at > ?)",
+            (prefix, prefix + '\uffff', time.time())
+        ).fetchone()[0]
+
+
+class RedisStore(SharedStore):
+    def __init__(self, url: str):
+        if redis is None:
+            raise ImportError("redis est requis pour SHARED_STORE_URL=redis://... (pip install redis)")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key: str) -> Optional[str]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        self.client.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        return bool(self.client.set(key, value, nx=True, px=int(ttl * 1000) if ttl else None))
+
+    def incr(self, key: str, ttl: Optional[float] = None) -> int:
+        value = int(self.client.incr(key))
+        if ttl and value == 1:
+            # Expiration posée à la création du compteur seulement
+            self.client.pexpire(key, int(ttl * 1000))
+        return value
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+    def count(self, prefix: str) -> int:
+        return sum(1 for _ in self.client.scan_iter(match=f"{prefix}*", count=500))
+
+
+def create_store(url: str) -> SharedStore:
+    """SHARED_STORE_URL : "" ou "memory://", "sqlite:///chemin/store.db", "redis://hôte:6379/0" """
+    if not url or url.startswith('memory:'):
+        return MemoryStore()
+    scheme = urlparse(url).scheme
+    if scheme == 'sqlite':
+        path = url[len('sqlite:///'):] if url.startswith('sqlite:///') else url[len('sqlite://'):]
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        return SQLiteStore(path)
+    if scheme in ('redis', 'rediss', 'unix'):
+        return RedisStore(url)
+    raise ValueError(f"Stockage partagé inconnu: {url}")
+
+
+class WorkerRegistry:
+    """
+    Battement de cœur de chaque worker dans le stockage partagé ; `on_change` est appelé
+    avec le nombre de workers vivants quand il change (répartition du quota, etc.)
+    """
+
+    PREFIX = 'workers:'
+
+    def __init__(self, store: SharedStore, interval: float = 10.0):
+        self.store = store
+        self.interval = interval
+        self.key = f"{self.PREFIX}{socket.gethostname()}:{os.getpid()}"
+        self.live_workers = 1
+        self._callbacks: List[Callable[[int], None]] = []
+        self._thread = None
+
+    def on_change(self, callback: Callable[[int], None]):
+        self._callbacks.append(callback)
+
+    def beat(self):
+        # Clé expirée après trois battements manqués : un worker arrêté sort du décompte
+        self.store.set(self.key, str(time.time()), ttl=self.interval * 3)
+        live = max(1, self.store.count(self.PREFIX))
+        if live != self.live_workers:
+            print(f"Workers actifs: {self.live_workers} -> {live}")
+            self.live_workers = live
+            for callback in self._callbacks:
+                callback(live)
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.beat()
+                except Exception as e:
+                    print(f"Erreur battement de cœur du worker: {e}")
+                time.sleep(self.interval)
+
+        self._thread = threading.Thread(target=run, name='worker-heartbeat', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        try:
+            self.store.delete(self.key)
+        except Exception as e:
+            print(f"Erreur désinscription du worker: {e}")
+
+
+_store: Optional[SharedStore] = None
+_store_lock = threading.Lock()
+
+
+def get_shared_store() -> SharedStore:
+    """Stockage partagé du processus (SHARED_STORE_URL)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = create_store(SHARED_STORE_URL)
+        return _store
@@ -0,0 +1,62 @@
+"""
+Réponse Telegram progressive : un seul message, édité au fil du flux Gemini
+"""
+import asyncio
+import logging
+import time
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Curseur affiché tant que la génération est en cours
+CURSOR = " ▌"
+
+
+class StreamingReply:
+    """Les éditions sont espacées d'au moins `min_interval` secondes (limites de débit Telegram)"""
+
+    def __init__(self, message: Message, min_interval: float = 1.0):
+        self.message = message
+        self.min_interval = min_interval
+        self.sent = None
+        self._last_edit = 0.0
+        self._last_text = ""
+
+    async def update(self, text: str):
+        """Texte partiel : envoi du message au premier fragment, puis éditions limitées"""
+        if not text.strip():
+            return
+        if self.sent is None:
+            self.sent = await self.message.reply_text(text + CURSOR)
+            self._last_text = text + CURSOR
+            self._last_edit = time.monotonic()
+            return
+        if time.monotonic() - self._last_edit < self.min_interval:
+            return
+        await self._edit(text + CURSOR)
+
+    async def finish(self, text: str):
+        """Texte final complet (sources comprises)"""
+        if self.sent is None:
+            await self.message.reply_text(text)
+        else:
+            await self._edit(text, final=True)
+
+    async def _edit(self, text: str, final: bool = False):
+        if text == self._last_text:
+            return
+        try:
+            await self.sent.edit_text(text)
+            self._last_text = text
+        except RetryAfter as e:
+            # Trop d'éditions : on saute les intermédiaires, seule la version finale compte
+            if final:
+                delay = e.retry_after
+                await asyncio.sleep(delay.total_seconds() if hasattr(delay, 'total_seconds') else delay)
+                await self.sent.edit_text(text)
+        except BadRequest as e:
+            if 'not modified' not in str(e).lower():
+                logger.warning(f"Édition du message impossible: {e}")
+        self._last_edit = time.monotonic()
+
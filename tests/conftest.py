@@ -0,0 +1,12 @@
+"""
+Configuration commune des tests : variables lues par config.py à l'import
+Aucune ressource téléchargée (tokenisation regex, modèles hors ligne)
+"""
+import os
+import sys
+
+os.environ.setdefault('TOKENIZER', 'fast')
+os.environ.setdefault('OFFLINE_RESOURCES', 'true')
+os.environ.setdefault('LAZY_LOADING', 'true')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
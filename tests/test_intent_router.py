@@ -0,0 +1,27 @@
+import pytest
+from intent_router import IntentRouter
+
+
+@pytest.mark.parametrize('text', [
+    "Quand a lieu l'élection présidentielle ?",
+    "Quand ont lieu les élections ?",
+    "Quand vote-t-on ?",
+    "Quelle est la date du scrutin ?",
+])
+def test_election_date_questions_take_fast_path(text):
+    intent, _ = IntentRouter().route(text)
+    assert intent == 'election_date'
+
+
+@pytest.mark.parametrize('text', [
+    "Quand les jeunes vont voter pour qui ?",
+    "Quand est-ce que les candidats parlent de l'emploi des jeunes avant le vote ?",
+])
+def test_open_questions_about_voting_are_not_election_date(text):
+    assert IntentRouter().route(text) is None
+
+
+def test_thanks_followed_by_question_is_open():
+    router = IntentRouter()
+    assert router.route("Merci beaucoup !")[0] == 'thanks'
+    assert router.route("Merci. Et sur l'éducation ?") is None
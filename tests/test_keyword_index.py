@@ -0,0 +1,37 @@
+import math
+import pytest
+from keyword_index import KeywordIndex, ALL_CANDIDATES
+from text_processing import normalize_keyword
+
+
+def _rows():
+    return [
+        {'id': 1, 'text': 'a', 'candidate': None, 'section': 's', 'source_link': 'l', 'keywords': ['ecole']},
+        {'id': 2, 'text': 'b', 'candidate': 'Paul Biya', 'section': 's', 'source_link': 'l', 'keywords': ['sante']},
+    ]
+
+
+@pytest.mark.parametrize('scoring', ['overlap', 'bm25'])
+def test_document_without_candidate_is_posted_once(scoring):
+    index = KeywordIndex(scoring=scoring)
+    index.add(_rows())
+
+    assert list(index._postings[ALL_CANDIDATES][normalize_keyword('ecole')]) == [1]
+    results = index.search(['ecole'])
+    assert [r['id'] for r in results] == [1]
+    assert results[0]['keyword_score'] == 1.0
+    if scoring == 'bm25':
+        # df = 1 sur 2 documents : idf positif
+        idf = math.log(1 + (2 - 1 + 0.5) / (1 + 0.5))
+        assert results[0]['bm25_score'] == pytest.approx(idf)
+
+
+def test_snapshot_postings_have_no_duplicates(tmp_path):
+    from knowledge_snapshot import KnowledgeSnapshot, knowledge_fingerprint, write_snapshot
+    rows = [dict(row, embedding=[1.0, 0.0]) for row in _rows()]
+    path = str(tmp_path / 'knowledge.snapshot')
+    write_snapshot(path, rows, knowledge_fingerprint(rows))
+
+    snapshot = KnowledgeSnapshot(path)
+    for _, doc_ids in snapshot.postings():
+        assert len(set(doc_ids.tolist())) == len(doc_ids)
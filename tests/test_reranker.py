@@ -0,0 +1,39 @@
+import time
+from reranker import CrossEncoderReranker
+
+
+class SlowModel:
+    """Cross-encoder factice : coût fixe par paire"""
+
+    def __init__(self, seconds_per_pair: float):
+        self.seconds_per_pair = seconds_per_pair
+
+    def predict(self, pairs, batch_size=None, show_progress_bar=False):
+        time.sleep(self.seconds_per_pair * len(pairs))
+        return [float(len(text)) for _, text in pairs]
+
+
+def _results(count: int):
+    return [{'id': i, 'text': 'x' * i} for i in range(1, count + 1)]
+
+
+def test_slow_model_keeps_scoring_within_budget():
+    # 30 ms par paire : un lot complet de 8 paires (240 ms) dépasse le budget de 150 ms
+    reranker = CrossEncoderReranker(lambda: SlowModel(0.03), budget_ms=150, batch_size=8)
+    reranker.prewarm()
+
+    for query in ('première question', 'deuxième question'):
+        reranked = reranker.rerank(query, _results(20))
+        scored = [r for r in reranked if 'rerank_score' in r]
+        assert 1 <= len(scored) < 20
+        assert [r['id'] for r in scored] == sorted((r['id'] for r in scored), reverse=True)
+
+
+def test_batch_size_follows_remaining_budget():
+    reranker = CrossEncoderReranker(lambda: SlowModel(0.0), budget_ms=150, batch_size=8)
+    reranker._seconds_per_pair = 0.05
+    deadline = time.perf_counter() + 0.12
+    assert reranker._batch_size_for(deadline) == 2
+    reranker._seconds_per_pair = 1.0
+    assert reranker._batch_size_for(deadline) == 1
+    assert reranker._batch_size_for(time.perf_counter() - 1) == 0
@@ -1,37 +1,196 @@
-from typing import List, Optional
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
+import functools
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional
 from collections import Counter
+from config import OFFLINE_RESOURCES, TOKENIZER
 
-# Télécharger les ressources NLTK si nécessaire
-try:
-    nltk.data.find('tokenizers/punkt_tab')
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('punkt_tab')
-    nltk.download('stopwords')
-
-# Mots vides français
-french_stopwords = set(stopwords.words('french'))
-
-# Liste des candidats principaux (à adapter selon tes élections)
-CANDIDATES = [
-    "seta", "caxton", "ateki", "bello", "bouba", "maigari", "paul", "biya", "jacques", "bouhga", "hagbe", 
-    "issa", "tchiroma", "bakary", "hiram", "samuel", "iyodi", "pierre", "kwemo", "cabral", "libii",
-    "serge", "espoir", "matomba", "akere", "muna", "joshua", "osih", "hermine", "patricia", "tomaino", "ndam", "njoya"
-]
-
-def extract_keywords(text: str, max_keywords: int = 8) -> List[str]:
+# Ressources NLTK chargées à la première utilisation (import lent, téléchargement éventuel)
+_nltk_lock = threading.Lock()
+_word_tokenize = None
+french_stopwords = None
+
+# Repli quand NLTK n'a pas ses ressources et que le téléchargement est interdit
+_SIMPLE_TOKEN_RE = re.compile(r"[^\W\d_]+")
+FALLBACK_FRENCH_STOPWORDS = {
+    "au", "aux", "avec", "ce", "ces", "dans", "de", "des", "du", "elle", "en", "et", "eux", "il", "ils",
+    "je", "la", "le", "les", "leur", "lui", "ma", "mais", "me", "même", "mes", "moi", "mon", "ne", "nos",
+    "notre", "nous", "on", "ou", "par", "pas", "pour", "qu", "que", "qui", "sa", "se", "ses", "son", "sur",
+    "ta", "te", "tes", "toi", "ton", "tu", "un", "une", "vos", "votre", "vous", "été", "étée", "étées",
+    "étés", "étant", "étante", "étants", "étantes", "suis", "es", "est", "sommes", "êtes", "sont",
+    "serai", "seras", "sera", "serons", "serez", "seront", "serais", "serait", "serions", "seriez",
+    "seraient", "étais", "était", "étions", "étiez", "étaient", "fus", "fut", "fûmes", "fûtes", "furent",
+    "sois", "soit", "soyons", "soyez", "soient", "fusse", "fusses", "fût", "fussions", "fussiez",
+    "fussent", "ayant", "ayante", "ayantes", "ayants", "eu", "eue", "eues", "eus", "ai", "as", "avons",
+    "avez", "ont", "aurai", "auras", "aura", "aurons", "aurez", "auront", "aurais", "aurait", "aurions",
+    "auriez", "auraient", "avais", "avait", "avions", "aviez", "avaient", "eut", "eûmes", "eûtes",
+    "eurent", "aie", "aies", "ait", "ayons", "ayez", "aient", "eusse", "eusses", "eût", "eussions",
+    "eussiez", "eussent", "ceci", "cela", "cet", "cette", "ici", "leurs", "quel", "quels", "quelle",
+    "quelles", "sans", "soi",
+}
+
+def _use_simple_tokenizer(reason: str):
+    """Repli sans NLTK (même normalisation que le mode "nltk" : minuscules, mots alphabétiques)"""
+    global _word_tokenize, french_stopwords
+    print(f"{reason}, tokenisation simplifiée")
+    french_stopwords = set(FALLBACK_FRENCH_STOPWORDS)
+    _word_tokenize = lambda text, language='french': _SIMPLE_TOKEN_RE.findall(text)
+
+def load_nltk_resources():
+    """Importe NLTK et ses ressources (une seule fois, thread-safe)"""
+    global _word_tokenize, french_stopwords
+    if _word_tokenize is not None:
+        return
+    
+    with _nltk_lock:
+        if _word_tokenize is not None:
+            return
+        
+        import nltk
+        from nltk.corpus import stopwords
+        from nltk.tokenize import word_tokenize
+        
+        # Télécharger les ressources NLTK si nécessaire
+        try:
+            nltk.data.find('tokenizers/punkt_tab')
+            nltk.data.find('corpora/stopwords')
+        except LookupError:
+            if OFFLINE_RESOURCES:
+                _use_simple_tokenizer("Ressources NLTK absentes (mode hors ligne)")
+                return
+            try:
+                nltk.download('punkt_tab')
+                nltk.download('stopwords')
+                nltk.data.find('tokenizers/punkt_tab')
+                nltk.data.find('corpora/stopwords')
+            except Exception as e:
+                # Échec mémorisé : pas de nouveau téléchargement à chaque message
+                _use_simple_tokenizer(f"Téléchargement des ressources NLTK impossible ({type(e).__name__})")
+                return
+        
+        # Mots vides français
+        french_stopwords = set(stopwords.words('french'))
+        _word_tokenize = word_tokenize
+
+# Registre des candidats (à adapter selon tes élections) : nom normalisé -> alias reconnus
+CANDIDATE_ALIASES = {
+    "Seta Caxton Ateki": ["seta", "caxton", "ateki"],
+    "Bello Bouba Maigari": ["bello", "bouba", "maigari"],
+    "Paul Biya": ["paul", "biya"],
+    "Jacques Bouhga-Hagbe": ["jacques", "bouhga", "hagbe"],
+    "Issa Tchiroma Bakary": ["issa", "tchiroma", "bakary"],
+    "Hiram Samuel Iyodi": ["hiram", "samuel", "iyodi"],
+    "Pierre Kwemo": ["pierre", "kwemo"],
+    "Cabral Libii": ["cabral", "libii"],
+    "Serge Espoir Matomba": ["serge", "espoir", "matomba"],
+    "Akere Muna": ["akere", "muna"],
+    "Joshua Osih": ["joshua", "osih"],
+    "Hermine Patricia Tomaïno Ndam Njoya": ["hermine", "patricia", "tomaino", "ndam", "njoya"],
+}
+
+# Liste à plat des alias
+CANDIDATES = [alias for aliases in CANDIDATE_ALIASES.values() for alias in aliases]
+
+def fold_accents(text: str) -> str:
+    """Minuscules sans accents ("Tomaïno" -> "tomaino")"""
+    text = text.lower()
+    if text.isascii():
+        return text
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+# Variantes accentuées acceptées pour chaque lettre des alias
+_ACCENT_VARIANTS = {
+    'a': 'aàâäáã', 'c': 'cç', 'e': 'eéèêë', 'i': 'iîïíì', 'n': 'nñ',
+    'o': 'oôöóò', 'u': 'uùûüú', 'y': 'yÿý',
+}
+
+def _accent_insensitive(alias: str) -> str:
+    return ''.join(
+        f"[{_ACCENT_VARIANTS[c]}]" if c in _ACCENT_VARIANTS else re.escape(c)
+        for c in alias
+    )
+
+def _compile_candidate_matcher(registry: Dict[str, List[str]]):
+    """
+    Une seule regex pour tous les alias (mots entiers, insensible aux accents)
+    + table alias -> nom normalisé
+    """
+    alias_to_name = {}
+    for name, aliases in registry.items():
+        for alias in aliases:
+            alias_to_name[fold_accents(alias)] = name
+    # Les alias les plus longs d'abord pour que l'alternance préfère la correspondance complète
+    alternatives = sorted(alias_to_name, key=len, reverse=True)
+    pattern = re.compile(r"\b(" + "|".join(_accent_insensitive(a) for a in alternatives) + r")\b")
+    return pattern, alias_to_name
+
+_CANDIDATE_PATTERN, _ALIAS_TO_CANDIDATE = _compile_candidate_matcher(CANDIDATE_ALIASES)
+
+# ===== TOKENISATION RAPIDE (sans NLTK) =====
+
+_FAST_TOKEN_RE = re.compile(r"[^\W\d_]+")
+_FAST_STOPWORDS = {fold_accents(word) for word in FALLBACK_FRENCH_STOPWORDS}
+
+# Racinisation légère : suffixes flexionnels et dérivationnels courants, du plus long au plus court
+# ("écologie", "écologique", "écologiques" -> "ecolog")
+_LIGHT_SUFFIXES = (
+    "issements", "issement", "atrices", "atrice", "ateurs", "ateur", "ations", "ation",
+    "ements", "ement", "atives", "ative", "atifs", "atif", "iques", "ique", "ismes", "isme",
+    "istes", "iste", "euses", "euse", "ites", "ite", "eurs", "eur", "ives", "ive", "ifs", "if",
+    "ies", "ie", "ees", "ee", "es", "e", "s", "x",
+)
+_MIN_STEM_LENGTH = 4
+# Suffixes regroupés par longueur : une recherche dans un ensemble par longueur
+_SUFFIXES_BY_LENGTH = sorted(
+    {length: {s for s in _LIGHT_SUFFIXES if len(s) == length} for length in map(len, _LIGHT_SUFFIXES)}.items(),
+    reverse=True
+)
+
+@functools.lru_cache(maxsize=65536)
+def light_stem(word: str) -> str:
+    """Racinisation légère d'un mot déjà en minuscules et sans accents (mémoïsée)"""
+    if word.endswith("aux") and len(word) - 3 >= _MIN_STEM_LENGTH - 1:
+        return word[:-3] + "al"
+    for length, suffixes in _SUFFIXES_BY_LENGTH:
+        if len(word) - length >= _MIN_STEM_LENGTH and word[-length:] in suffixes:
+            return word[:-length]
+    return word
+
+def normalize_keyword(word: str) -> str:
+    """
+    Normalisation d'un mot-clé, identique côté questions et côté documents
+    Mode "fast" : sans accents + racinisation légère ; mode "nltk" : minuscules
+    """
+    if TOKENIZER == "fast":
+        return light_stem(fold_accents(word.strip()))
+    return word.strip().lower()
+
+def _extract_keywords_fast(text: str, max_keywords: int) -> List[str]:
+    """Tokenisation par regex précompilée, sans NLTK"""
+    filtered_words = [
+        light_stem(word) for word in _FAST_TOKEN_RE.findall(fold_accents(text))
+        if len(word) > 2 and word not in _FAST_STOPWORDS
+    ]
+    return [word for word, _ in Counter(filtered_words).most_common(max_keywords)]
+
+def extract_keywords(text: str, max_keywords: int = 8, tokenizer: Optional[str] = None) -> List[str]:
     """
     Extrait les mots-clés d'un texte en français
+    tokenizer : "nltk" ou "fast" (par défaut : TOKENIZER de la configuration)
     """
     if not text:
         return []
     
+    if (tokenizer or TOKENIZER) == "fast":
+        return _extract_keywords_fast(text, max_keywords)
+    
+    load_nltk_resources()
+    
     # Nettoyer et tokeniser
     text = text.lower()
-    tokens = word_tokenize(text, language='french')
+    tokens = _word_tokenize(text, language='french')
     
     # Filtrer les mots (alphabétiques, >2 caractères, pas de mots vides)
     filtered_words = [
@@ -45,91 +204,43 @@ def extract_keywords(text: str, max_keywords: int = 8) -> List[str]:
     
     return keywords
 
+def generate_document_keywords(text: str, max_keywords: int = 20) -> List[str]:
+    """
+    Mots-clés d'un document de la base de connaissances
+    Même pipeline que pour les questions : les deux côtés doivent être normalisés pareil
+    """
+    return extract_keywords(text, max_keywords=max_keywords)
+
 def extract_candidate_mentions(text: str) -> Optional[str]:
     """
     Détecte si un candidat est mentionné dans le texte
-    Retourne le nom normalisé du candidat ou None
+    Retourne le nom normalisé du premier candidat mentionné ou None
     """
-    text_lower = text.lower()
-    
-    # Rechercher des mentions de candidats
-    for candidate in CANDIDATES:
-        if candidate in text_lower:
-            # Retourner une version normalisée
-            if "seta" in candidate:
-                return "Seta Caxton Ateki"
-            elif "caxton" in candidate:
-                return "Seta Caxton Ateki"
-            elif "ateki" in candidate:
-                return "Seta Caxton Ateki"
-            elif "bello" in candidate:
-                return "Bello Bouba Maigari"
-            elif "bouba" in candidate:
-                return "Bello Bouba Maigari"
-            elif "maigari" in candidate:
-                return "Bello Bouba Maigari"
-            elif "paul" in candidate:
-                return "Paul Biya"
-            elif "biya" in candidate:
-                return "Paul Biya"
-            elif "jacques" in candidate:
-                return "Jacques Bouhga-Hagbe"
-            elif "bouhga" in candidate:
-                return "Jacques Bouhga-Hagbe"
-            elif "hagbe" in candidate:
-                return "Jacques Bouhga-Hagbe"
-            elif "issa" in candidate:
-                return "Issa Tchiroma Bakary"
-            elif "tchiroma" in candidate:
-                return "Issa Tchiroma Bakary"
-            elif "bakary" in candidate:
-                return "Issa Tchiroma Bakary"
-            elif "hiram" in candidate:
-                return "Hiram Samuel Iyodi"
-            elif "samuel" in candidate:
-                return "Hiram Samuel Iyodi"
-            elif "iyodi" in candidate:
-                return "Hiram Samuel Iyodi"
-            elif "pierre" in candidate:
-                return "Pierre Kwemo"
-            elif "kwemo" in candidate:
-                return "Pierre Kwemo"
-            elif "cabral" in candidate:
-                return "Cabral Libii"
-            elif "libii" in candidate:
-                return "Cabral Libii"
-            elif "serge" in candidate:
-                return "Serge Espoir Matomba"
-            elif "espoir" in candidate:
-                return "Serge Espoir Matomba"
-            elif "matomba" in candidate:
-                return "Serge Espoir Matomba"
-            elif "akere" in candidate:
-                return "Akere Muna"
-            elif "muna" in candidate:
-                return "Akere Muna"
-            elif "joshua" in candidate:
-                return "Joshua Osih"
-            elif "osih" in candidate:
-                return "Joshua Osih"
-            elif "hermine" in candidate:
-                return "Hermine Patricia Tomaïno Ndam Njoya"
-            elif "patricia" in candidate:
-                return "Hermine Patricia Tomaïno Ndam Njoya"
-            elif "tomaino" in candidate:
-                return "Hermine Patricia Tomaïno Ndam Njoya"
-            elif "ndam" in candidate:
-                return "Hermine Patricia Tomaïno Ndam Njoya"
-            elif "njoya" in candidate:
-                return "Hermine Patricia Tomaïno Ndam Njoya"
+    candidates = extract_all_candidate_mentions(text)
+    return candidates[0] if candidates else None
+
+def extract_all_candidate_mentions(text: str) -> List[str]:
+    """
+    Détecte tous les candidats mentionnés, en une passe, dans l'ordre d'apparition
+    Seuls les mots entiers comptent ("Paulette" ne désigne pas Paul Biya)
+    """
+    if not text:
+        return []
     
-    return None
+    found = []
+    for match in _CANDIDATE_PATTERN.finditer(text.lower()):
+        name = _ALIAS_TO_CANDIDATE[fold_accents(match.group(1))]
+        if name not in found:
+            found.append(name)
+    return found
+
+GREETINGS = ["salut", "bonjour", "hello", "bonsoir", "coucou", "hey"]
+
+# Mots entiers uniquement ("hey" ne doit pas correspondre dans "they")
+_GREETING_RE = re.compile(r"\b(" + "|".join(GREETINGS) + r")\b")
 
 def is_greeting(text: str) -> bool:
     """
     Détecte si le message est une salutation
     """
-    greetings = ["salut", "bonjour", "hello", "bonsoir", "coucou", "hey"]
-    text_lower = text.lower().strip()
-    
-    return any(greeting in text_lower for greeting in greetings) and len(text.split()) <= 3
\ No newline at end of file
+    return len(text.split()) <= 3 and _GREETING_RE.search(fold_accents(text)) is not None
\ No newline at end of file
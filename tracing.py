@@ -0,0 +1,103 @@
+"""
+Spans de latence par étape (historique, recherche, embedding, LLM, envoi...) pour chaque message
+Agrégés en histogrammes Prometheus avec le label search_method, et journalisables requête par requête
+"""
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from config import TRACE_LOGGING
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = REGISTRY.histogram('bot_stage_seconds', "Durée de chaque étape du traitement d'un message")
+REQUEST_SECONDS = REGISTRY.histogram('bot_request_seconds', "Durée totale du traitement d'un message")
+
+_current_trace: contextvars.ContextVar[Optional['RequestTrace']] = contextvars.ContextVar(
+    'request_trace', default=None
+)
+
+
+class RequestTrace:
+    """Spans d'une requête ; les labels (search_method) ne sont connus qu'en cours de route"""
+
+    def __init__(self, chat_id: Optional[int] = None):
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.chat_id = chat_id
+        self.labels: Dict[str, str] = {'search_method': 'none'}
+        self._started = time.perf_counter()
+        # (étape, début relatif, durée)
+        self._spans: List[Tuple[str, float, float]] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, started, time.perf_counter() - started)
+
+    def record(self, stage: str, started: float, duration: float):
+        with self._lock:
+            self._spans.append((stage, started - self._started, duration))
+
+    def set_label(self, **labels):
+        self.labels.update({k: str(v) for k, v in labels.items()})
+
+    def finish(self):
+        """Exporte les spans dans les histogrammes et écrit la trace si demandé"""
+        total = time.perf_counter() - self._started
+        with self._lock:
+            spans = list(self._spans)
+        for stage, _, duration in spans:
+            STAGE_SECONDS.observe(duration, stage=stage, **self.labels)
+        REQUEST_SECONDS.observe(total, **self.labels)
+
+        if TRACE_LOGGING:
+            details = ' '.join(
+                f"{stage}=+{offset * 1000:.0f}ms/{duration * 1000:.0f}ms"
+                for stage, offset, duration in sorted(spans, key=lambda span: span[1])
+            )
+            labels = ' '.join(f"{k}={v}" for k, v in self.labels.items())
+            logger.info(
+                f"trace={self.trace_id} chat={self.chat_id} {labels} total={total * 1000:.0f}ms {details}"
+            )
+
+
+def start_trace(chat_id: Optional[int] = None) -> RequestTrace:
+    """Ouvre la trace de la requête courante (propagée aux pools via contextvars)"""
+    trace = RequestTrace(chat_id)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def stage_span(stage: str):
+    """Span sur la trace courante (sans effet hors requête : préchauffage, benchmarks...)"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(stage):
+        yield
+
+
+async def traced(stage: str, awaitable):
+    """Attend `awaitable` dans un span (pratique avec asyncio.gather)"""
+    with stage_span(stage):
+        return await awaitable
+
+
+def set_trace_label(**labels):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.set_label(**labels)
@@ -0,0 +1,210 @@
+"""
+File d'ingestion des updates Telegram avec un pool fixe de workers
+- UpdateDispatcher : threads (serveur WSGI, boucle asyncio dans un thread à part)
+- AsyncUpdateDispatcher : tâches asyncio sur la boucle du serveur (mode ASGI)
+"""
+import asyncio
+import queue
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+from metrics import REGISTRY
+
+QUEUE_DEPTH = REGISTRY.gauge('bot_update_queue_depth', "Nombre d'updates en attente de traitement")
+QUEUE_WAIT = REGISTRY.histogram('bot_update_queue_wait_seconds', "Temps d'attente d'une update dans la file")
+UPDATES_PROCESSED = REGISTRY.counter('bot_updates_processed_total', "Updates traitées par les workers")
+UPDATES_SHED = REGISTRY.counter('bot_updates_shed_total', "Updates refusées car la file est pleine")
+UPDATES_SLOW = REGISTRY.counter('bot_updates_slow_total', "Updates dont le traitement a dépassé le seuil de lenteur")
+
+_STOP = object()
+
+
+def extract_chat_id(update_data: Dict) -> Optional[int]:
+    """Retrouve le chat d'une update brute (JSON Telegram)"""
+    for key in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if key in update_data:
+            return update_data[key].get('chat', {}).get('id')
+    callback = update_data.get('callback_query')
+    if callback and callback.get('message'):
+        return callback['message'].get('chat', {}).get('id')
+    return None
+
+
+def _shard(update_data: Dict, num_workers: int) -> int:
+    """Worker d'une update : toujours le même pour un chat donné"""
+    chat_id = extract_chat_id(update_data)
+    shard_key = chat_id if chat_id is not None else update_data.get('update_id', 0)
+    return hash(shard_key) % num_workers
+
+
+class UpdateDispatcher:
+    """
+    File bornée + pool fixe de workers
+    Chaque chat est affecté à un worker unique : ses messages sont traités dans l'ordre
+    """
+    def __init__(self, handler: Callable[[Dict], None], num_workers: int = 8, max_depth: int = 200):
+        self.handler = handler
+        self.num_workers = max(1, num_workers)
+        self.max_depth = max_depth
+        self._queues: List[queue.Queue] = [queue.Queue() for _ in range(self.num_workers)]
+        self._threads: List[threading.Thread] = []
+        self._depth = 0
+        self._lock = threading.Lock()
+        QUEUE_DEPTH.set_function(lambda: self._depth)
+
+    def start(self):
+        """Démarre les workers"""
+        if self._threads:
+            return
+        for index in range(self.num_workers):
+            thread = threading.Thread(
+                target=self._worker,
+                args=(self._queues[index],),
+                name=f'update-worker-{index}',
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, update_data: Dict) -> bool:
+        """
+        Met une update en file
+        Retourne False si la file est pleine (l'appelant applique la politique de délestage)
+        """
+        with self._lock:
+            if self._depth >= self.max_depth:
+                UPDATES_SHED.inc()
+                return False
+            self._depth += 1
+
+        self._queues[_shard(update_data, self.num_workers)].put((time.monotonic(), update_data))
+        return True
+
+    def _worker(self, work_queue: queue.Queue):
+        while True:
+            item = work_queue.get()
+            if item is _STOP:
+                work_queue.task_done()
+                return
+
+            enqueued_at, update_data = item
+            QUEUE_WAIT.observe(time.monotonic() - enqueued_at)
+            try:
+                self.handler(update_data)
+                UPDATES_PROCESSED.inc()
+            except Exception as e:
+                print(f"Erreur worker update: {e}")
+            finally:
+                with self._lock:
+                    self._depth -= 1
+                work_queue.task_done()
+
+    def stop(self, timeout: float = 10.0):
+        """Vide les files puis arrête les workers"""
+        for work_queue in self._queues:
+            work_queue.put(_STOP)
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+    def depth(self) -> int:
+        return self._depth
+
+    def stats(self) -> Dict:
+        return {
+            'depth': self._depth,
+            'max_depth': self.max_depth,
+            'workers': self.num_workers,
+            'shed': UPDATES_SHED.value(),
+            'processed': UPDATES_PROCESSED.value(),
+        }
+
+
+class AsyncUpdateDispatcher:
+    """
+    Même contrat que UpdateDispatcher sur la boucle du serveur ASGI : une tâche par worker,
+    `handler` est une coroutine ; submit() et start() s'appellent depuis la boucle
+    """
+    def __init__(self, handler: Callable[[Dict], Awaitable[None]], num_workers: int = 8, max_depth: int = 200,
+                 slow_after: float = 30.0):
+        self.handler = handler
+        self.num_workers = max(1, num_workers)
+        self.max_depth = max_depth
+        self.slow_after = slow_after
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        # Modifié uniquement depuis la boucle : pas de verrou
+        self._depth = 0
+        QUEUE_DEPTH.set_function(lambda: self._depth)
+
+    def start(self):
+        """Démarre les workers sur la boucle courante"""
+        if self._tasks:
+            return
+        self._queues = [asyncio.Queue() for _ in range(self.num_workers)]
+        self._tasks = [
+            asyncio.create_task(self._worker(work_queue), name=f'update-worker-{index}')
+            for index, work_queue in enumerate(self._queues)
+        ]
+
+    def submit(self, update_data: Dict) -> bool:
+        """
+        Met une update en file sans attendre
+        Retourne False si la file est pleine (l'appelant applique la politique de délestage)
+        """
+        if self._depth >= self.max_depth:
+            UPDATES_SHED.inc()
+            return False
+        self._depth += 1
+        self._queues[_shard(update_data, self.num_workers)].put_nowait((time.monotonic(), update_data))
+        return True
+
+    async def _worker(self, work_queue: asyncio.Queue):
+        while True:
+            item = await work_queue.get()
+            if item is _STOP:
+                return
+
+            enqueued_at, update_data = item
+            QUEUE_WAIT.observe(time.monotonic() - enqueued_at)
+            handling = asyncio.ensure_future(self.handler(update_data))
+            try:
+                # Update lente : signalée, mais le worker l'attend jusqu'au bout pour ne pas
+                # traiter le message suivant du chat en parallèle ni sortir de max_depth
+                done, _ = await asyncio.wait({handling}, timeout=self.slow_after)
+                if not done:
+                    UPDATES_SLOW.inc()
+                    print(f"Update lente (> {self.slow_after:g}s) pour le chat {extract_chat_id(update_data)}")
+                await handling
+                UPDATES_PROCESSED.inc()
+            except asyncio.CancelledError:
+                handling.cancel()
+                raise
+            except Exception as e:
+                print(f"Erreur worker update: {e!r}")
+            finally:
+                self._depth -= 1
+
+    async def stop(self, timeout: float = 10.0):
+        """Vide les files puis arrête les workers"""
+        if not self._tasks:
+            return
+        for work_queue in self._queues:
+            work_queue.put_nowait(_STOP)
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        self._tasks = []
+
+    def depth(self) -> int:
+        return self._depth
+
+    def stats(self) -> Dict:
+        return {
+            'depth': self._depth,
+            'max_depth': self.max_depth,
+            'workers': self.num_workers,
+            'shed': UPDATES_SHED.value(),
+            'processed': UPDATES_PROCESSED.value(),
+        }
@@ -0,0 +1,220 @@
+"""
+Index vectoriel en mémoire pour remplacer la RPC match_documents
+- VectorIndex : matrice NumPy + produit scalaire exhaustif (quelques milliers de chunks)
+- HNSWVectorIndex : graphe HNSW (hnswlib) pour les corpus plus volumineux
+"""
+import json
+from typing import Dict, List, Optional
+import numpy as np
+from knowledge_index import KnowledgeIndex
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# Colonnes de la table knowledge conservées en mémoire avec chaque vecteur
+METADATA_COLUMNS = ['id', 'text', 'candidate', 'section', 'source_link', 'keywords']
+
+
+def parse_embedding(value) -> Optional[np.ndarray]:
+    """pgvector est renvoyé par PostgREST sous forme de chaîne '[0.1,0.2,...]'"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class VectorIndex(KnowledgeIndex):
+    """Recherche exhaustive par similarité cosinus (vecteurs normalisés, produit scalaire)"""
+
+    name = "Index vectoriel"
+    columns = METADATA_COLUMNS + ['embedding']
+
+    def __init__(self):
+        super().__init__()
+        self._rows: List[Dict] = []
+        self._candidates = np.empty(0, dtype=object)
+        self._matrix: Optional[np.ndarray] = None
+        # Échelle par ligne quand la matrice est en int8 (instantané), sinon None
+        self._scales: Optional[np.ndarray] = None
+        self._positions: Dict = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, rows: List[Dict]):
+        """Ajoute ou remplace des documents (clé : id) ; un document devenu sans embedding est retiré"""
+        new_rows, new_vectors, without_embedding = [], [], []
+        for row in rows:
+            vector = parse_embedding(row.get('embedding'))
+            if vector is None:
+                without_embedding.append(row.get('id'))
+                continue
+            new_rows.append({k: row.get(k) for k in METADATA_COLUMNS})
+            new_vectors.append(vector)
+
+        with self._lock:
+            self._track_rows(rows)
+            if any(doc_id in self._positions for doc_id in without_embedding):
+                self._drop(set(without_embedding))
+            if not new_rows:
+                return
+            all_rows = list(self._rows)
+            vectors = list(self._dense_matrix()) if self._matrix is not None else []
+            positions = dict(self._positions)
+            for row, vector in zip(new_rows, new_vectors):
+                position = positions.get(row['id'])
+                if position is None:
+                    positions[row['id']] = len(all_rows)
+                    all_rows.append(row)
+                    vectors.append(vector)
+                else:
+                    all_rows[position] = row
+                    vectors[position] = vector
+
+            matrix = _normalize_rows(np.vstack(vectors).astype(np.float32))
+            self._rebuild(all_rows, matrix)
+            self._rows = all_rows
+            self._matrix = matrix
+            self._scales = None
+            self._positions = positions
+            self._candidates = np.array([r.get('candidate') for r in all_rows], dtype=object)
+
+    def remove(self, doc_ids: List[int]):
+        """Retire des documents supprimés de la table"""
+        with self._lock:
+            self._drop(set(doc_ids))
+            self._forget(doc_ids)
+
+    def _drop(self, doc_ids: set):
+        """Reconstruit la matrice sans `doc_ids` (verrou tenu par l'appelant)"""
+        keep = [i for i, row in enumerate(self._rows) if row['id'] not in doc_ids]
+        if len(keep) == len(self._rows):
+            return
+        rows = [self._rows[i] for i in keep]
+        matrix = self._dense_matrix()[keep].astype(np.float32) if keep else None
+        if keep:
+            self._rebuild(rows, matrix)
+        self._rows = rows
+        self._matrix = matrix
+        self._scales = None
+        self._positions = {row['id']: i for i, row in enumerate(rows)}
+        self._candidates = np.array([r.get('candidate') for r in rows], dtype=object)
+
+    def _load_snapshot(self, snapshot):
+        """Matrice float16/int8 de l'instantané utilisée telle quelle (vue mmap, aucune copie)"""
+        rows, embeddings, scales = snapshot.embedded()
+        with self._lock:
+            self._rows = rows
+            self._matrix = embeddings
+            self._scales = scales
+            self._positions = {row['id']: i for i, row in enumerate(rows)}
+            self._candidates = np.array([r.get('candidate') for r in rows], dtype=object)
+
+    def _dense_matrix(self) -> np.ndarray:
+        if self._scales is not None:
+            return self._matrix.astype(np.float32) * self._scales[:, None]
+        return self._matrix
+
+    def _rebuild(self, rows: List[Dict], matrix: np.ndarray):
+        """Point d'extension pour les index approximatifs"""
+
+    def search(self, embedding: List[float], candidate: Optional[str] = None,
+               limit: int = 5, threshold: float = 0.7) -> List[Dict]:
+        """Même sémantique que match_documents : similarité > seuil, triée, limitée"""
+        with self._lock:
+            matrix, scales, rows, candidates = self._matrix, self._scales, self._rows, self._candidates
+        if matrix is None or not rows:
+            return []
+
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        similarities = matrix @ query
+        if scales is not None:
+            similarities = similarities * scales
+        if candidate:
+            similarities = np.where(candidates == candidate, similarities, -np.inf)
+
+        eligible = np.flatnonzero(similarities > threshold)
+        if eligible.size == 0:
+            return []
+        if eligible.size > limit:
+            top = eligible[np.argpartition(-similarities[eligible], limit - 1)[:limit]]
+        else:
+            top = eligible
+        top = top[np.argsort(-similarities[top])]
+
+        return [dict(rows[i], similarity=float(similarities[i])) for i in top]
+
+
+class HNSWVectorIndex(VectorIndex):
+    """Index approximatif HNSW, le filtrage par candidat se fait pendant le parcours du graphe"""
+
+    def __init__(self, m: int = 16, ef_construction: int = 200, ef_search: int = 64):
+        if hnswlib is None:
+            raise ImportError("hnswlib est requis pour VECTOR_INDEX_BACKEND=hnsw (pip install hnswlib)")
+        super().__init__()
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._hnsw = None
+
+    def _rebuild(self, rows: List[Dict], matrix: np.ndarray):
+        index = hnswlib.Index(space='ip', dim=matrix.shape[1])
+        index.init_index(max_elements=max(len(rows), 1), ef_construction=self.ef_construction, M=self.m)
+        index.add_items(matrix, np.arange(len(rows)))
+        index.set_ef(max(self.ef_search, 1))
+        self._hnsw = index
+
+    def _load_snapshot(self, snapshot):
+        super()._load_snapshot(snapshot)
+        # Le graphe est reconstruit en mémoire (float32)
+        with self._lock:
+            self._rebuild(self._rows, snapshot.dense_embeddings())
+
+    def search(self, embedding: List[float], candidate: Optional[str] = None,
+               limit: int = 5, threshold: float = 0.7) -> List[Dict]:
+        with self._lock:
+            index, rows, candidates = self._hnsw, self._rows, self._candidates
+        if index is None or not rows:
+            return []
+
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        k = min(limit, len(rows))
+        filter_fn = (lambda label: candidates[label] == candidate) if candidate else None
+        try:
+            labels, distances = index.knn_query(query, k=k, filter=filter_fn)
+        except RuntimeError:
+            # Moins de k documents pour ce candidat
+            return super().search(embedding, candidate, limit, threshold)
+
+        results = []
+        for label, distance in zip(labels[0], distances[0]):
+            similarity = 1.0 - float(distance)  # espace 'ip' : distance = 1 - produit scalaire
+            if similarity > threshold:
+                results.append(dict(rows[int(label)], similarity=similarity))
+        return results
+
+
+def build_vector_index(backend: str) -> Optional[VectorIndex]:
+    """Crée l'index correspondant à VECTOR_INDEX_BACKEND (None = RPC Supabase)"""
+    if backend == 'numpy':
+        return VectorIndex()
+    if backend == 'hnsw':
+        return HNSWVectorIndex()
+    return None
@@ -0,0 +1,95 @@
+"""
+Enregistrement du webhook Telegram, séparé du démarrage des workers
+Avec plusieurs workers, un seul processus (leader élu via le stockage partagé) ou une
+étape de déploiement enregistre le webhook ; les autres se contentent de servir /webhook
+
+Usage : python webhook_setup.py [set|info|delete] [--url https://.../webhook]
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+from config import TELEGRAM_BOT_TOKEN, TELEGRAM_API_URL, WEBHOOK_URL, WEBHOOK_LEADER_TTL
+
+ALLOWED_UPDATES = ['message', 'edited_message', 'callback_query']
+
+
+async def register_webhook(bot, webhook_url: str) -> bool:
+    """Configure le webhook sur Telegram et affiche son état"""
+    try:
+        success = await bot.set_webhook(url=webhook_url, allowed_updates=ALLOWED_UPDATES)
+
+        if success:
+            print(f"✅ Webhook configuré: {webhook_url}")
+
+            # Vérifier le webhook
+            webhook_info = await bot.get_webhook_info()
+            print(f"📡 Info webhook: {webhook_info.url}")
+            if webhook_info.last_error_date:
+                print(f"⚠️  Dernière erreur: {webhook_info.last_error_message}")
+        else:
+            print("❌ Échec de la configuration du webhook")
+        return bool(success)
+
+    except Exception as e:
+        print(f"❌ Erreur lors de la configuration du webhook: {e}")
+        return False
+
+
+def claim_webhook_leadership(store, webhook_url: str) -> bool:
+    """
+    Un seul processus par URL et par période WEBHOOK_LEADER_TTL enregistre le webhook
+    Le verrou est rendu par release_webhook_leadership si l'enregistrement échoue
+    """
+    try:
+        return store.add(_leader_key(webhook_url), str(os.getpid()), ttl=WEBHOOK_LEADER_TTL)
+    except Exception as e:
+        # Stockage indisponible : mieux vaut un enregistrement en double qu'aucun
+        print(f"Erreur élection du leader webhook: {e}")
+        return True
+
+
+def release_webhook_leadership(store, webhook_url: str):
+    try:
+        store.delete(_leader_key(webhook_url))
+    except Exception as e:
+        print(f"Erreur libération du leader webhook: {e}")
+
+
+def _leader_key(webhook_url: str) -> str:
+    return f"webhook:leader:{hashlib.sha1(webhook_url.encode('utf-8')).hexdigest()}"
+
+
+async def _run(command: str, webhook_url: str) -> bool:
+    from telegram import Bot
+
+    bot = Bot(TELEGRAM_BOT_TOKEN, base_url=f"{TELEGRAM_API_URL}/bot")
+    async with bot:
+        if command == 'set':
+            return await register_webhook(bot, webhook_url)
+        if command == 'delete':
+            deleted = await bot.delete_webhook()
+            print("✅ Webhook supprimé" if deleted else "❌ Échec de la suppression du webhook")
+            return bool(deleted)
+        info = await bot.get_webhook_info()
+        print(f"📡 URL: {info.url or '(aucune)'}")
+        print(f"   Updates en attente: {info.pending_update_count}")
+        if info.last_error_date:
+            print(f"⚠️  Dernière erreur: {info.last_error_message}")
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gestion du webhook Telegram (étape de déploiement)")
+    parser.add_argument('command', nargs='?', choices=('set', 'info', 'delete'), default='set')
+    parser.add_argument('--url', default=WEBHOOK_URL, help="URL publique de /webhook (défaut : WEBHOOK_URL)")
+    args = parser.parse_args()
+
+    if args.command == 'set' and not args.url:
+        parser.error("WEBHOOK_URL non définie (ou --url)")
+    return 0 if asyncio.run(_run(args.command, args.url)) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""
+Tampon d'écriture différée (write-behind) pour les insertions de conversations
+Les lignes sont regroupées et insérées en masse sur seuil de taille ou de temps ;
+si Supabase est indisponible elles sont déversées dans un fichier local (JSON lines)
+puis rejouées au prochain envoi réussi
+"""
+import atexit
+import glob
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+from metrics import REGISTRY
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+BUFFER_PENDING = REGISTRY.gauge('bot_write_buffer_pending', "Lignes en attente d'écriture")
+BUFFER_FLUSHES = REGISTRY.counter('bot_write_buffer_flushes_total', "Insertions en masse effectuées")
+BUFFER_SPILLED = REGISTRY.counter('bot_write_buffer_spilled_rows_total', "Lignes déversées dans le fichier local")
+
+
+class WriteBehindBuffer:
+    def __init__(self, flush_fn: Callable[[List[Dict]], bool], max_batch: int = 50,
+                 flush_interval: float = 2.0, spill_path: str = "conversations_spill.jsonl"):
+        self.flush_fn = flush_fn
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self._pending: List[Dict] = []
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        BUFFER_PENDING.set_function(lambda: len(self._pending))
+        self._adopt_orphan_replays()
+
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, row: Dict):
+        """Met une ligne en attente (ne bloque jamais sur le réseau)"""
+        with self._condition:
+            self._pending.append(row)
+            if len(self._pending) >= self.max_batch:
+                self._condition.notify()
+
+    def pending_for(self, chat_id: int) -> List[Dict]:
+        """Lignes pas encore écrites pour un chat (pour compléter l'historique)"""
+        with self._condition:
+            return [row for row in self._pending if row.get('chat_id') == chat_id]
+
+    def discard(self, chat_id: int):
+        """
+        Oublie les lignes d'un chat en attente et déversées (historique effacé)
+        Les lignes déjà prises par un envoi en cours ne sont pas concernées : voir flush_paused
+        """
+        with self._condition:
+            self._pending = [row for row in self._pending if row.get('chat_id') != chat_id]
+        try:
+            # Réécriture sous verrou : un ajout ou un rejeu d'un autre worker serait sinon perdu
+            with self._spill_file_lock():
+                if not os.path.exists(self.spill_path):
+                    return
+                with open(self.spill_path, encoding='utf-8') as f:
+                    lines = [line for line in f if line.strip() and json.loads(line).get('chat_id') != chat_id]
+                tmp_path = f"{self.spill_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.writelines(lines)
+                os.replace(tmp_path, self.spill_path)
+        except Exception as e:
+            print(f"Erreur nettoyage fichier de déversement: {e}")
+
+    @contextmanager
+    def flush_paused(self):
+        """Attend la fin de l'envoi en cours et bloque les suivants tant que le bloc s'exécute"""
+        with self._flush_lock:
+            yield
+
+    @contextmanager
+    def _spill_file_lock(self):
+        """
+        Verrou inter-processus (flock sur un fichier annexe) autour des modifications
+        du fichier de déversement partagé par les workers ; sans fcntl, aucun verrou
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.spill_path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _run(self):
+        while True:
+            # Réveil sur seuil de taille (notify) ou de temps (timeout)
+            with self._condition:
+                if len(self._pending) < self.max_batch and not self._closed:
+                    self._condition.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def flush(self):
+        """Envoie tout ce qui est en attente, par lots ; déverse sur disque en cas d'échec"""
+        with self._flush_lock:
+            with self._condition:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return
+
+            for start in range(0, len(rows), self.max_batch):
+                batch = rows[start:start + self.max_batch]
+                if self.flush_fn(batch):
+                    BUFFER_FLUSHES.inc()
+                else:
+                    self._spill(rows[start:])
+                    return
+
+            self._replay_spill()
+
+    def _spill(self, rows: List[Dict]):
+        try:
+            with self._spill_file_lock(), open(self.spill_path, 'a', encoding='utf-8') as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+            BUFFER_SPILLED.inc(len(rows))
+            print(f"Supabase indisponible: {len(rows)} messages déversés dans {self.spill_path}")
+        except Exception as e:
+            print(f"Erreur déversement messages: {e}")
+
+    def _adopt_orphan_replays(self):
+        """
+        Fichiers de rejeu laissés par un processus arrêté en plein rejeu : leurs lignes
+        retournent dans le fichier de déversement et seront rejouées au prochain envoi réussi
+        """
+        for replay_path in glob.glob(f"{glob.escape(self.spill_path)}.*.replay"):
+            pid = replay_path[len(self.spill_path) + 1:-len('.replay')]
+            # Même pid que nous : reste d'une exécution précédente (pid réutilisé après redémarrage)
+            if not pid.isdigit() or (int(pid) != os.getpid() and _process_alive(int(pid))):
+                continue
+            # Renommage atomique : un seul worker récupère chaque fichier orphelin
+            adopted_path = f"{self.spill_path}.{os.getpid()}.adopt"
+            try:
+                os.replace(replay_path, adopted_path)
+            except OSError:
+                continue
+            try:
+                with self._spill_file_lock(), open(adopted_path, encoding='utf-8') as src, \
+                        open(self.spill_path, 'a', encoding='utf-8') as dst:
+                    dst.writelines(line for line in src if line.strip())
+                os.remove(adopted_path)
+                print(f"Fichier de rejeu orphelin récupéré: {replay_path}")
+            except Exception as e:
+                print(f"Erreur récupération fichier de rejeu {replay_path}: {e}")
+                try:
+                    os.replace(adopted_path, replay_path)
+                except OSError:
+                    pass
+
+    def _replay_spill(self):
+        """Rejoue le fichier de déversement (appelé après un envoi réussi)"""
+        # Un fichier de rejeu par processus (plusieurs workers partagent le fichier de déversement)
+        replay_path = f"{self.spill_path}.{os.getpid()}.replay"
+        try:
+            with self._spill_file_lock():
+                if not os.path.exists(self.spill_path):
+                    return
+                os.replace(self.spill_path, replay_path)
+            with open(replay_path, encoding='utf-8') as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+        except Exception as e:
+            print(f"Erreur lecture fichier de déversement: {e}")
+            return
+
+        for start in range(0, len(rows), self.max_batch):
+            if not self.flush_fn(rows[start:start + self.max_batch]):
+                self._spill(rows[start:])
+                break
+        else:
+            print(f"{len(rows)} messages déversés rejoués vers Supabase")
+        os.remove(replay_path)
+
+    def close(self, timeout: float = 10.0):
+        """Vide le tampon avant l'arrêt du processus"""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout)
+        self.flush()
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
@@ -4,7 +4,7 @@ Point d'entrée WSGI pour Gunicorn
 import os
 from main import app, initialize_bot
 
-# Initialiser le bot au démarrage
+# Initialiser le bot au démarrage (dans chaque worker, preload_app désactivé)
 if not initialize_bot():
     raise RuntimeError("Impossible d'initialiser le bot")
 